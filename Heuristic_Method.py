@@ -2,6 +2,17 @@ import networkx as nx
 import matplotlib.pyplot as plt
 import heapq
 from collections import defaultdict
+import min_cost_flow
+import landmarks
+import fair_share
+import render
+
+#setting
+use_min_cost_flow = True  # True：最小成本流（可拆流量）；False：原本的單一路徑貪婪法
+use_fair_share = True  # 容量不夠送滿所有災戶時，改成每戶拿到相同需求比例的公平分配（不整戶放棄）
+use_landmarks = False  # 貪婪法的路徑查詢改用 ALT（A* + 地標下界），距離表存在 landmark_file，下次直接載入
+landmark_file = 'landmarks.npz'
+render_file = None  # 設成 'allocation.png' / 'allocation.svg' 就直接存檔、不開視窗（沒有螢幕的機器也能跑）
 
 # 建立有向圖
 G = nx.DiGraph()
@@ -58,33 +69,41 @@ def find_shortest_path_with_capacity(G, source, target, demand):
     return path if node == source else None
 
 # 流量分配流程
-sorted_demand_nodes = sorted(demands.items(), key=lambda x: -x[1])
-for node, demand in sorted_demand_nodes:
-    path = find_shortest_path_with_capacity(G, 'S', node, demand)
-    if path:
-        for u, v in path:
-            residual_capacity[(u, v)] -= demand
-            edge_flow[(u, v)] += demand
-    else:
-        print(f"⚠️ 找不到容量足夠的路徑送達 {node}（需求 {demand}）")
+if use_min_cost_flow:
+    # 一次處理所有災戶，路徑容量不夠時會拆成多條路徑送達
+    result = min_cost_flow.min_cost_flow(G, demands, source='S')
+    if result['unmet'] and use_fair_share:
+        result = fair_share.max_min_fair(G, demands, source='S')
+        for node, fraction in result['fraction'].items():
+            print(f"{node} 分到需求的 {fraction:.1%}")
+    for (u, v), flow in result['edge_flow'].items():
+        residual_capacity[(u, v)] -= flow
+        edge_flow[(u, v)] += flow
+    for node, missing in result['unmet'].items():
+        print(f"⚠️ 網路容量不足，{node} 尚缺 {missing:g} 單位（需求 {demands[node]}）")
+    gap = min_cost_flow.cost_gap_vs_lp(G, demands, result, source='S')
+    print(f"總成本 {result['cost']:g}，LP 最佳值 {gap['lp_objective']}，差距 {gap['gap']}")
+else:
+    sorted_demand_nodes = sorted(demands.items(), key=lambda x: -x[1])
+    if use_landmarks:
+        alt = landmarks.Landmarks.load_or_build(G, landmark_file)
+    for node, demand in sorted_demand_nodes:
+        if use_landmarks:
+            path = alt.shortest_path('S', node, demand, residual_capacity)
+        else:
+            path = find_shortest_path_with_capacity(G, 'S', node, demand)
+        if path:
+            for u, v in path:
+                residual_capacity[(u, v)] -= demand
+                edge_flow[(u, v)] += demand
+        else:
+            print(f"⚠️ 找不到容量足夠的路徑送達 {node}（需求 {demand}）")
 
 # 視覺化
-pos = nx.spring_layout(G, seed=42)
-edge_labels = {(u, v): f"{G[u][v]['capacity']}/{G[u][v]['cost']}" for u, v in G.edges()}
-edge_colors, edge_widths = [], []
-
-for (u, v) in G.edges():
-    flow = edge_flow.get((u, v), 0)
-    cap = G[u][v]['capacity']
-    usage_ratio = flow / cap if cap > 0 else 0
-    color = plt.cm.Reds(usage_ratio)
-    width = 1 + 4 * usage_ratio
-    edge_colors.append(color)
-    edge_widths.append(width)
-
-plt.figure(figsize=(10, 6))
-nx.draw(G, pos, with_labels=True, node_size=1000, node_color='lightgreen')
-nx.draw_networkx_edges(G, pos, width=edge_widths, edge_color=edge_colors)
-nx.draw_networkx_edge_labels(G, pos, edge_labels=edge_labels)
-plt.title("啟發式流量分配視覺化（紅色=壅塞，寬度=流量）")
-plt.show()
+fig = render.draw_allocation(G, edge_flow, render.layout(G), title="啟發式流量分配視覺化（紅色=壅塞，寬度=流量）",
+                             cmap='Reds', node_color='lightgreen')
+if render_file:
+    render.save(fig, render_file)
+    print(f"圖已存到 {render_file}")
+else:
+    plt.show()
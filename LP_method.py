@@ -2,6 +2,13 @@ import cvxpy as cp
 import networkx as nx
 import matplotlib.pyplot as plt
 from collections import defaultdict
+import lp_sparse
+import fair_share
+import render
+from solution_cache import SolutionCache
+
+#setting
+render_file = None  # 設成 'allocation.png' / 'allocation.svg' 就直接存檔、不開視窗（沒有螢幕的機器也能跑）
 
 # 建立圖與邊屬性
 G = nx.DiGraph()
@@ -25,64 +32,68 @@ commodities = list(demands.keys())
 edges = list(G.edges())
 nodes = list(G.nodes())
 
-# LP 變數：每個災戶對每條邊的流量
-flow_vars = {
-    (k, u, v): cp.Variable(nonneg=True, name=f"f_{k}_{u}_{v}")
-    for k in commodities for (u, v) in edges
-}
+# 先查磁碟快取（稀疏後端）：路網與需求沒變就直接讀上次的解
+sparse_result = lp_sparse.solve_sparse(G, demands, source='S', cache=SolutionCache())
+if sparse_result['objective'] is None:
+    # 總需求超過路網容量，LP 不可行：改用公平分配，每戶拿到盡量相同的需求比例
+    fair = fair_share.max_min_fair(G, demands, source='S')
+    for k, fraction in fair['fraction'].items():
+        print(f"⚠️ 容量不足，{k} 分到需求的 {fraction:.1%}（{fair['delivered'][k]:g} / {demands[k]}）")
+    flows = fair['flows']
+else:
+    print(f"稀疏後端：{sparse_result['cache']}，目標值 {sparse_result['objective']:.4f}")
+    flows = sparse_result['flows']
+
+# 新算出來的解才需要跟 cvxpy 逐變數參考模型交叉比對（O(K·N·E) 的建模也只在這時才做，快取命中時完全跳過）
+if sparse_result['cache'] == 'miss' and sparse_result['objective'] is not None:
+    # LP 變數：每個災戶對每條邊的流量
+    flow_vars = {
+        (k, u, v): cp.Variable(nonneg=True, name=f"f_{k}_{u}_{v}")
+        for k in commodities for (u, v) in edges
+    }
 
-# 限制條件
-constraints = []
+    # 限制條件
+    constraints = []
 
-# 邊容量限制：總流量 ≤ 邊容量
-for (u, v) in edges:
-    total_flow = cp.sum([flow_vars[k, u, v] for k in commodities])
-    constraints.append(total_flow <= G[u][v]['capacity'])
+    # 邊容量限制：總流量 ≤ 邊容量
+    for (u, v) in edges:
+        total_flow = cp.sum([flow_vars[k, u, v] for k in commodities])
+        constraints.append(total_flow <= G[u][v]['capacity'])
 
-# 每個節點滿足流量守恆
-for k in commodities:
-    for n in nodes:
-        inflow = cp.sum([flow_vars[k, u, n] for (u, v) in edges if v == n])
-        outflow = cp.sum([flow_vars[k, n, v] for (u, v) in edges if u == n])
-        if n == 'S':
-            constraints.append(outflow - inflow == demands[k])
-        elif n == k:
-            constraints.append(inflow - outflow == demands[k])
-        else:
-            constraints.append(inflow == outflow)
+    # 每個節點滿足流量守恆
+    for k in commodities:
+        for n in nodes:
+            inflow = cp.sum([flow_vars[k, u, n] for (u, v) in edges if v == n])
+            outflow = cp.sum([flow_vars[k, n, v] for (u, v) in edges if u == n])
+            if n == 'S':
+                constraints.append(outflow - inflow == demands[k])
+            elif n == k:
+                constraints.append(inflow - outflow == demands[k])
+            else:
+                constraints.append(inflow == outflow)
 
-# 目標：總成本最小
-objective = cp.Minimize(cp.sum([
-    G[u][v]['cost'] * flow_vars[k, u, v]
-    for (k, u, v) in flow_vars
-]))
+    # 目標：總成本最小
+    objective = cp.Minimize(cp.sum([
+        G[u][v]['cost'] * flow_vars[k, u, v]
+        for (k, u, v) in flow_vars
+    ]))
 
-# 解問題
-prob = cp.Problem(objective, constraints)
-prob.solve()
+    prob = cp.Problem(objective, constraints)
+    prob.solve()
+    print(f"cvxpy 目標值：{prob.value:.4f}")
+    if abs(prob.value - sparse_result['objective']) > 1e-4 * max(1.0, abs(prob.value)):
+        print("⚠️ 稀疏後端與 cvxpy 參考解不一致")
 
 # 彙整結果
 edge_flow_total = defaultdict(float)
-for (k, u, v), var in flow_vars.items():
-    edge_flow_total[(u, v)] += var.value
+for (k, u, v), flow in flows.items():
+    edge_flow_total[(u, v)] += flow
 
 # 🎨 視覺化結果
-pos = nx.spring_layout(G, seed=42)
-edge_labels = {(u, v): f"{G[u][v]['capacity']}/{G[u][v]['cost']}" for u, v in G.edges()}
-edge_colors, edge_widths = [], []
-
-for (u, v) in G.edges():
-    flow = edge_flow_total.get((u, v), 0)
-    cap = G[u][v]['capacity']
-    usage_ratio = flow / cap if cap > 0 else 0
-    color = plt.cm.Blues(usage_ratio)
-    width = 1 + 4 * usage_ratio
-    edge_colors.append(color)
-    edge_widths.append(width)
-
-plt.figure(figsize=(10, 6))
-nx.draw(G, pos, with_labels=True, node_size=1000, node_color='lightblue')
-nx.draw_networkx_edges(G, pos, width=edge_widths, edge_color=edge_colors)
-nx.draw_networkx_edge_labels(G, pos, edge_labels=edge_labels)
-plt.title("LP 最佳化後的流量分配（藍色=壅塞，寬度=流量）")
-plt.show()
+fig = render.draw_allocation(G, edge_flow_total, render.layout(G), title="LP 最佳化後的流量分配（藍色=壅塞，寬度=流量）",
+                             cmap='Blues', node_color='lightblue')
+if render_file:
+    render.save(fig, render_file)
+    print(f"圖已存到 {render_file}")
+else:
+    plt.show()
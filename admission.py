@@ -0,0 +1,83 @@
+# 准入控制（run_server_v1.py、async_server.py 共用）：大量報到或連線洪流時，先把超量的連線 / 請求擋在門口，
+# 明確回「忙碌中」讓 client 稍後再試，而不是收下來之後把執行緒、記憶體耗光、所有人一起逾時。
+#   - 每個來源 IP 同時最多幾條連線
+#   - 每個來源 IP 每秒最多幾個請求（token bucket：平均 rate、瞬間最多 burst）
+# 注意：同一個避難所的災戶可能都在同一個 NAT 後面（同一個 IP），上限不要設得太低。
+import json
+import threading
+import time
+
+BUSY = json.dumps({'status': 'busy', 'error': '伺服器忙碌中，請稍後再試', 'retry_after': 1},
+                  ensure_ascii=False).encode()
+RATE_LIMITED = json.dumps({'status': 'busy', 'error': '請求太頻繁，請稍後再試', 'retry_after': 1},
+                          ensure_ascii=False).encode()
+TOO_MANY_FROM_IP = json.dumps({'status': 'busy', 'error': '同一個位址的連線數已達上限，請稍後再試', 'retry_after': 1},
+                              ensure_ascii=False).encode()
+
+
+class IPLimiter:
+    def __init__(self, max_connections=256, rate=1000.0, burst=2000):
+        self.max_connections = max_connections   # <= 0 = 不限制
+        self.rate = rate                         # <= 0 = 不限制
+        self.burst = burst
+        self.connections = {}                    # ip -> 目前連線數
+        self.buckets = {}                        # ip -> [剩下的 token, 上次補充的時間]
+        self.lock = threading.Lock()             # 多執行緒的 server 會同時呼叫 allow()
+
+    def connect(self, ip):
+        with self.lock:
+            count = self.connections.get(ip, 0)
+            if 0 < self.max_connections <= count:
+                return False
+            self.connections[ip] = count + 1
+            return True
+
+    def disconnect(self, ip):
+        with self.lock:
+            count = self.connections.get(ip, 0) - 1
+            if count > 0:
+                self.connections[ip] = count
+            else:
+                self.connections.pop(ip, None)
+
+    # 這個 IP 現在可以再送一個請求嗎（會扣掉一個 token）
+    def allow(self, ip, now=None):
+        if self.rate <= 0:
+            return True
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            bucket = self.buckets.get(ip)
+            if bucket is None:
+                bucket = self.buckets[ip] = [float(self.burst), now]
+            tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            if tokens < 1:
+                bucket[0] = tokens
+                return False
+            bucket[0] = tokens - 1
+            return True
+
+    # 已經補滿的 bucket 跟新的沒有差別，丟掉（偽造來源 IP 的洪流不會讓這個 dict 一直長大）
+    def prune(self, now=None):
+        if self.rate <= 0:
+            return
+        now = time.monotonic() if now is None else now
+        full = self.burst / self.rate
+        with self.lock:
+            for ip in [ip for ip, (_, last) in self.buckets.items() if now - last > full]:
+                del self.buckets[ip]
+
+
+if __name__ == '__main__':
+    limiter = IPLimiter(max_connections=2, rate=10, burst=5)
+    assert limiter.connect('10.0.0.1') and limiter.connect('10.0.0.1') and not limiter.connect('10.0.0.1')
+    assert limiter.connect('10.0.0.2')
+    limiter.disconnect('10.0.0.1')
+    assert limiter.connect('10.0.0.1')
+    allowed = sum(limiter.allow('10.0.0.1', now=100.0) for _ in range(20))
+    assert allowed == 5                                  # 一開始最多 burst 個
+    assert limiter.allow('10.0.0.1', now=100.15)         # 0.15 s 補回 1.5 個
+    assert not limiter.allow('10.0.0.1', now=100.15)
+    limiter.prune(now=200.0)
+    assert not limiter.buckets
+    print("IPLimiter OK")
@@ -0,0 +1,172 @@
+# 常駐記憶體的配置模型：需求與邊容量改成 cvxpy Parameter
+# 災情中需求每幾分鐘就會變，原本只能重開 server、整個 LP 重新建模。
+# 這裡問題只建一次（DPP 形式，cvxpy 會快取 canonicalization），
+# 之後更新需求/容量只改 Parameter 的值，再用 warm start 重解。
+# 給 cache（solution_cache.SolutionCache）時，相同的需求/容量直接讀磁碟上的解，
+# 只有容量不同時先用對偶價格檢查舊解是否仍是最佳解，都不行才呼叫 solver（並用舊解當起始值）。
+import time
+import numpy as np
+import cvxpy as cp
+import lp_sparse
+
+
+class AllocationModel:
+    def __init__(self, G, demands, source='S', solver=None, cache=None):
+        self.G = G
+        self.source = source
+        self.solver = solver
+        self.cache = cache
+        nodes, index, edges, tails, heads, capacity, cost = lp_sparse.edge_arrays(G)
+        self.nodes = nodes
+        self.index = index
+        self.edges = edges
+        self.edge_index = {e: i for i, e in enumerate(edges)}
+        self.commodities = list(demands.keys())
+        self._fingerprint_arrays = (nodes, tails, heads, cost)
+        self.comm_index = {k: i for i, k in enumerate(self.commodities)}
+
+        t0 = time.perf_counter()
+        n_nodes, n_comm = len(nodes), len(self.commodities)
+        sinks = np.array([index[k] for k in self.commodities], dtype=np.int64)
+        # sign[:, k]：來源 +1、災戶 -1，乘上需求就是供需向量
+        sign = lp_sparse.supply_matrix(n_nodes, index[source], sinks, np.ones(n_comm))
+        inc = lp_sparse.incidence_matrix(n_nodes, tails, heads)
+
+        self.demand = cp.Parameter(n_comm, nonneg=True, value=[float(demands[k]) for k in self.commodities])
+        self.capacity = cp.Parameter(len(edges), nonneg=True, value=capacity)
+        self.X = cp.Variable((len(edges), n_comm), nonneg=True)
+        constraints = [
+            cp.sum(self.X, axis=1) <= self.capacity,
+            inc @ self.X == sign @ cp.diag(self.demand),
+        ]
+        self.prob = cp.Problem(cp.Minimize(cp.sum(cost @ self.X)), constraints)
+        self.build_time = time.perf_counter() - t0
+        self.history = []
+
+    def demands(self):
+        return {k: float(self.demand.value[i]) for i, k in enumerate(self.commodities)}
+
+    def solve(self):
+        t0 = time.perf_counter()
+        cache_status = None
+        if self.cache is not None:
+            cache_status, key, structure_key, entry = self._load_cached()
+            if cache_status in ('hit', 'reused'):
+                stats = {
+                    'status': cp.OPTIMAL,
+                    'objective': entry['objective'],
+                    'total_time': time.perf_counter() - t0,
+                    'compile_time': 0.0,
+                    'solver_time': 0.0,
+                    'cache': cache_status,
+                }
+                self.history.append(stats)
+                return stats
+        self.prob.solve(solver=self.solver, warm_start=True)
+        elapsed = time.perf_counter() - t0
+        stats = {
+            'status': self.prob.status,
+            'objective': float(self.prob.value) if self.prob.status == cp.OPTIMAL else None,
+            'total_time': elapsed,
+            'compile_time': self.prob.compilation_time,
+            'solver_time': self.prob.solver_stats.solve_time,
+            'cache': cache_status,
+        }
+        if self.cache is not None and self.prob.status == cp.OPTIMAL:
+            # 存成跟 lp_sparse 一樣的格式：x[k*E + e]、非負容量價格、linprog 正負號的節點位勢
+            capacity_dual, conservation_dual = (c.dual_value for c in self.prob.constraints)
+            self.cache.put(key, structure_key, self.X.value.T.ravel(), capacity_dual,
+                           -conservation_dual.T.ravel(), self.prob.value,
+                           self.capacity.value, self.demand.value)
+        self.history.append(stats)
+        return stats
+
+    # 查快取：回傳 (狀態, key, 結構 key, 快取項目)；命中時把解填進 X.value
+    def _load_cached(self):
+        import solution_cache
+        nodes, tails, heads, cost = self._fingerprint_arrays
+        capacity, amounts = np.asarray(self.capacity.value), np.asarray(self.demand.value)
+        key, structure_key = solution_cache.fingerprint(
+            nodes, tails, heads, capacity, cost, self.source, self.commodities, amounts)
+        entry = self.cache.get(key)
+        status = 'hit'
+        if entry is None:
+            entry = self.cache.latest(structure_key)
+            if entry is None:
+                return 'miss', key, structure_key, None
+            if not solution_cache.still_optimal(entry, capacity, amounts):
+                # 不是最佳解也可以當 solver 的起始值（支援 warm start 的 solver 才會用到）
+                if self.X.value is None:
+                    self.X.value = entry['x'].reshape(len(self.commodities), len(self.edges)).T
+                return 'miss', key, structure_key, None
+            status = 'reused'
+            self.cache.put(key, structure_key, entry['x'], entry['capacity_price'], entry['potential'],
+                           entry['objective'], capacity, amounts)
+        self.X.value = entry['x'].reshape(len(self.commodities), len(self.edges)).T
+        return status, key, structure_key, entry
+
+    # 更新 API：demands={'H1': 10}、capacities={('S', 'A'): 0}，只改有給的項目
+    # 先檢查所有鍵再一起寫入：有任何一項不認得就整個更新都不套用
+    def update(self, demands=None, capacities=None):
+        demands = demands or {}
+        capacities = capacities or {}
+        for k in demands:
+            if k not in self.comm_index:
+                raise KeyError(f"未知災戶：{k}")
+        for u, v in capacities:
+            if (u, v) not in self.edge_index:
+                raise KeyError(f"未知道路：{u}->{v}")
+        demand = np.array(self.demand.value, dtype=np.float64)
+        for k, d in demands.items():
+            demand[self.comm_index[k]] = d
+        capacity = np.array(self.capacity.value, dtype=np.float64)
+        for (u, v), c in capacities.items():
+            capacity[self.edge_index[(u, v)]] = c
+        if np.any(demand < 0) or np.any(capacity < 0):
+            raise ValueError("需求與容量不能是負數")
+        if demands:
+            self.demand.value = demand
+        if capacities:
+            self.capacity.value = capacity
+        return self.solve()
+
+    # 目前解的 {(k, u, v): flow}，格式與 lp_sparse 相同
+    def flows(self):
+        if self.X.value is None:
+            return {}
+        return lp_sparse.unpack_flows(self.X.value.T, self.commodities, self.edges)
+
+
+if __name__ == '__main__':
+    import networkx as nx
+    G = nx.DiGraph()
+    G.add_edges_from([
+        ('S', 'A', {'capacity': 15, 'cost': 5}),
+        ('S', 'C', {'capacity': 10, 'cost': 3}),
+        ('A', 'B', {'capacity': 10, 'cost': 2}),
+        ('C', 'D', {'capacity': 10, 'cost': 4}),
+        ('B', 'H1', {'capacity': 10, 'cost': 1}),
+        ('D', 'H2', {'capacity': 10, 'cost': 1}),
+        ('A', 'D', {'capacity': 5, 'cost': 3}),
+        ('C', 'B', {'capacity': 5, 'cost': 2}),
+    ])
+    model = AllocationModel(G, {'H1': 8, 'H2': 7})
+    first = model.solve()
+    print(f"第一次求解（含 canonicalization）：{first['total_time']*1000:.1f} ms，目標值 {first['objective']:.2f}")
+
+    updates = [
+        {'demands': {'H1': 9}},
+        {'demands': {'H2': 5}},
+        {'capacities': {('A', 'D'): 2}},
+        {'demands': {'H1': 6, 'H2': 8}, 'capacities': {('A', 'D'): 5}},
+    ]
+    for u in updates:
+        stats = model.update(**u)
+        print(f"更新 {u} → {stats['status']}，重解 {stats['total_time']*1000:.1f} ms"
+              f"（編譯 {stats['compile_time']*1000:.1f} ms），目標值 {stats['objective']}")
+
+    # 對照：每次都整個重建 LP
+    t0 = time.perf_counter()
+    rebuilt = AllocationModel(G, model.demands())
+    rebuilt.solve()
+    print(f"完整重建 + 求解：{(time.perf_counter() - t0)*1000:.1f} ms")
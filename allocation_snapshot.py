@@ -0,0 +1,243 @@
+# 指揮中心的配置快照：求解完成時把每戶的回覆先編成 JSON bytes，查詢時只做查表和 bytes 串接
+#   - 單戶查詢：直接回傳那一戶的 bytes
+#   - 批次查詢（一串災戶 ID，或 ID 前綴 = 一個區域）：把每戶事先編好的 "ID": {...} 片段接起來，
+#     一萬戶的區域也只要一次來回，不必重新 json.dumps 一萬筆資料
+# 快照建好之後就不再修改；重解時建一個新的快照（版本號 + 1），server 只換掉「目前快照」這一個參考，
+# 讀取端先拿到參考再查表，不需要任何 lock，也不會看到新舊混在一起的結果。
+# 每個回覆最前面都有 "version"：client 看到版本號變了，就知道之前拿到的配置已經過期、該重新查詢。
+# 訂閱推播 { "push": {...}, "removed": [...], "version": 3 } 把 "push" 放最前面，client 看開頭就能跟一般回覆分開。
+# 二進位編碼（binary_codec.py）的回覆等第一次有 binary 連線查詢時才編，只用 JSON 的部署不必多花記憶體。
+# save() 把快照寫成一個檔案，MappedSnapshot 用 mmap 直接讀：多個 worker 行程共用同一份（OS page cache），
+# 每個 worker 自己只多一份「名稱 -> 第幾筆」的索引。
+import bisect
+import json
+import mmap
+import os
+import struct
+import tempfile
+import binary_codec
+
+PREFIX_CACHE_SIZE = 256   # 同一個快照最多記住幾個前綴查詢的結果（區域查詢通常一直是那幾個）
+
+# 快照檔：header（magic + 版本號 + 戶數）+ offset 表（uint64，本機位元組順序）+ 資料
+# 每戶依名稱排序，各有 SEGMENTS 段：名稱、JSON 回覆、JSON 批次片段、binary 回覆、binary 批次片段
+MAGIC = b'ALSNAP02'
+_FILE_HEADER = struct.Struct('=8sQI')
+SEGMENTS = 5
+
+
+def encode(obj):
+    return json.dumps(obj, ensure_ascii=False).encode()
+
+
+# 在 JSON 物件的回覆最前面加上 "version"：直接接 bytes，不必解開重編
+def stamp(reply, version):
+    return b'{"version": %d, ' % version + reply[1:] if reply != b'{}' else b'{"version": %d}' % version
+
+
+class Snapshot:
+    def __init__(self, allocation, version=1):
+        self.allocation = allocation
+        self.version = version
+        self.names = sorted(allocation)
+        bodies = {name: encode(entry) for name, entry in allocation.items()}
+        self.replies = {name: stamp(body, version) for name, body in bodies.items()}
+        # 批次回覆裡的一個欄位："H1": {...}（版本號放在整個批次回覆的最前面，片段裡不重複）
+        self.fragments = {name: encode(name) + b': ' + body for name, body in bodies.items()}
+        self._binary = None
+        self._prefix_cache = {}
+
+    def __len__(self):
+        return len(self.names)
+
+    def _tables(self, binary):
+        return self._binary_tables() if binary else (self.replies, self.fragments)
+
+    # 二進位版的 (單戶回覆, 批次片段)；名稱超過 binary_codec.MAX_STR 的災戶編不進去，只能用 JSON 查
+    def _binary_tables(self):
+        if self._binary is None:
+            packed = {name: binary_codec.pack_allocation(entry) for name, entry in self.allocation.items()
+                      if binary_codec.fits(name)}
+            head = binary_codec.pack_head(binary_codec.REPLY_ALLOCATION, self.version)
+            replies = {name: head + data for name, data in packed.items()}
+            fragments = {name: binary_codec.pack_str(name) + data for name, data in packed.items()}
+            self._binary = (replies, fragments)
+        return self._binary
+
+    def get(self, name, binary=False):
+        return self._tables(binary)[0].get(name)
+
+    # 批次片段（不含版本號）：兩個快照裡同一戶的片段一樣，就代表這戶的配置沒有變
+    def fragment(self, name, binary=False):
+        return self._tables(binary)[1].get(name)
+
+    # 訂閱推播：names 裡還在配置中的災戶送新的配置，不在的列在 "removed"
+    def push(self, names, binary=False):
+        fragments = self._tables(binary)[1]
+        parts, removed = [], []
+        for name in names:
+            fragment = fragments.get(name)
+            if fragment is None:
+                removed.append(name)
+            else:
+                parts.append(fragment)
+        if binary:
+            return binary_codec.pack_batch(parts, removed, self.version, binary_codec.REPLY_PUSH)
+        return b'{"push": {' + b', '.join(parts) + b'}, "removed": ' + encode(removed) + \
+            b', "version": %d}' % self.version
+
+    # 依 ID 清單查詢：回傳 {"allocations": {...}, "unknown": [...]}，重複的 ID 只回一次
+    def batch(self, names, binary=False):
+        fragments = self._tables(binary)[1]
+        parts, unknown, seen = [], [], set()
+        for name in names:
+            fragment = fragments.get(name) if isinstance(name, str) else None
+            if fragment is None:
+                unknown.append(name)
+            elif name not in seen:
+                seen.add(name)
+                parts.append(fragment)
+        return _wrap(parts, unknown, binary, self.version)
+
+    # 依 ID 前綴查詢（例如 "D03-" = 第 3 區所有災戶）：名字排好序，前綴對應到連續的一段
+    def prefix(self, prefix, binary=False):
+        reply = self._prefix_cache.get((prefix, binary))
+        if reply is None:
+            fragments = self._tables(binary)[1]
+            lo = bisect.bisect_left(self.names, prefix)
+            hi = bisect.bisect_left(self.names, prefix + '\U0010ffff')
+            parts = [fragments.get(name) for name in self.names[lo:hi]]
+            reply = _wrap([part for part in parts if part is not None], [], binary, self.version)
+            if len(self._prefix_cache) < PREFIX_CACHE_SIZE:
+                self._prefix_cache[(prefix, binary)] = reply
+        return reply
+
+    # 寫成快照檔（先寫暫存檔再 rename，讀的一方不會看到寫到一半的檔案）
+    def save(self, path):
+        binary_replies, binary_fragments = self._binary_tables()
+        segments = []
+        for name in self.names:
+            # 沒有二進位版的災戶存空的一段，MappedSnapshot 讀到空的就當作查不到
+            segments += [name.encode(), self.replies[name], self.fragments[name],
+                         binary_replies.get(name, b''), binary_fragments.get(name, b'')]
+        offsets = [0]
+        for segment in segments:
+            offsets.append(offsets[-1] + len(segment))
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix='.snapshot-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(_FILE_HEADER.pack(MAGIC, self.version, len(self.names)))
+                f.write(struct.pack(f'={len(offsets)}Q', *offsets))
+                f.writelines(segments)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+
+# 快照檔的 mmap 版本：介面跟 Snapshot 一樣，資料留在共用的 page cache 裡，查詢時才切出需要的 bytes
+class MappedSnapshot(Snapshot):
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.version, count = _FILE_HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise ValueError(f'不是配置快照檔（或版本不符）：{path}')
+        start = _FILE_HEADER.size
+        table_end = start + 8 * (SEGMENTS * count + 1)
+        # offset 表直接指向 mmap（不複製成 Python list）；offset 從資料區開頭算起
+        self._offsets = memoryview(self._map)[start:table_end].cast('Q')
+        self._base = table_end
+        self.names = [self._segment(SEGMENTS * i).decode() for i in range(count)]
+        self._index = {name: i for i, name in enumerate(self.names)}
+        self._prefix_cache = {}
+        self._segments = [_Segments(self._map, self._offsets, self._base, self._index, j) for j in range(SEGMENTS)]
+
+    def _segment(self, k):
+        return _slice(self._map, self._offsets, self._base, k)
+
+    def _tables(self, binary):
+        return (self._segments[3], self._segments[4]) if binary else (self._segments[1], self._segments[2])
+
+    def close(self):
+        self._offsets.release()
+        self._map.close()
+
+
+def _slice(data, offsets, base, k):
+    return data[base + offsets[k]:base + offsets[k + 1]]
+
+
+# 不反過來參考 MappedSnapshot（避免循環參考）：快照沒人用時馬上就能 unmap，不必等 GC
+class _Segments:
+    def __init__(self, data, offsets, base, index, j):
+        self.data = data
+        self.offsets = offsets
+        self.base = base
+        self.index = index
+        self.j = j
+
+    def get(self, name, default=None):
+        i = self.index.get(name)
+        if i is None:
+            return default
+        return _slice(self.data, self.offsets, self.base, SEGMENTS * i + self.j) or default
+
+    def __getitem__(self, name):
+        value = self.get(name)
+        if value is None:
+            raise KeyError(name)
+        return value
+
+
+def _wrap(parts, unknown, binary, version):
+    if binary:
+        return binary_codec.pack_batch(parts, unknown, version)
+    return b'{"version": %d, "allocations": {' % version + b', '.join(parts) + b'}, "unknown": ' + \
+        encode(unknown) + b'}'
+
+
+if __name__ == '__main__':
+    import time
+
+    # 50 區、每區 10000 戶
+    allocation = {f'D{d:02d}-{h:05d}': {'resource': 5.0, 'routes': [{'path': ['S', f'D{d:02d}', f'D{d:02d}-{h:05d}'],
+                                                                     'amount': 5.0}]}
+                  for d in range(50) for h in range(10000)}
+    t0 = time.perf_counter()
+    snapshot = Snapshot(allocation, version=7)
+    print(f"建立快照（{len(snapshot)} 戶）：{time.perf_counter() - t0:.2f} s")
+
+    t0 = time.perf_counter()
+    reply = snapshot.prefix('D07-')
+    first = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    snapshot.prefix('D07-')
+    again = time.perf_counter() - t0
+    decoded = json.loads(reply)
+    assert decoded['version'] == 7 and len(decoded['allocations']) == 10000 and decoded['allocations']['D07-00042'] == allocation['D07-00042']
+    print(f"區域查詢 10000 戶（{len(reply) / 2**20:.1f} MiB）：第一次 {first*1000:.1f} ms，再查一次 {again*1000:.3f} ms")
+
+    names = [f'D12-{h:05d}' for h in range(10000)] + ['不存在']
+    t0 = time.perf_counter()
+    reply = snapshot.batch(names)
+    batch_time = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    json.dumps({'allocations': {n: allocation[n] for n in names if n in allocation}, 'unknown': ['不存在']})
+    dumps_time = time.perf_counter() - t0
+    assert json.loads(reply)['unknown'] == ['不存在']
+    print(f"ID 清單查詢 10000 戶：{batch_time*1000:.1f} ms（每次 json.dumps 要 {dumps_time*1000:.1f} ms）")
+
+    path = os.path.join(tempfile.gettempdir(), 'allocation_snapshot_demo.bin')
+    t0 = time.perf_counter()
+    snapshot.save(path)
+    saved = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    mapped = MappedSnapshot(path)
+    opened = time.perf_counter() - t0
+    assert mapped.version == 7 and mapped.get('D07-00042') == snapshot.get('D07-00042')
+    assert mapped.prefix('D07-') == snapshot.prefix('D07-') and mapped.batch(names, True) == snapshot.batch(names, True)
+    print(f"快照檔 {os.path.getsize(path) / 2**20:.0f} MiB：寫入 {saved:.2f} s，mmap 開啟 + 建索引 {opened:.2f} s")
+    mapped.close()
+    os.unlink(path)
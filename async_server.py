@@ -0,0 +1,587 @@
+# asyncio 版指揮中心：協定與 run_server_v1.py 相同（client 傳 { "name": "H1" }，server 回 JSON）
+# 訊息用 protocol.py 的長度前綴框架，一條連線可以連續查詢（keep-alive / pipelining）；
+# 舊的「送一個 JSON、收一個 JSON 就關閉」client 一樣能用（第一個 byte 是 '{' 就走舊協定）。
+# run_server_v1.py 每條連線開一個 OS 執行緒，大量災戶同時報到時會被執行緒數量與 stack 記憶體卡住；
+# 這裡全部連線都在同一個 event loop 上，一條連線只佔一個 coroutine 和讀寫緩衝區。
+#   - 配置結果在記憶體裡是「災戶 -> 已經編好的回覆 bytes」（allocation_snapshot.py），查詢不必每次 json.dumps
+#   - 批次查詢：{ "names": ["H1", "H2"] } 或 { "prefix": "D03-" }，
+#     回傳 { "allocations": { "H1": {...}, ... }, "unknown": [...] }，整個區域一次來回
+#   - 每個回覆都帶 "version"（配置快照的版本號，每次重解成功 + 1；還沒算完是 0），版本變了就代表配置更新過
+#   - 訂閱：{ "subscribe": { "names": ["H1"] } } 先回目前的配置（同批次查詢），之後這條連線保持開著，
+#     重解後只有配置真的變了的災戶才推播 { "push": { "H1": {...} }, "removed": [], "version": 3 }，client 不必輪詢；
+#     { "unsubscribe": { "names": [...] } }（不給 names = 全部）取消，回 { "subscribed": 剩下幾戶 }
+#   - 編碼協商：連線後先送 { "hello": { "encoding": "binary" } } 就改用 binary_codec.py 的 struct 格式，預設 JSON
+#   - 求解 / 重解放到 executor 執行緒，不會卡住 event loop
+#   - 同時連線數上限、讀取 / 寫出 / 閒置逾時、單一請求大小上限都可以用參數調整
+#   - 每個來源 IP 的連線數、每秒請求數上限（admission.py）；超量時回 { "status": "busy", "error": ..., "retry_after": 1 }
+#   - 執行期指標（metrics.py）：http://127.0.0.1:9091/metrics，Prometheus text format；--metrics-port 0 關閉
+#
+# 範例：
+#   python async_server.py --max-connections 15000 --read-timeout 10
+#   python async_server.py --synthetic 500    # 500 戶的合成路網（壓力測試用）
+import argparse
+import asyncio
+import json
+import socket
+import threading
+import time
+import admission
+import allocation_snapshot
+import binary_codec
+import flow_decomposition
+import metrics
+import protocol
+
+HOST = '0.0.0.0'
+PORT = 9000
+STARTED = time.perf_counter()
+
+# 路網與需求（與 run_server_v1.py 相同）
+edges = [
+    ('S', 'A', {'capacity': 15, 'cost': 5}),
+    ('S', 'C', {'capacity': 10, 'cost': 3}),
+    ('A', 'B', {'capacity': 10, 'cost': 2}),
+    ('C', 'D', {'capacity': 10, 'cost': 4}),
+    ('B', 'H1', {'capacity': 10, 'cost': 1}),
+    ('D', 'H2', {'capacity': 10, 'cost': 1}),
+    ('A', 'D', {'capacity': 5, 'cost': 3}),
+    ('C', 'B', {'capacity': 5, 'cost': 2}),
+]
+demands = {'H1': 8, 'H2': 7}
+
+# 設定（main() 依命令列參數覆寫）
+settings = {
+    'max_connections': 10000,   # 同時連線數上限，超過的連線直接回忙碌中並關閉
+    'per_ip_connections': 256,  # 同一個來源 IP 同時最多幾條連線（同一個避難所的災戶可能共用一個 NAT 出口）
+    'per_ip_rate': 1000.0,      # 同一個來源 IP 平均每秒最多幾個請求（瞬間最多兩倍），0 = 不限制
+    'read_timeout': 10.0,       # 等 client 送完請求的最長秒數（慢速 client 不會一直佔著連線）
+    'idle_timeout': 60.0,       # keep-alive 連線兩個請求之間最多閒置幾秒
+    'write_timeout': 10.0,      # 等 client 收完回覆的最長秒數
+    'max_request': 1024 * 1024, # 單一請求的最大 bytes（一萬戶的 ID 清單大約 100 KiB）
+    'verbose': False,           # 每條連線都印 log（上萬條連線時印 log 本身就是瓶頸）
+    'synthetic': 0,             # > 0：改用 network_generator 產生這麼多戶的路網（最小成本流求解，不支援更新）
+    'max_subscriptions': 10000, # 一條連線最多訂閱幾戶（區域儀表板可以一次訂閱整區）
+    'max_push_buffer': 1024 * 1024,  # 推播在傳送緩衝區積了這麼多 bytes 還沒被收走，就斷掉這個訂閱者
+}
+
+# 背景求解完成前 snapshot 是 None；完成後是 allocation_snapshot.Snapshot（不可變），重解時建新的、換掉這個參考
+# 讀取端只做一次 current = snapshot，之後都查這個快照：不用 lock，也不會看到新舊混在一起的配置
+model = None
+snapshot = None
+startup_error = None
+model_lock = threading.Lock()
+active = 0
+limiter = admission.IPLimiter()   # serve() 依 settings 重建
+# 更新請求的處理方式：None = 在本行程重解；prefork 的 worker 設成「轉給 supervisor」的 coroutine
+updater = None
+# 訂閱：災戶 -> 訂閱這戶的 Subscriber；snapshot 換掉之後 notify() 叫醒 fan_out()
+subscribers = {}
+snapshot_changed = None
+FANOUT_BATCH = 256       # 推播每寫給這麼多個訂閱者就讓出 event loop 一次，新的查詢不必等整輪推播做完
+
+
+encode = protocol.encode
+
+PENDING = encode({'status': 'pending', 'error': '配置計算中，請稍後再試（allocation pending）'})
+UNKNOWN = encode({'error': '未知災戶'})
+BAD_REQUEST = encode({'error': '請求格式錯誤'})
+TOO_LARGE = encode({'error': '請求太大'})
+NO_UPDATE = encode({'error': '合成路網不支援更新'})
+JSON_TAG = bytes([binary_codec.REPLY_JSON])
+
+# 熱路徑上用到的指標先取出來，每個請求只剩加法和一次 bisect
+ACCEPT, PARSE, LOOKUP, SEND = (metrics.STAGE.labels(stage) for stage in ('accept', 'parse', 'lookup', 'send'))
+REQUESTS = {kind: metrics.REQUESTS.labels(kind)
+            for kind in ('name', 'names', 'prefix', 'update', 'subscribe', 'hello', 'invalid')}
+ERRORS = {kind: metrics.ERRORS.labels(kind)
+          for kind in ('bad_request', 'unknown_household', 'pending', 'too_large', 'update_failed',
+                       'timeout', 'connection')}
+SHED = {reason: metrics.SHED.labels(reason) for reason in ('max_connections', 'per_ip_connections', 'rate_limited')}
+
+
+# 每戶的回覆事先編好（含版本號）；查詢時直接把 bytes 寫出去。呼叫端要拿著 model_lock，版本號才不會重複
+def build_snapshot():
+    t0 = time.perf_counter()
+    allocation = flow_decomposition.allocation_from_flows(model.flows(), model.commodities, source='S')
+    built = allocation_snapshot.Snapshot(allocation, version=current_version() + 1)
+    metrics.SNAPSHOT_BUILD.observe(time.perf_counter() - t0)
+    return built
+
+
+def current_version():
+    current = snapshot
+    return current.version if current is not None else 0
+
+
+# 壓力測試用的合成路網：格狀路網、每 50 戶一個物資點，用最小成本流求解
+def solve_synthetic(n_households):
+    import min_cost_flow
+    import network_generator
+    source = network_generator.SOURCE
+    graph, synthetic_demands = network_generator.generate('grid', n_nodes=5 * n_households, n_shelters=n_households,
+                                                          n_sources=max(1, n_households // 50), mean_demand=3, seed=0)
+    result = min_cost_flow.min_cost_flow(graph, synthetic_demands, source=source)
+    metrics.LP_SOLVE.labels('initial', 'none').observe(result['time'])
+    t0 = time.perf_counter()
+    flows = flow_decomposition.split_aggregate(result['edge_flow'], result['delivered'], source)
+    built = allocation_snapshot.Snapshot(flow_decomposition.allocation_from_flows(flows, list(synthetic_demands), source))
+    metrics.SNAPSHOT_BUILD.observe(time.perf_counter() - t0)
+    return built
+
+
+# 在 executor 執行緒裡：載入求解器、建模、首次求解
+def solve_initial():
+    global model, snapshot, startup_error
+    t0 = time.perf_counter()
+    if settings['synthetic']:
+        snapshot = solve_synthetic(settings['synthetic'])
+        print(f"[Server] 合成路網 {len(snapshot)} 戶求解完成：{(time.perf_counter() - t0)*1000:.0f} ms")
+        return
+    try:
+        import networkx as nx
+        from allocation_model import AllocationModel
+        from solution_cache import SolutionCache
+        G = nx.DiGraph()
+        G.add_edges_from([(u, v, attr) for u, v, attr in edges])
+        with model_lock:
+            model = AllocationModel(G, demands, source='S', cache=SolutionCache())
+            metrics.LP_BUILD.observe(model.build_time)
+            stats = model.solve()
+            metrics.LP_SOLVE.labels('initial', str(stats['cache'])).observe(stats['total_time'])
+            snapshot = build_snapshot()
+    except Exception as e:
+        startup_error = encode({'error': f'配置計算失敗：{e}'})
+        print(f"[Server] 配置計算失敗：{e}")
+        return
+    print(f"[Server] 首次求解完成：{(time.perf_counter() - t0)*1000:.0f} ms（快取 {stats['cache']}），"
+          f"啟動後 {(time.perf_counter() - STARTED)*1000:.0f} ms 可查詢")
+
+
+# 在 executor 執行緒裡套用更新並重解；建好新的快照才換掉參考，event loop 不會看到一半的結果
+def apply_update(update):
+    global snapshot
+    capacities = {(u, v): c for u, v, c in update.get('capacities', [])}
+    with model_lock:
+        stats = model.update(demands=update.get('demands'), capacities=capacities)
+        metrics.LP_SOLVE.labels('update', str(stats['cache'])).observe(stats['total_time'])
+        if stats['status'] == 'optimal':
+            snapshot = build_snapshot()
+    print(f"[Server] 重解完成：{stats['status']}，耗時 {stats['total_time']*1000:.1f} ms")
+    return encode({
+        'version': current_version(),
+        'status': stats['status'],
+        'objective': stats['objective'],
+        'resolve_ms': round(stats['total_time'] * 1000, 3),
+    })
+
+
+# 舊協定：一直讀到內容是完整的 JSON（訊息可能被拆成好幾段）或 client 關閉寫入端
+async def read_request(reader, buf):
+    while True:
+        try:
+            return json.loads(buf)
+        except ValueError:
+            pass
+        chunk = await reader.read(4096)
+        if not chunk:
+            return json.loads(buf)
+        buf += chunk
+        if len(buf) > settings['max_request']:
+            raise ValueError('請求太大')
+
+
+# 一條訂閱連線：訂了哪些災戶、手上的配置是哪個版本（0 = 訂閱時還沒算完）
+class Subscriber:
+    def __init__(self, writer):
+        self.writer = writer
+        self.binary = False
+        self.names = set()
+        self.version = 0
+
+
+def notify():
+    if snapshot_changed is not None:
+        snapshot_changed.set()
+
+
+def subscribe(subscriber, data, binary):
+    current = snapshot
+    version = current.version if current is not None else 0
+    if 'unsubscribe' in data:
+        request = data['unsubscribe']
+        names = request.get('names') if isinstance(request, dict) else None
+        if names is not None and not name_list(names):
+            return plain(BAD_REQUEST, binary, version)
+        drop(subscriber, subscriber.names.copy() if names is None else names)
+        return plain(encode({'subscribed': len(subscriber.names)}), binary, version)
+    request = data['subscribe']
+    names = request.get('names') if isinstance(request, dict) else None
+    if not name_list(names) or (binary and not binary_codec.packable(names)):
+        return plain(BAD_REQUEST, binary, version)
+    if current is not None:
+        # 查不到的災戶不訂閱（回覆的 "unknown" 裡會列出來）
+        names = [name for name in names if current.fragment(name) is not None]
+    if len(subscriber.names.union(names)) > settings['max_subscriptions']:
+        return plain(encode({'error': f"一條連線最多訂閱 {settings['max_subscriptions']} 戶"}), binary, version)
+    for name in names:
+        subscriber.names.add(name)
+        subscribers.setdefault(name, set()).add(subscriber)
+    subscriber.binary = binary
+    if current is None:
+        # 還沒算完：先回 pending，算完之後直接推播，不必再來問
+        return plain(startup_error or PENDING, binary, version)
+    subscriber.version = max(subscriber.version, version)
+    return current.batch(data['subscribe']['names'], binary)
+
+
+def name_list(names):
+    return isinstance(names, list) and all(isinstance(name, str) for name in names)
+
+
+def drop(subscriber, names):
+    for name in names:
+        subscriber.names.discard(name)
+        waiting = subscribers.get(name)
+        if waiting is not None:
+            waiting.discard(subscriber)
+            if not waiting:
+                del subscribers[name]
+
+
+# 背景 task：每換一次快照就推播一輪；推播進行中又重解了，下一輪直接從這一輪的版本比到最新版本
+async def fan_out():
+    pushed = snapshot
+    while True:
+        await snapshot_changed.wait()
+        snapshot_changed.clear()
+        current = snapshot
+        if current is None or current is pushed:
+            continue
+        await push_changes(pushed, current)
+        pushed = current
+
+
+async def push_changes(old, new):
+    t0 = time.perf_counter()
+    # 只比對有人訂閱的災戶；片段不含版本號，bytes 一樣就是配置沒變
+    changed = [name for name in list(subscribers)
+               if old is None or old.fragment(name) != new.fragment(name)]
+    targets = {}
+    for name in changed:
+        for subscriber in subscribers.get(name, ()):
+            targets.setdefault(subscriber, []).append(name)
+    # 訂了同一組災戶的訂閱者（例如一萬人都訂 H1）共用同一個編好的推播
+    frames = {}
+    sent = dropped = 0
+    for subscriber, names in targets.items():
+        if subscriber.version >= new.version:
+            continue   # 這一輪推播開始之後才訂閱，拿到的已經是新版本
+        if subscriber.version == 0:
+            names = sorted(subscriber.names)   # 訂閱時還沒算完：整份送
+        transport = subscriber.writer.transport
+        if transport.is_closing():
+            continue
+        if transport.get_write_buffer_size() > settings['max_push_buffer']:
+            # 一直不收推播的 client：斷線，重連後重新訂閱就會拿到完整的最新配置
+            subscriber.writer.close()
+            dropped += 1
+            continue
+        key = (tuple(sorted(names)), subscriber.binary)
+        data = frames.get(key)
+        if data is None:
+            data = frames[key] = protocol.frame(new.push(key[0], subscriber.binary))
+        subscriber.writer.write(data)
+        subscriber.version = new.version
+        sent += 1
+        if sent % FANOUT_BATCH == 0:
+            await asyncio.sleep(0)
+    if targets:
+        metrics.PUSHES.inc(sent)
+        metrics.FANOUT.observe(time.perf_counter() - t0)
+        print(f"[Server] 推播版本 {new.version}：{len(changed)} 戶有變動，送給 {sent} 個訂閱者"
+              f"（斷線 {dropped}），{(time.perf_counter() - t0)*1000:.1f} ms")
+
+
+# binary 連線上，錯誤、pending、更新結果這些不常見的回覆就是 JSON 前面加上種類 byte
+# version 不是 None 時在 JSON 最前面補上版本號（更新結果本身已經帶版本號）
+def plain(reply, binary, version=None):
+    if version is not None:
+        reply = allocation_snapshot.stamp(reply, version)
+    return JSON_TAG + reply if binary else reply
+
+
+async def respond(data, binary=False):
+    current = snapshot
+    version = current.version if current is not None else 0
+    if not isinstance(data, dict):
+        REQUESTS['invalid'].inc()
+        ERRORS['bad_request'].inc()
+        return plain(BAD_REQUEST, binary, version)
+    if current is None:
+        # 背景求解還沒完成（或失敗）：先回覆狀態，不讓 client 卡在連線上
+        ERRORS['pending'].inc()
+        return plain(startup_error or PENDING, binary, version)
+    if 'update' in data:
+        REQUESTS['update'].inc()
+        if not protocol.valid_update(data['update']):
+            ERRORS['bad_request'].inc()
+            return plain(BAD_REQUEST, binary, version)
+        if updater is not None:
+            return plain(await updater(data['update']), binary)
+        if model is None:
+            return plain(NO_UPDATE, binary, version)
+        try:
+            reply = await asyncio.get_running_loop().run_in_executor(None, apply_update, data['update'])
+            notify()
+            return plain(reply, binary)
+        except (KeyError, ValueError, TypeError) as e:
+            ERRORS['update_failed'].inc()
+            return plain(encode({'error': f'更新失敗：{e}'}), binary, current_version())
+    if 'names' in data:
+        REQUESTS['names'].inc()
+        if not isinstance(data['names'], list) or (binary and not binary_codec.packable(data['names'])):
+            ERRORS['bad_request'].inc()
+            return plain(BAD_REQUEST, binary, version)
+        return current.batch(data['names'], binary)
+    if 'prefix' in data:
+        REQUESTS['prefix'].inc()
+        if not isinstance(data['prefix'], str):
+            ERRORS['bad_request'].inc()
+            return plain(BAD_REQUEST, binary, version)
+        return current.prefix(data['prefix'], binary)
+    REQUESTS['name'].inc()
+    name = data.get('name')
+    reply = current.get(name, binary) if isinstance(name, str) else None
+    if reply is None:
+        ERRORS['unknown_household'].inc()
+        return plain(UNKNOWN, binary, version)
+    return reply
+
+
+# 編碼協商：回覆用目前的編碼送出，之後的訊息才換成新的編碼
+def negotiate(hello):
+    wanted = hello.get('encoding') if isinstance(hello, dict) else None
+    chosen = wanted if wanted in binary_codec.ENCODINGS else 'json'
+    return chosen, encode({'encoding': chosen, 'supported': list(binary_codec.ENCODINGS)})
+
+
+# 舊協定：一個請求、一個回覆，然後關閉連線
+async def serve_legacy(reader, writer, first, ip):
+    try:
+        data = await asyncio.wait_for(read_request(reader, first), settings['read_timeout'])
+    except ValueError:
+        data = None
+    t0 = time.perf_counter()
+    if limiter.allow(ip):
+        reply = await respond(data)
+    else:
+        SHED['rate_limited'].inc()
+        reply = allocation_snapshot.stamp(admission.RATE_LIMITED, current_version())
+    t1 = time.perf_counter()
+    LOOKUP.observe(t1 - t0)
+    writer.write(reply)
+    await asyncio.wait_for(writer.drain(), settings['write_timeout'])
+    SEND.observe(time.perf_counter() - t1)
+
+
+# 長度前綴框架：同一條連線一直讀請求、依序回覆，直到 client 關閉或閒置太久
+# 有訂閱的連線不算閒置（等推播本來就可能等很久），斷線靠 TCP keepalive 偵測
+async def serve_framed(reader, writer, prefix, ip):
+    binary = False
+    subscriber = None
+    try:
+        while True:
+            if prefix:
+                timeout = settings['read_timeout']
+            else:
+                timeout = None if subscriber is not None and subscriber.names else settings['idle_timeout']
+            try:
+                payload = await asyncio.wait_for(
+                    protocol.read_frame_async(reader, prefix, settings['max_request']), timeout)
+            except ValueError:
+                # 訊息長度超過上限：後面的資料已經對不上框架，回覆錯誤後關閉
+                ERRORS['too_large'].inc()
+                writer.write(protocol.frame(plain(TOO_LARGE, binary, current_version())))
+                await asyncio.wait_for(writer.drain(), settings['write_timeout'])
+                return
+            if payload is None:
+                return
+            prefix = b''
+            t0 = time.perf_counter()
+            try:
+                data = binary_codec.decode_request(payload) if binary else json.loads(payload)
+            except ValueError:
+                data = None
+            t1 = time.perf_counter()
+            PARSE.observe(t1 - t0)
+            if not limiter.allow(ip):
+                SHED['rate_limited'].inc()
+                reply = plain(admission.RATE_LIMITED, binary, current_version())
+            elif isinstance(data, dict) and 'hello' in data:
+                REQUESTS['hello'].inc()
+                chosen, reply = negotiate(data['hello'])
+                reply = plain(reply, binary, current_version())
+                binary = chosen == 'binary'
+                if subscriber is not None:
+                    subscriber.binary = binary
+            elif isinstance(data, dict) and ('subscribe' in data or 'unsubscribe' in data):
+                REQUESTS['subscribe'].inc()
+                if subscriber is None:
+                    subscriber = Subscriber(writer)
+                    sock = writer.get_extra_info('socket')
+                    if sock is not None:
+                        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+                reply = subscribe(subscriber, data, binary)
+            else:
+                reply = await respond(data, binary)
+            t2 = time.perf_counter()
+            LOOKUP.observe(t2 - t1)
+            writer.write(protocol.frame(reply))
+            # pipelining 時回覆先累積在傳送緩衝區，超過 high-water mark 才真的等 client 收
+            await asyncio.wait_for(writer.drain(), settings['write_timeout'])
+            SEND.observe(time.perf_counter() - t2)
+    finally:
+        if subscriber is not None:
+            drop(subscriber, subscriber.names.copy())
+
+
+async def handle_client(reader, writer):
+    global active
+    addr = writer.get_extra_info('peername')
+    ip = addr[0] if addr else None
+    # 拒絕時不加框架直接送忙碌中：舊 client 本來就讀 JSON，新 client 看第一個 byte 就知道（protocol.ServerBusy）
+    if active >= settings['max_connections']:
+        reject(writer, 'max_connections', admission.BUSY)
+        return
+    if not limiter.connect(ip):
+        reject(writer, 'per_ip_connections', admission.TOO_MANY_FROM_IP)
+        return
+    active += 1
+    metrics.CONNECTIONS.inc()
+    try:
+        accepted = time.perf_counter()
+        first = await asyncio.wait_for(reader.read(1), settings['read_timeout'])
+        ACCEPT.observe(time.perf_counter() - accepted)
+        if first == protocol.LEGACY_FIRST_BYTE:
+            await serve_legacy(reader, writer, first, ip)
+        elif first:
+            await serve_framed(reader, writer, first, ip)
+        if settings['verbose']:
+            print(f"[Server] 連線結束：{addr}")
+    except (asyncio.TimeoutError, ConnectionError) as e:
+        ERRORS['timeout' if isinstance(e, asyncio.TimeoutError) else 'connection'].inc()
+        if settings['verbose']:
+            print(f"[Server] 連線中斷 {addr}：{type(e).__name__}")
+    finally:
+        active -= 1
+        limiter.disconnect(ip)
+        writer.close()
+
+
+def reject(writer, reason, body):
+    metrics.REJECTED.inc()
+    SHED[reason].inc()
+    writer.write(allocation_snapshot.stamp(body, current_version()))
+    writer.close()
+
+
+# 請求頻率的 bucket 補滿就丟掉（偽造來源 IP 的洪流不會讓記憶體一直長大）
+def prune_limits(loop):
+    limiter.prune()
+    loop.call_later(1.0, prune_limits, loop)
+
+
+# 上萬條連線需要上萬個 file descriptor：把軟上限拉到硬上限（最多 MAX_FDS；Windows 沒有 resource 模組，不調整）
+# 硬上限是 RLIM_INFINITY 時不能照抄（macOS 會丟 ValueError）；系統不讓調就維持原本的上限
+MAX_FDS = 1 << 20
+
+
+def raise_fd_limit():
+    try:
+        import resource
+    except ImportError:
+        return None
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    target = MAX_FDS if hard == resource.RLIM_INFINITY else min(hard, MAX_FDS)
+    if soft != resource.RLIM_INFINITY and soft < target:
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+        except (ValueError, OSError) as e:
+            print(f"⚠️ 無法調高 file descriptor 上限：{e}")
+    return resource.getrlimit(resource.RLIMIT_NOFILE)[0]
+
+
+# 不在熱路徑上的指標：被抓取時才讀目前的值
+def bind_metrics(loop):
+    metrics.CONNECTIONS_ACTIVE.fn = lambda: active
+    metrics.TASKS.fn = lambda: len(asyncio.all_tasks(loop))
+    metrics.SUBSCRIBED.fn = lambda: len(subscribers)
+    metrics.SNAPSHOT_VERSION.fn = current_version
+    metrics.HOUSEHOLDS.fn = lambda: len(snapshot) if snapshot is not None else 0
+
+
+# metrics_port = 0 不開指標；port 被占用時只印警告，不影響指揮中心本身
+def serve_metrics(port):
+    if not port:
+        return
+    try:
+        metrics.serve(port)
+    except OSError as e:
+        print(f"⚠️ 指標 port {port} 無法使用：{e}")
+        return
+    print(f"[Server] 執行期指標：http://{metrics.METRICS_HOST}:{port}/metrics")
+
+
+# sock：已經 bind / listen 好的 socket（prefork worker 用）；solve=False 時不在本行程求解（snapshot 由呼叫端提供）
+async def serve(host, port, backlog, sock=None, solve=True):
+    global snapshot_changed, limiter
+    loop = asyncio.get_running_loop()
+    snapshot_changed = asyncio.Event()
+    loop.create_task(fan_out())
+    rate = settings['per_ip_rate']
+    limiter = admission.IPLimiter(settings['per_ip_connections'], rate, max(1, int(rate * 2)))
+    prune_limits(loop)
+    bind_metrics(loop)
+    if sock is not None:
+        server = await asyncio.start_server(handle_client, sock=sock, limit=settings['max_request'])
+    else:
+        server = await asyncio.start_server(handle_client, host, port, backlog=backlog,
+                                            reuse_address=True, limit=settings['max_request'])
+    print(f"[Server] 指揮中心啟動（{(time.perf_counter() - STARTED)*1000:.0f} ms），等待災戶連線...")
+    if solve:
+        loop.run_in_executor(None, solve_initial).add_done_callback(lambda _: notify())
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='asyncio 指揮中心')
+    parser.add_argument('--host', default=HOST)
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--backlog', type=int, default=4096)
+    parser.add_argument('--max-connections', type=int, default=settings['max_connections'])
+    parser.add_argument('--read-timeout', type=float, default=settings['read_timeout'])
+    parser.add_argument('--write-timeout', type=float, default=settings['write_timeout'])
+    parser.add_argument('--idle-timeout', type=float, default=settings['idle_timeout'])
+    parser.add_argument('--per-ip-connections', type=int, default=settings['per_ip_connections'])
+    parser.add_argument('--per-ip-rate', type=float, default=settings['per_ip_rate'], help='每秒請求數（0 = 不限制）')
+    parser.add_argument('--verbose', action='store_true')
+    parser.add_argument('--synthetic', type=int, default=0, help='改用這麼多戶的合成路網')
+    parser.add_argument('--metrics-port', type=int, default=metrics.METRICS_PORT, help='指標 port（0 = 關閉）')
+    args = parser.parse_args()
+    settings.update(max_connections=args.max_connections, read_timeout=args.read_timeout,
+                    write_timeout=args.write_timeout, idle_timeout=args.idle_timeout, verbose=args.verbose,
+                    synthetic=args.synthetic, per_ip_connections=args.per_ip_connections,
+                    per_ip_rate=args.per_ip_rate)
+    fds = raise_fd_limit()
+    if fds is not None and fds < settings['max_connections'] + 64:
+        print(f"⚠️ file descriptor 上限只有 {fds}，同時連線數實際上到不了 {settings['max_connections']}")
+    serve_metrics(args.metrics_port)
+    try:
+        asyncio.run(serve(args.host, args.port, args.backlog))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
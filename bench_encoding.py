@@ -0,0 +1,126 @@
+# 編碼 benchmark：同一個 async_server.py（合成路網），比較 JSON 與 binary（struct）兩種編碼的
+#   - 線上傳輸量：每個請求、每個回覆平均多少 bytes（含 4 bytes 框架）
+#   - server CPU：每個請求平均用掉多少 CPU 時間（server 行程 /proc/<pid>/stat 的 utime + stime）
+#   - client 解碼：client 端每個請求的 CPU 時間（binary 在 Python 裡解碼不一定比較快）
+# 工作負載：單戶查詢、ID 清單批次查詢（--batch 戶），都在同一條連線上 pipelining 送出。
+# 只能在 Linux 上跑（需要 /proc）。
+#
+# 範例：
+#   python bench_encoding.py --synthetic 2000 --requests 20000
+#   python bench_encoding.py --json results.json
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+import protocol
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+HOST = '127.0.0.1'
+TICKS = os.sysconf('SC_CLK_TCK')
+
+
+def server_cpu(pid):
+    with open(f'/proc/{pid}/stat') as f:
+        fields = f.read().rsplit(')', 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / TICKS
+
+
+# 等 server 算完：回傳所有災戶 ID
+def wait_ready(port, proc, deadline=120.0):
+    t0 = time.perf_counter()
+    while time.perf_counter() - t0 < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f'server 提早結束（exit {proc.returncode}）')
+        try:
+            with protocol.Connection(HOST, port) as conn:
+                reply = conn.request({'prefix': ''})
+            if 'allocations' in reply:
+                return sorted(reply['allocations'])
+        except (ConnectionRefusedError, ConnectionResetError):
+            pass
+        time.sleep(0.1)
+    raise RuntimeError('server 沒有在時限內完成求解')
+
+
+def run_workload(pid, port, encoding, requests):
+    with protocol.Connection(HOST, port, encoding=encoding) as conn:
+        if conn.encoding != encoding:
+            raise RuntimeError(f'server 不支援 {encoding} 編碼')
+        conn.pipeline(requests[:200])   # 暖身：binary 表格第一次用到時才建
+        sent0, received0 = conn.bytes_sent, conn.bytes_received
+        cpu0 = server_cpu(pid)
+        client0 = time.process_time()
+        t0 = time.perf_counter()
+        replies = conn.pipeline(requests)
+        wall = time.perf_counter() - t0
+        client = time.process_time() - client0
+        cpu1 = server_cpu(pid)
+    n = len(requests)
+    return {
+        'encoding': encoding,
+        'requests': n,
+        'request_bytes': (conn.bytes_sent - sent0) / n,
+        'reply_bytes': (conn.bytes_received - received0) / n,
+        'server_cpu_us_per_request': (cpu1 - cpu0) / n * 1e6,
+        'client_cpu_us_per_request': client / n * 1e6,
+        'requests_per_s': n / wall,
+    }, replies
+
+
+def main():
+    parser = argparse.ArgumentParser(description='JSON 與 binary 編碼 benchmark')
+    parser.add_argument('--synthetic', type=int, default=2000, help='合成路網的戶數')
+    parser.add_argument('--requests', type=int, default=20000, help='單戶查詢的請求數（批次查詢送十分之一）')
+    parser.add_argument('--batch', type=int, default=100, help='批次查詢每次查幾戶')
+    parser.add_argument('--port', type=int, default=9100)
+    parser.add_argument('--json', help='結果另外寫成 JSON 檔')
+    args = parser.parse_args()
+
+    proc = subprocess.Popen([sys.executable, 'async_server.py', '--port', str(args.port),
+                             '--synthetic', str(args.synthetic)], cwd=HERE,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    rows = []
+    try:
+        names = wait_ready(args.port, proc)
+        rng = random.Random(0)
+        workloads = {
+            'single': [{'name': rng.choice(names)} for _ in range(args.requests)],
+            f'batch{args.batch}': [{'names': rng.sample(names, min(args.batch, len(names)))}
+                                   for _ in range(max(1, args.requests // 10))],
+        }
+        for workload, requests in workloads.items():
+            results = {}
+            for encoding in ('json', 'binary'):
+                row, replies = run_workload(proc.pid, args.port, encoding, requests)
+                row['workload'] = workload
+                rows.append(row)
+                results[encoding] = replies
+                print(f"{workload:9s} {encoding:6s} 請求 {row['request_bytes']:7.1f} B  "
+                      f"回覆 {row['reply_bytes']:8.1f} B  server CPU {row['server_cpu_us_per_request']:6.1f} µs/req  "
+                      f"client CPU {row['client_cpu_us_per_request']:7.1f} µs/req  {row['requests_per_s']:8.0f} req/s")
+            # 兩種編碼解回來的內容必須一樣（數字一律比 float）
+            assert _same(results['json'], results['binary'])
+    finally:
+        proc.terminate()
+        proc.wait()
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(rows, f, indent=2)
+        print(f"結果已寫入 {args.json}")
+
+
+def _same(a, b):
+    if isinstance(a, dict):
+        return a.keys() == b.keys() and all(_same(a[k], b[k]) for k in a)
+    if isinstance(a, list):
+        return len(a) == len(b) and all(_same(x, y) for x, y in zip(a, b))
+    if isinstance(a, (int, float)):
+        return float(a) == float(b)
+    return a == b
+
+
+if __name__ == '__main__':
+    main()
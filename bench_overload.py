@@ -0,0 +1,165 @@
+# 過載 benchmark：指揮中心被壓過頭（大量報到、連線洪流）時，正常災戶拿到的正確回覆（goodput）撐不撐得住
+# 正常災戶：open loop 固定速率（multi_client_simulation.py），每一輪把速率調高（--rates）；
+# 連線輪流從 127.0.1.1 ~ 127.0.1.N（--sources N）連出去，模擬來自不同 IP 的災戶，不會被單一 IP 的上限擋住；
+# 同時可以加上從另一個來源位址（--flood-source，預設 127.0.0.2）來的攻擊流量：
+#   --flood-connections N：一直維持 N 條連線，每條只送請求的 header、之後每秒送 1 byte（slowloris），被關掉就重連
+#   --flood-rate R：每秒 R 個請求灌在 --flood-pipes 條連線上（pipelining，不等回覆）
+# 每一輪印出正常災戶的送出速率、goodput、忙碌中 / 錯誤 / 逾時、p50 / p99 延遲，以及攻擊端被擋掉的情形。
+# 壓測端和 server 在同一台機器上會搶 CPU：壓測端送出落後排程時 multi_client_simulation 會另外警告。
+# 需要先啟動 server（run_server_v1.py 固定在 port 9000；async_server.py / prefork_server.py 用 --port）。
+#
+# 範例：
+#   python bench_overload.py --rates 1000 2000 4000 8000 16000
+#   python bench_overload.py --rates 2000 --flood-connections 2000 --flood-rate 20000
+#   python bench_overload.py --rates 500 1000 2000 --connect-per-request --json overload.json
+import argparse
+import asyncio
+import json
+import resource
+import time
+import multi_client_simulation
+
+SLOW_HEADER = (100).to_bytes(4, 'big')   # 宣稱有 100 bytes 的請求，之後一秒只送 1 byte
+
+
+# slowloris：維持 count 條只送了一半請求的連線；server 關掉（讀取期限）或直接拒絕就重連
+async def slowloris(args, stop, stats):
+    async def hold():
+        while not stop.is_set():
+            try:
+                reader, writer = await asyncio.open_connection(args.host, args.port,
+                                                               local_addr=(args.flood_source, 0))
+            except OSError:
+                stats['refused'] += 1
+                await asyncio.sleep(0.5)
+                continue
+            held = False   # server 沒有馬上拒絕、撐過第一秒才算佔著一條連線
+            try:
+                writer.write(SLOW_HEADER)
+                while not stop.is_set():
+                    try:
+                        data = await asyncio.wait_for(reader.read(4096), 1.0)
+                    except asyncio.TimeoutError:
+                        if not held:
+                            held = True
+                            stats['held'] += 1
+                            stats['max_held'] = max(stats['max_held'], stats['held'])
+                        if writer.is_closing():
+                            break
+                        writer.write(b' ')
+                        await writer.drain()
+                        continue
+                    if data.startswith(b'{'):
+                        stats['rejected'] += 1   # 連線數已達上限：直接回忙碌中（retry_after 1 秒）
+                        await asyncio.sleep(1.0)
+                    else:
+                        stats['closed'] += 1     # 讀取期限到了被關閉（或其他回覆）
+                    break
+            except OSError:
+                stats['closed'] += 1
+            finally:
+                if held:
+                    stats['held'] -= 1
+                writer.close()
+            await asyncio.sleep(0.1)
+
+    await asyncio.gather(*(hold() for _ in range(args.flood_connections)))
+
+
+def simulation_args(args, rate, sources, connections=None, connect_per_request=False):
+    argv = ['--host', args.host, '--port', str(args.port), '--mode', 'open', '--rate', str(rate),
+            '--connections', str(connections or args.connections), '--ramp', str(args.ramp),
+            '--duration', str(args.duration), '--timeout', str(args.timeout), '--source', *sources]
+    if connect_per_request:
+        argv.append('--connect-per-request')
+    return multi_client_simulation.build_parser().parse_args(argv)
+
+
+async def one_round(args, rate):
+    stop = asyncio.Event()
+    stats = {'held': 0, 'max_held': 0, 'closed': 0, 'rejected': 0, 'refused': 0}
+    background = []
+    if args.flood_connections:
+        background.append(asyncio.ensure_future(slowloris(args, stop, stats)))
+    attack = None
+    if args.flood_rate:
+        attack = asyncio.ensure_future(multi_client_simulation.run(
+            simulation_args(args, args.flood_rate, [args.flood_source], args.flood_pipes)))
+    if background:
+        await asyncio.sleep(1.0)   # 先讓攻擊連線都連上
+    result = await multi_client_simulation.run(
+        simulation_args(args, rate, [f'127.0.1.{i + 1}' for i in range(args.sources)],
+                        connect_per_request=args.connect_per_request))
+    result['attack'] = await attack if attack is not None else None
+    stop.set()
+    await asyncio.gather(*background)
+    result['slowloris'] = stats
+    return result
+
+
+def row(rate, result):
+    counts, lat, duration = result['counts'], result['latency_ms'], result['duration_s']
+    fmt = lambda v: f'{v:.2f}' if v is not None else '-'
+    line = (f"{rate:>8.0f} {result['throughput_rps']:>9.0f} {result['goodput_rps']:>9.0f} "
+            f"{counts['busy'] / duration:>8.0f} {counts['error'] + counts['error_reply']:>7d} {counts['timeout']:>7d} "
+            f"{fmt(lat['p50']):>8s} {fmt(lat['p99']):>8s}")
+    lag = result['send_lag_ms']['max']
+    if lag is not None and lag > 10:
+        line += f"  （壓測端落後最多 {lag:.0f} ms）"
+    attack = result['attack']
+    if attack is not None:
+        a = attack['counts']
+        line += (f"\n{'':>8s} 攻擊端：正確回覆 {attack['goodput_rps']:.0f} req/s，忙碌中 {a['busy']}，"
+                 f"錯誤 {a['error'] + a['error_reply']}，逾時 {a['timeout']}")
+    s = result['slowloris']
+    if any(s.values()):
+        line += (f"\n{'':>8s} slowloris：最多同時佔著 {s['max_held']} 條，被關閉 {s['closed']}，"
+                 f"被拒絕 {s['rejected']}，連不上 {s['refused']}")
+    return line
+
+
+async def main_async(args):
+    results = []
+    print(f"{'送出/s':>8s} {'吞吐量/s':>9s} {'goodput/s':>9s} {'忙碌中/s':>8s} {'錯誤':>7s} {'逾時':>7s} "
+          f"{'p50 ms':>8s} {'p99 ms':>8s}")
+    for rate in args.rates:
+        result = await one_round(args, rate)
+        results.append(result)
+        print(row(rate, result), flush=True)
+        await asyncio.sleep(args.pause)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='指揮中心過載 benchmark')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9000)
+    parser.add_argument('--rates', type=float, nargs='+', default=[1000, 2000, 4000, 8000, 16000],
+                        help='正常災戶每秒請求數，每個值跑一輪')
+    parser.add_argument('--connections', type=int, default=16, help='正常災戶的長連線數')
+    parser.add_argument('--connect-per-request', action='store_true', help='正常災戶每個請求都重新連線（大量報到）')
+    parser.add_argument('--sources', type=int, default=8, help='正常災戶分散在幾個來源位址（127.0.1.x）')
+    parser.add_argument('--ramp', type=float, default=1.0)
+    parser.add_argument('--duration', type=float, default=5.0)
+    parser.add_argument('--timeout', type=float, default=2.0)
+    parser.add_argument('--pause', type=float, default=1.0, help='每輪之間休息幾秒')
+    parser.add_argument('--flood-source', default='127.0.0.2', help='攻擊流量的來源位址')
+    parser.add_argument('--flood-connections', type=int, default=0, help='slowloris 連線數')
+    parser.add_argument('--flood-rate', type=float, default=0, help='攻擊端每秒請求數')
+    parser.add_argument('--flood-pipes', type=int, default=4, help='攻擊端的連線數')
+    parser.add_argument('--json', help='每一輪的結果寫成 JSON')
+    args = parser.parse_args()
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+    t0 = time.perf_counter()
+    results = asyncio.run(main_async(args))
+    print(f"共 {time.perf_counter() - t0:.0f} s")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+        print(f"結果已寫入 {args.json}")
+
+
+if __name__ == '__main__':
+    main()
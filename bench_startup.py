@@ -0,0 +1,82 @@
+# 指揮中心啟動時間 benchmark：量 run_server_v1.py 從行程啟動到
+#   1. 第一個查詢拿到回覆（可以連線，通常回 pending）
+#   2. 拿到真正的配置結果（背景求解完成）
+# 另外量一次乾淨的 `import allocation_model`（cvxpy）要多久，也就是以前在 listen 之前要白等的時間。
+#
+# 範例：
+#   python bench_startup.py --repeat 5
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+HOST = '127.0.0.1'
+PORT = 9000
+
+
+# 送一次查詢；連不上回傳 None
+def query(name, timeout=2.0):
+    try:
+        with socket.create_connection((HOST, PORT), timeout=timeout) as s:
+            s.sendall(json.dumps({'name': name}).encode())
+            return json.loads(s.recv(4096).decode())
+    except (ConnectionRefusedError, ConnectionResetError, socket.timeout):
+        return None
+
+
+# 啟動一次 server，回傳 (第一個回覆秒數, 配置完成秒數)
+def measure_once(name, deadline, poll=0.005):
+    t0 = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, 'run_server_v1.py'], cwd=HERE,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    t_first = t_ready = None
+    try:
+        while time.perf_counter() - t0 < deadline:
+            if proc.poll() is not None:
+                raise RuntimeError(f'server 提早結束（exit {proc.returncode}）')
+            reply = query(name)
+            now = time.perf_counter() - t0
+            if reply is None:
+                time.sleep(poll)
+                continue
+            if t_first is None:
+                t_first = now
+            if 'resource' in reply:
+                t_ready = now
+                break
+            if reply.get('status') != 'pending':
+                raise RuntimeError(f'非預期的回覆：{reply}')
+            time.sleep(poll)
+    finally:
+        proc.terminate()
+        proc.wait()
+    return t_first, t_ready
+
+
+# 乾淨的 interpreter 裡 import 求解器要多久
+def solver_import_time():
+    code = 'import time; t = time.perf_counter(); import allocation_model; print(time.perf_counter() - t)'
+    out = subprocess.run([sys.executable, '-c', code], cwd=HERE, capture_output=True, text=True, check=True)
+    return float(out.stdout)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='指揮中心啟動時間 benchmark')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--name', default='H1', help='查詢哪一戶')
+    parser.add_argument('--deadline', type=float, default=60.0, help='單次最多等幾秒')
+    args = parser.parse_args()
+
+    print(f"import allocation_model（cvxpy）：{solver_import_time()*1000:.0f} ms")
+    for i in range(args.repeat):
+        t_first, t_ready = measure_once(args.name, args.deadline)
+        fmt = lambda t: '逾時' if t is None else f'{t*1000:.0f} ms'
+        print(f"第 {i + 1} 次：第一個回覆 {fmt(t_first)}，配置完成 {fmt(t_ready)}")
+
+
+if __name__ == '__main__':
+    main()
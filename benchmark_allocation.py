@@ -0,0 +1,215 @@
+# 配置演算法 benchmark：在合成路網上比較貪婪法、最小成本流與 LP
+# 每一次執行都在全新的子行程（spawn）中：依 seed 重新產生路網、跑一個方法，
+# 所以 peak RSS 只算到那個方法本身，結果也能完整重現。
+# 結果寫成 CSV；加上 --check 可以跟上一次的結果比對，抓出成本或時間的 regression。
+#
+# 範例：
+#   python benchmark_allocation.py --topologies grid geometric --sizes 400 2500 --out results.csv
+#   python benchmark_allocation.py --out new.csv --check results.csv
+import argparse
+import csv
+import itertools
+import multiprocessing
+import os
+import queue as queue_module
+import resource
+import time
+import approx_mcf
+import lagrangian
+import lp_sparse
+import min_cost_flow
+import network_generator
+
+FIELDS = ['topology', 'n_nodes', 'n_edges', 'n_sources', 'n_shelters', 'distribution', 'seed',
+          'method', 'status', 'wall_time_s', 'peak_rss_mb', 'cost', 'gap', 'unmet']
+
+
+def run_greedy(graph, demands):
+    G = graph.to_networkx()
+    t0 = time.perf_counter()
+    r = min_cost_flow.single_path_greedy(G, demands, source=network_generator.SOURCE)
+    return time.perf_counter() - t0, 'ok', r['cost'], sum(r['unmet'].values())
+
+
+def run_mcf(graph, demands):
+    t0 = time.perf_counter()
+    r = min_cost_flow.min_cost_flow(graph, demands, source=network_generator.SOURCE)
+    return time.perf_counter() - t0, 'ok', r['cost'], sum(r['unmet'].values())
+
+
+def run_lp(graph, demands):
+    t0 = time.perf_counter()
+    r = lp_sparse.solve_sparse(graph, demands, source=network_generator.SOURCE)
+    elapsed = time.perf_counter() - t0
+    if r['objective'] is None:
+        # 需求超過網路容量時 LP 直接不可行，沒有部分解
+        return elapsed, 'infeasible', None, None
+    return elapsed, 'ok', r['objective'], 0.0
+
+
+def run_approx(graph, demands):
+    t0 = time.perf_counter()
+    r = approx_mcf.solve(graph, demands, source=network_generator.SOURCE, eps=0.2)
+    unmet = max(0.0, sum(demands[k] - r['delivered'][k] for k in demands))
+    return time.perf_counter() - t0, r['status'], r['cost'], unmet
+
+
+def run_lagrangian(graph, demands):
+    t0 = time.perf_counter()
+    r = lagrangian.solve(graph, demands, source=network_generator.SOURCE, max_iter=50)
+    return time.perf_counter() - t0, r['status'], r['cost'], sum(r['unmet'].values())
+
+
+# 方法名稱 -> (執行函式, 是否受 --max-lp-vars 限制)
+METHODS = {
+    'greedy': (run_greedy, False),
+    'mcf': (run_mcf, False),
+    'lp': (run_lp, True),
+    'approx': (run_approx, False),
+    'lagrangian': (run_lagrangian, False),
+}
+
+
+def _peak_rss_mb():
+    # Linux 的 ru_maxrss 單位是 KB
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+# 子行程：重新產生路網（相同 seed = 相同實例）再跑指定方法
+def _worker(config, method, queue):
+    graph, demands = network_generator.generate(**config)
+    elapsed, status, cost, unmet = METHODS[method][0](graph, demands)
+    queue.put({'n_edges': graph.n_edges, 'status': status, 'wall_time_s': elapsed,
+               'peak_rss_mb': _peak_rss_mb(), 'cost': cost, 'unmet': unmet})
+
+
+def run_one(config, method, timeout):
+    ctx = multiprocessing.get_context('spawn')
+    queue = ctx.Queue()
+    proc = ctx.Process(target=_worker, args=(config, method, queue))
+    proc.start()
+    deadline = time.monotonic() + timeout
+    try:
+        # 定時檢查子行程還活著，crash 時不必等到 timeout
+        while True:
+            try:
+                return queue.get(timeout=0.5)
+            except queue_module.Empty:
+                if not proc.is_alive():
+                    return {'status': 'crashed'}
+                if time.monotonic() > deadline:
+                    return {'status': 'timeout'}
+    finally:
+        proc.join(1)
+        if proc.is_alive():
+            proc.terminate()
+
+
+def run_suite(configs, methods, repeat=1, timeout=600, max_lp_vars=5_000_000):
+    rows = []
+    for config in configs:
+        results = {}
+        for method in methods:
+            if METHODS[method][1]:
+                # 先產生一次估計變數數量（災戶數 x 邊數），太大就跳過
+                graph, demands = network_generator.generate(**config)
+                if graph.n_edges * len(demands) > max_lp_vars:
+                    results[method] = {'status': 'skipped'}
+                    continue
+            runs = [run_one(config, method, timeout) for _ in range(repeat)]
+            ok = [r for r in runs if 'wall_time_s' in r]
+            if not ok:
+                results[method] = runs[0]
+                continue
+            # 時間取中位數，其他欄位每次都一樣
+            best = sorted(ok, key=lambda r: r['wall_time_s'])[len(ok) // 2]
+            best['peak_rss_mb'] = max(r['peak_rss_mb'] for r in ok)
+            results[method] = best
+
+        # 最佳性差距：單一來源時最小成本流就是精確最佳解，用它當基準
+        reference = results.get('mcf', {})
+        for method, r in results.items():
+            gap = None
+            if (r.get('cost') is not None and reference.get('cost') and r.get('unmet') is not None
+                    and abs(r['unmet'] - reference['unmet']) <= 1e-6):
+                gap = (r['cost'] - reference['cost']) / reference['cost']
+            row = dict(config, method=method, gap=gap)
+            row.update({k: r.get(k) for k in ('n_edges', 'status', 'wall_time_s', 'peak_rss_mb', 'cost', 'unmet')})
+            rows.append(row)
+            print(_format(row))
+    return rows
+
+
+def _format(row):
+    def fmt(value, spec):
+        return format(value, spec) if isinstance(value, (int, float)) else str(value)
+    return (f"{row['topology']:10s} n={row['n_nodes']:<7} shelters={row['n_shelters']:<5} "
+            f"{row['distribution']:9s} seed={row['seed']:<3} {row['method']:8s} {row['status']:10s} "
+            f"time={fmt(row['wall_time_s'], '.3f')}s rss={fmt(row['peak_rss_mb'], '.0f')}MB "
+            f"cost={fmt(row['cost'], '.1f')} gap={fmt(row['gap'], '.4f')} unmet={fmt(row['unmet'], '.1f')}")
+
+
+def write_csv(rows, path):
+    new_file = not os.path.exists(path)
+    with open(path, 'a', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDS, extrasaction='ignore')
+        if new_file:
+            writer.writeheader()
+        writer.writerows(rows)
+
+
+# 與舊結果比對：成本或未滿足量改變、或時間變慢超過 time_tolerance 倍都算 regression
+def check_regressions(rows, baseline_path, time_tolerance=1.5):
+    key_fields = ('topology', 'n_nodes', 'n_sources', 'n_shelters', 'distribution', 'seed', 'method')
+    with open(baseline_path, newline='') as f:
+        baseline = {tuple(r[k] for k in key_fields): r for r in csv.DictReader(f)}
+    problems = []
+    for row in rows:
+        old = baseline.get(tuple(str(row[k]) for k in key_fields))
+        if old is None:
+            continue
+        for field in ('cost', 'unmet'):
+            a, b = row.get(field), old.get(field)
+            if (a is None) != (b in ('', None)) or (a is not None and abs(a - float(b)) > 1e-6 * max(1.0, abs(a))):
+                problems.append(f"{row['method']} {field}: {b} -> {a}")
+        if row.get('wall_time_s') and old.get('wall_time_s'):
+            if row['wall_time_s'] > time_tolerance * float(old['wall_time_s']):
+                problems.append(f"{row['method']} 變慢：{float(old['wall_time_s']):.3f}s -> {row['wall_time_s']:.3f}s "
+                                f"（{row['topology']} n={row['n_nodes']} seed={row['seed']}）")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description='配置演算法 benchmark')
+    parser.add_argument('--topologies', nargs='+', default=list(network_generator.TOPOLOGIES))
+    parser.add_argument('--sizes', nargs='+', type=int, default=[400, 2500])
+    parser.add_argument('--sources', nargs='+', type=int, default=[1])
+    parser.add_argument('--shelters', nargs='+', type=int, default=[20])
+    parser.add_argument('--distributions', nargs='+', default=['uniform'])
+    parser.add_argument('--seeds', nargs='+', type=int, default=[0])
+    parser.add_argument('--methods', nargs='+', default=list(METHODS), choices=list(METHODS))
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--timeout', type=float, default=600)
+    parser.add_argument('--max-lp-vars', type=int, default=5_000_000)
+    parser.add_argument('--out', default='benchmark_results.csv')
+    parser.add_argument('--check', help='要比對的舊結果 CSV')
+    args = parser.parse_args()
+
+    configs = [
+        dict(topology=t, n_nodes=n, n_sources=src, n_shelters=sh, distribution=d, seed=seed)
+        for t, n, src, sh, d, seed in itertools.product(
+            args.topologies, args.sizes, args.sources, args.shelters, args.distributions, args.seeds)
+    ]
+    rows = run_suite(configs, args.methods, args.repeat, args.timeout, args.max_lp_vars)
+    write_csv(rows, args.out)
+    print(f"結果已寫入 {args.out}")
+    if args.check:
+        problems = check_regressions(rows, args.check)
+        for p in problems:
+            print("⚠️", p)
+        if problems:
+            raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+# 指揮中心協定的二進位編碼（固定 struct 排列），跟 JSON 並存、每條連線自己選
+# 協商：連線後第一則訊息送 { "hello": { "encoding": "binary" } }（JSON），
+# server 回 { "encoding": "binary" } 之後，這條連線之後的訊息都用下面的格式；不送 hello 就維持 JSON。
+# 每則訊息（仍然在 protocol.py 的長度前綴框架裡）第一個 byte 是種類：
+#   請求：0 = JSON（更新等不常用的請求）、1 = 單戶查詢、2 = ID 清單、3 = ID 前綴
+#   回覆：0 = JSON（錯誤、pending、更新結果）、1 = 單戶配置、2 = 批次配置、3 = 訂閱推播（格式同批次配置）；
+#         1、2、3 在種類 byte 後面緊接 uint64 快照版本號（JSON 回覆則是 "version" 欄位）
+# 字串 = uint16 長度 + UTF-8（最多 MAX_STR bytes，更長的 ID 只能走 JSON）；字串清單 = uint32 個數 + uint32 長度 + 用 NUL 串起來的 UTF-8
+# （一次 split 就切開，不必在 Python 裡一個一個讀；含 NUL 的 ID 放不進去：client 改用 JSON 請求，
+#   binary 連線上帶了含 NUL 的 ID 的批次查詢 / 訂閱，server 回請求格式錯誤，不會編出切錯的 unknown 清單）
+# 配置 = float64 送達量 + uint16 路徑數 + 每條（float64 量 + 節點名稱清單）；節點名稱一律以字串傳送。
+import json
+import struct
+
+ENCODINGS = ('json', 'binary')
+
+REQ_JSON, REQ_NAME, REQ_NAMES, REQ_PREFIX = 0, 1, 2, 3
+REPLY_JSON, REPLY_ALLOCATION, REPLY_BATCH, REPLY_PUSH = 0, 1, 2, 3
+
+_U16 = struct.Struct('!H')
+_U32 = struct.Struct('!I')
+_F64 = struct.Struct('!d')
+_HEAD = struct.Struct('!dH')    # 送達量 + 路徑數
+_LIST = struct.Struct('!II')    # 字串個數 + bytes 長度
+_VERSION = struct.Struct('!Q')
+MAX_STR = 0xFFFF                # pack_str 的 uint16 長度上限
+
+
+# 能不能用 pack_str 編（UTF-8 不超過 MAX_STR bytes）
+def fits(text):
+    return len(text.encode()) <= MAX_STR
+
+
+def pack_str(text):
+    data = text.encode()
+    if len(data) > MAX_STR:
+        raise ValueError(f'字串太長：UTF-8 {len(data)} bytes，二進位編碼最多 {MAX_STR} bytes')
+    return _U16.pack(len(data)) + data
+
+
+# 這些字串能不能放進字串清單（pack_strs 之後會照原樣切回來）
+def packable(texts):
+    return all('\0' not in str(text) for text in texts)
+
+
+def pack_strs(texts):
+    data = '\0'.join(texts).encode()
+    return _LIST.pack(len(texts), len(data)) + data
+
+
+def pack_allocation(entry):
+    parts = [_HEAD.pack(entry['resource'], len(entry['routes']))]
+    for route in entry['routes']:
+        parts.append(_F64.pack(route['amount']))
+        parts.append(pack_strs([str(node) for node in route['path']]))
+    return b''.join(parts)
+
+
+# 回覆開頭：種類 byte + 快照版本號
+def pack_head(tag, version):
+    return bytes([tag]) + _VERSION.pack(version)
+
+
+def pack_json(obj, tag=REPLY_JSON):
+    return bytes([tag]) + json.dumps(obj, ensure_ascii=False).encode()
+
+
+# 批次回覆：fragments 是事先編好的「名稱 + 配置」，unknown 是查不到的 ID
+# 推播（tag = REPLY_PUSH）也是同樣的排列：有變動的災戶 + 已經不在配置裡的災戶
+def pack_batch(fragments, unknown, version, tag=REPLY_BATCH):
+    return b''.join([pack_head(tag, version), _U32.pack(len(fragments)), *fragments,
+                     pack_strs([str(name) for name in unknown])])
+
+
+class _Reader:
+    def __init__(self, data):
+        self.data = memoryview(data)
+        self.pos = 1
+
+    def unpack(self, fmt):
+        values = fmt.unpack_from(self.data, self.pos)
+        self.pos += fmt.size
+        return values if len(values) > 1 else values[0]
+
+    def text(self):
+        n = self.unpack(_U16)
+        self.pos += n
+        return str(self.data[self.pos - n:self.pos], 'utf-8')
+
+    def texts(self):
+        count, n = self.unpack(_LIST)
+        self.pos += n
+        return str(self.data[self.pos - n:self.pos], 'utf-8').split('\0') if count else []
+
+    def allocation(self):
+        resource, n_routes = self.unpack(_HEAD)
+        routes = []
+        for _ in range(n_routes):
+            amount = self.unpack(_F64)
+            routes.append({'path': self.texts(), 'amount': amount})
+        return {'resource': resource, 'routes': routes}
+
+
+def encode_request(obj):
+    keys = set(obj)
+    if keys == {'name'} and isinstance(obj['name'], str) and fits(obj['name']):
+        return bytes([REQ_NAME]) + pack_str(obj['name'])
+    if keys == {'prefix'} and isinstance(obj['prefix'], str) and fits(obj['prefix']):
+        return bytes([REQ_PREFIX]) + pack_str(obj['prefix'])
+    if keys == {'names'} and isinstance(obj['names'], list) and \
+            all(isinstance(n, str) for n in obj['names']) and packable(obj['names']):
+        return bytes([REQ_NAMES]) + pack_strs(obj['names'])
+    return pack_json(obj, REQ_JSON)
+
+
+# 解回跟 JSON 協定一樣的 dict；格式不對就丟 ValueError
+def decode_request(payload):
+    try:
+        tag = payload[0]
+        if tag == REQ_JSON:
+            return json.loads(payload[1:])
+        reader = _Reader(payload)
+        if tag == REQ_NAME:
+            return {'name': reader.text()}
+        if tag == REQ_PREFIX:
+            return {'prefix': reader.text()}
+        if tag == REQ_NAMES:
+            return {'names': reader.texts()}
+    except (IndexError, struct.error, UnicodeDecodeError) as e:
+        raise ValueError(f'二進位請求格式錯誤：{e}')
+    raise ValueError(f'未知的請求種類：{tag}')
+
+
+def decode_reply(payload):
+    tag = payload[0]
+    if tag == REPLY_JSON:
+        return json.loads(payload[1:])
+    reader = _Reader(payload)
+    if tag == REPLY_ALLOCATION:
+        version = reader.unpack(_VERSION)
+        return {'version': version, **reader.allocation()}
+    if tag in (REPLY_BATCH, REPLY_PUSH):
+        version = reader.unpack(_VERSION)
+        allocations = {}
+        for _ in range(reader.unpack(_U32)):
+            name = reader.text()
+            allocations[name] = reader.allocation()
+        unknown = reader.texts()
+        if tag == REPLY_PUSH:
+            return {'push': allocations, 'removed': unknown, 'version': version}
+        return {'version': version, 'allocations': allocations, 'unknown': unknown}
+    raise ValueError(f'未知的回覆種類：{tag}')
+
+
+if __name__ == '__main__':
+    entry = {'resource': 8.0, 'routes': [{'path': ['S', 'A', 'B', 'H1'], 'amount': 3.0},
+                                         {'path': ['S', 'C', 'B', 'H1'], 'amount': 5.0}]}
+    binary = pack_head(REPLY_ALLOCATION, 3) + pack_allocation(entry)
+    text = json.dumps({'version': 3, **entry}).encode()
+    assert decode_reply(binary) == {'version': 3, **entry}
+    batch = pack_batch([pack_str('H1') + pack_allocation(entry)], ['X'], 3)
+    assert decode_reply(batch) == {'version': 3, 'allocations': {'H1': entry}, 'unknown': ['X']}
+    push = pack_batch([pack_str('H1') + pack_allocation(entry)], [], 4, REPLY_PUSH)
+    assert decode_reply(push) == {'push': {'H1': entry}, 'removed': [], 'version': 4}
+    for request in ({'name': 'H1'}, {'prefix': 'D03-'}, {'names': ['H1', 'H2']}, {'update': {'demands': {'H1': 9}}}):
+        assert decode_request(encode_request(request)) == request
+    print(f"單戶配置：JSON {len(text)} bytes，binary {len(binary)} bytes")
@@ -1,18 +1,19 @@
 #災戶 H2，連線並接收資源
 # client_H2.py
-import socket
-import json
+import time
+import protocol
 
 HOST = 'localhost'
 PORT = 9000
 my_name = 'H2'
 
-with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-    s.connect((HOST, PORT))
-    s.sendall(my_name.encode())
-    data = s.recv(1024)
-    result = json.loads(data.decode())
+# 長度前綴框架 + keep-alive：server 還在計算時在同一條連線上稍等再問，不必重新連線
+with protocol.Connection(HOST, PORT) as conn:
+    result = conn.request({'name': my_name})
+    while result.get('status') == 'pending':
+        time.sleep(0.2)
+        result = conn.request({'name': my_name})
     if 'resource' in result:
-        print(f"[{my_name}] ✅ 收到資源：{result['resource']} 單位")
+        print(f"[{my_name}] ✅ 收到資源：{result['resource']} 單位（配置版本 {result.get('version')}）")
     else:
         print(f"[{my_name}] ❌ 錯誤：{result.get('error', '未知錯誤')}")
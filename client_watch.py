@@ -0,0 +1,48 @@
+#災戶訂閱：連線一次、訂閱自己的配置，之後配置有變動時由指揮中心主動推播，不必一直輪詢
+# client_watch.py（需要 async_server.py 或 prefork_server.py）
+#
+# 範例：
+#   python client_watch.py H1
+#   python client_watch.py H1 H2 --port 9100 --encoding binary
+import argparse
+import protocol
+
+
+def show(name, entry, version):
+    routes = '，'.join('→'.join(map(str, r['path'])) + f" {r['amount']}" for r in entry['routes'])
+    print(f"[{name}] ✅ 資源 {entry['resource']} 單位（配置版本 {version}）：{routes or '無路徑'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='訂閱災戶配置')
+    parser.add_argument('names', nargs='*', default=['H1'])
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=9000)
+    parser.add_argument('--encoding', choices=('json', 'binary'), default='json')
+    args = parser.parse_args()
+
+    with protocol.Connection(args.host, args.port, encoding=args.encoding) as conn:
+        reply = conn.request({'subscribe': {'names': args.names}})
+        if reply.get('status') == 'pending':
+            print("⏳ 配置計算中，算完會自動推播")
+        elif 'error' in reply:
+            print(f"❌ 錯誤：{reply['error']}")
+            return
+        else:
+            for name, entry in reply['allocations'].items():
+                show(name, entry, reply['version'])
+            for name in reply['unknown']:
+                print(f"[{name}] ❌ 未知災戶，不訂閱")
+        while True:
+            push = conn.wait_push()
+            for name, entry in push['push'].items():
+                show(name, entry, push['version'])
+            for name in push['removed']:
+                print(f"[{name}] ⚠️ 已不在配置中（配置版本 {push['version']}）")
+
+
+if __name__ == '__main__':
+    try:
+        main()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,344 @@
+# 精簡的 CSR 路網：取代 nx.DiGraph 與 G[u][v]['capacity'] 這種 dict 查詢
+# offsets / targets 為 int32，capacity / cost 為 float32，節點名稱另存一張對照表。
+# 大型路網（edge list / CSV / JSON）逐行串流讀取，不會先建一堆 Python tuple；
+# 存成 .npy 之後可以用 memory map 直接載入。
+import csv
+import json
+import os
+import time
+from array import array
+import numpy as np
+
+INDEX_DTYPE = np.int32
+VALUE_DTYPE = np.float32
+JSON_CHUNK = 1 << 16   # .json 每次讀幾個字元
+
+
+class CSRGraph:
+    def __init__(self, names, offsets, targets, capacity, cost):
+        self.names = list(names)
+        self.index = {n: i for i, n in enumerate(self.names)}
+        self.offsets = offsets
+        self.targets = targets
+        self.capacity = capacity
+        self.cost = cost
+
+    # 由 (tail, head, capacity, cost) 陣列建 CSR；同一個 tail 的邊保持原本順序
+    @classmethod
+    def from_arrays(cls, names, tails, heads, capacity, cost):
+        tails = np.asarray(tails, dtype=INDEX_DTYPE)
+        order = np.argsort(tails, kind='stable')
+        counts = np.bincount(tails, minlength=len(names))
+        offsets = np.zeros(len(names) + 1, dtype=np.int64 if len(tails) > np.iinfo(INDEX_DTYPE).max else INDEX_DTYPE)
+        np.cumsum(counts, out=offsets[1:])
+        return cls(
+            names,
+            offsets,
+            np.asarray(heads, dtype=INDEX_DTYPE)[order],
+            np.asarray(capacity, dtype=VALUE_DTYPE)[order],
+            np.asarray(cost, dtype=VALUE_DTYPE)[order],
+        )
+
+    # 由 ('S', 'A', {'capacity': 15, 'cost': 5}) 這種 edges 清單建圖（與現有腳本同格式）
+    @classmethod
+    def from_edges(cls, edges, nodes=()):
+        builder = _Builder()
+        for n in nodes:
+            builder.node_id(n)
+        for u, v, attr in edges:
+            builder.add(u, v, attr['capacity'], attr['cost'])
+        return builder.build()
+
+    @classmethod
+    def from_networkx(cls, G):
+        return cls.from_edges(((u, v, G[u][v]) for u, v in G.edges()), nodes=G.nodes())
+
+    @property
+    def n_nodes(self):
+        return len(self.names)
+
+    @property
+    def n_edges(self):
+        return len(self.targets)
+
+    @property
+    def nbytes(self):
+        return self.offsets.nbytes + self.targets.nbytes + self.capacity.nbytes + self.cost.nbytes
+
+    # 每條邊的起點（CSR 只存 offsets，需要時再展開）
+    def tails(self):
+        return np.repeat(np.arange(self.n_nodes, dtype=INDEX_DTYPE), np.diff(self.offsets))
+
+    def out_edges(self, i):
+        return range(int(self.offsets[i]), int(self.offsets[i + 1]))
+
+    def edge_list(self):
+        names = self.names
+        return [(names[u], names[v]) for u, v in zip(self.tails().tolist(), self.targets.tolist())]
+
+    # 給 LP / 最小成本流用的格式，與 lp_sparse.edge_arrays 回傳值相同
+    def edge_arrays(self):
+        return (
+            self.names,
+            self.index,
+            self.edge_list(),
+            self.tails().astype(np.int64),
+            self.targets.astype(np.int64),
+            self.capacity.astype(np.float64),
+            self.cost.astype(np.float64),
+        )
+
+    # 轉回 nx.DiGraph（給只支援 networkx 的舊程式，例如單一路徑貪婪法）
+    def to_networkx(self):
+        import networkx as nx
+        G = nx.DiGraph()
+        G.add_nodes_from(self.names)
+        names = self.names
+        G.add_edges_from(
+            (names[u], names[v], {'capacity': c, 'cost': w})
+            for u, v, c, w in zip(self.tails().tolist(), self.targets.tolist(),
+                                  self.capacity.tolist(), self.cost.tolist()))
+        return G
+
+    # 存成一個資料夾的 .npy，之後可用 load_npy(..., mmap=True) 直接映射
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        for key in ('offsets', 'targets', 'capacity', 'cost'):
+            np.save(os.path.join(directory, f'{key}.npy'), getattr(self, key))
+        with open(os.path.join(directory, 'names.json'), 'w', encoding='utf-8') as f:
+            json.dump(self.names, f, ensure_ascii=False)
+
+    @classmethod
+    def load_npy(cls, directory, mmap=True):
+        mode = 'r' if mmap else None
+        arrays = [np.load(os.path.join(directory, f'{key}.npy'), mmap_mode=mode)
+                  for key in ('offsets', 'targets', 'capacity', 'cost')]
+        with open(os.path.join(directory, 'names.json'), encoding='utf-8') as f:
+            names = json.load(f)
+        return cls(names, *arrays)
+
+
+# 串流建圖用的緩衝：array 模組存原始數值，比 list of tuple 省很多記憶體
+class _Builder:
+    def __init__(self):
+        self.names = []
+        self.index = {}
+        self.tails = array('i')
+        self.heads = array('i')
+        self.capacity = array('f')
+        self.cost = array('f')
+
+    def node_id(self, name):
+        i = self.index.get(name)
+        if i is None:
+            i = len(self.names)
+            self.index[name] = i
+            self.names.append(name)
+        return i
+
+    def add(self, u, v, capacity, cost):
+        self.tails.append(self.node_id(u))
+        self.heads.append(self.node_id(v))
+        self.capacity.append(float(capacity))
+        self.cost.append(float(cost))
+
+    def build(self):
+        return CSRGraph.from_arrays(
+            self.names,
+            np.frombuffer(self.tails, dtype=np.int32),
+            np.frombuffer(self.heads, dtype=np.int32),
+            np.frombuffer(self.capacity, dtype=np.float32),
+            np.frombuffer(self.cost, dtype=np.float32),
+        )
+
+
+def _is_number(text):
+    try:
+        float(text)
+        return True
+    except ValueError:
+        return False
+
+
+# CSV 表頭可以用的欄位名稱（依 u, v, capacity, cost 的順序）
+CSV_COLUMNS = (('source', 'u', 'from'), ('target', 'v', 'to'), ('capacity', 'cap'), ('cost', 'weight'))
+
+
+def _column(header, keys):
+    index = next((header.index(k) for k in keys if k in header), None)
+    if index is None:
+        raise ValueError(f"CSV 表頭缺少欄位：{' / '.join(keys)}")
+    return index
+
+
+# CSV：可有表頭（source/target 或 u/v，加上 capacity、cost），沒有表頭就依序 u,v,capacity,cost
+def _iter_csv(f):
+    reader = csv.reader(f)
+    columns = (0, 1, 2, 3)
+    for row in reader:
+        if not row or row[0].startswith('#'):
+            continue
+        if len(row) >= 4 and not _is_number(row[2]):
+            header = [c.strip().lower() for c in row]
+            columns = tuple(_column(header, keys) for keys in CSV_COLUMNS)
+            continue
+        yield tuple(row[c].strip() for c in columns[:2]) + (row[columns[2]], row[columns[3]])
+
+
+# 空白分隔的 edge list：u v capacity cost
+def _iter_text(f):
+    for line in f:
+        parts = line.split()
+        if len(parts) >= 4 and not parts[0].startswith('#'):
+            yield parts[0], parts[1], parts[2], parts[3]
+
+
+# JSON 紀錄：[u, v, capacity, cost]、[u, v, {"capacity":..,"cost":..}] 或 {"u":..,"v":..,...}
+def _record(item):
+    if isinstance(item, dict):
+        return (item.get('u', item.get('source')), item.get('v', item.get('target')),
+                item['capacity'], item['cost'])
+    if len(item) == 3 and isinstance(item[2], dict):
+        return item[0], item[1], item[2]['capacity'], item[2]['cost']
+    return item[0], item[1], item[2], item[3]
+
+
+# .json 也不整份 json.load：一次讀一塊，陣列裡的邊一筆一筆 raw_decode，讀過的部分就丟掉
+class _JSONStream:
+    def __init__(self, f):
+        self.f = f
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def _more(self):
+        if self.eof:
+            return False
+        chunk = self.f.read(JSON_CHUNK)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    # 下一個非空白字元（不前進）；檔案結束時回傳 ''
+    def peek(self):
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in ' \t\r\n':
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._more():
+                return ''
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f"JSON 格式錯誤：預期 {char!r}")
+        self.pos += 1
+
+    # 一個完整的值；剛好停在緩衝區結尾時先多讀一塊（數字可能被切在兩塊之間）
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                obj, end = self.decoder.raw_decode(self.buf, self.pos)
+                if end < len(self.buf) or self.eof:
+                    self.pos = end
+                    return obj
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self._more()
+
+    def items(self):
+        self.expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            char = self.peek()
+            self.pos += 1
+            if char == ']':
+                return
+            if char != ',':
+                raise ValueError("JSON 格式錯誤：陣列元素之間缺少逗號")
+
+
+# 整份清單 [...] 或 {"edges": [...], ...}（其他欄位讀過就丟）
+def _iter_json(f):
+    stream = _JSONStream(f)
+    if stream.peek() != '{':
+        yield from map(_record, stream.items())
+        return
+    stream.pos += 1
+    found = False
+    while stream.peek() != '}':
+        key = stream.value()
+        stream.expect(':')
+        if key == 'edges':
+            found = True
+            yield from map(_record, stream.items())
+        else:
+            stream.value()
+        if stream.peek() == ',':
+            stream.pos += 1
+    if not found:
+        raise ValueError("JSON 裡沒有 edges 欄位")
+
+
+# 依副檔名串流讀取路網：.csv、.jsonl（每行一條邊）、.json（整份清單或 {"edges": [...]}），其他當作 edge list
+def load_edges(path):
+    builder = _Builder()
+    ext = os.path.splitext(path)[1].lower()
+    with open(path, encoding='utf-8', newline='') as f:
+        if ext == '.json':
+            records = _iter_json(f)
+        elif ext == '.jsonl':
+            records = (_record(json.loads(line)) for line in f if line.strip())
+        elif ext == '.csv':
+            records = _iter_csv(f)
+        else:
+            records = _iter_text(f)
+        for u, v, capacity, cost in records:
+            builder.add(u, v, capacity, cost)
+    return builder.build()
+
+
+if __name__ == '__main__':
+    import tempfile
+    import tracemalloc
+    import networkx as nx
+
+    rng = np.random.default_rng(0)
+    n_nodes, n_edges = 200_000, 1_000_000
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'roads.csv')
+        with open(path, 'w', newline='') as f:
+            f.write('source,target,capacity,cost\n')
+            u = rng.integers(0, n_nodes, n_edges)
+            v = rng.integers(0, n_nodes, n_edges)
+            cap = rng.integers(5, 50, n_edges)
+            cost = rng.integers(1, 20, n_edges)
+            for row in zip(u.tolist(), v.tolist(), cap.tolist(), cost.tolist()):
+                f.write('N%d,N%d,%d,%d\n' % row)
+
+        t0 = time.perf_counter()
+        graph = load_edges(path)
+        print(f"CSR 載入 {graph.n_edges} 條邊：{time.perf_counter() - t0:.2f} s，陣列 {graph.nbytes / 2**20:.1f} MiB")
+
+        graph.save(os.path.join(tmp, 'roads_csr'))
+        t0 = time.perf_counter()
+        mapped = CSRGraph.load_npy(os.path.join(tmp, 'roads_csr'), mmap=True)
+        print(f"memory map 載入：{time.perf_counter() - t0:.2f} s")
+
+        # 記憶體比較：同樣的邊放進 nx.DiGraph
+        tracemalloc.start()
+        G = nx.DiGraph()
+        for row in zip(u.tolist(), v.tolist(), cap.tolist(), cost.tolist()):
+            G.add_edge('N%d' % row[0], 'N%d' % row[1], capacity=row[2], cost=row[3])
+        nx_bytes = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        print(f"networkx 同一張圖：{nx_bytes / 2**20:.1f} MiB")
@@ -0,0 +1,126 @@
+# 公平分配模式（max-min fair / water-filling）：總需求超過路網能送的量時使用
+# LP 在這種情況直接不可行；貪婪法則是整戶放棄。這裡改成「每戶拿到的需求比例 t 一起往上加」：
+#   1. 所有還沒凍結的災戶比例一起提高到 t，能送到的最大 t 由最大流決定
+#   2. 在那個 t 下，殘量網路裡從來源走不到的災戶就是瓶頸，凍結在 t
+#   3. 剩下的災戶繼續往上加（用掉瓶頸以外還沒用完的容量），直到全部凍結或送滿
+# 每一輪的 t 用 Newton 法在最小割上求（通常 2~3 次最大流就收斂），
+# 而且每次最大流都從上一輪的流量接著推（warm start），不會每一輪、每一戶都重解一次 LP。
+# 比例決定後，再用最小成本流找出送這些量最便宜的路線。
+import time
+import numpy as np
+import lp_sparse
+import min_cost_flow
+import flow_decomposition
+from min_cost_flow import EPS
+
+
+# 殘量網路上從來源走得到的節點（不經過超級匯點，避免「把別戶的量讓出來」也算成可以增加）
+def _reachable(n, s, t, adj_start, adj_edges, to, cap):
+    seen = [False] * n
+    seen[s] = True
+    stack = [s]
+    while stack:
+        u = stack.pop()
+        for j in range(adj_start[u], adj_start[u + 1]):
+            e = adj_edges[j]
+            v = to[e]
+            if not seen[v] and v != t and cap[e] > EPS:
+                seen[v] = True
+                stack.append(v)
+    return seen
+
+
+def max_min_fair(G, demands, source='S', max_probes=1000):
+    t0 = time.perf_counter()
+    nodes, index, edges, tails, heads, capacity, cost = lp_sparse.edge_arrays(G)
+    commodities = list(demands.keys())
+    n_comm, m = len(commodities), len(edges)
+    sinks = [index[k] for k in commodities]
+    amounts = [float(demands[k]) for k in commodities]
+    n = len(nodes) + 1
+    T = len(nodes)
+    # 每戶一條 災戶 -> T 的邊，容量（= 目前允許的送達量）每一輪調整；成本全部 0，_blocking_flow 就是 Dinic 最大流
+    all_tails = np.concatenate([np.asarray(tails, dtype=np.int64), np.asarray(sinks, dtype=np.int64)])
+    all_heads = np.concatenate([np.asarray(heads, dtype=np.int64), np.full(n_comm, T, dtype=np.int64)])
+    all_cap = np.concatenate([np.asarray(capacity, dtype=np.float64), np.zeros(n_comm)])
+    adj_start, adj_edges, to, cap, cst = min_cost_flow.build_residual(
+        n, all_tails, all_heads, all_cap, np.zeros(m + n_comm))
+    pi = [0.0] * n
+    s = index[source]
+    sink_edge = [2 * (m + i) for i in range(n_comm)]
+
+    level = [0.0] * n_comm          # 每戶目前的需求比例
+    frozen = [d <= 0 for d in amounts]
+    rounds = probes = 0
+    while not all(frozen) and probes < max_probes:
+        rounds += 1
+        active = [i for i in range(n_comm) if not frozen[i]]
+        fixed = sum(level[i] * amounts[i] for i in range(n_comm) if frozen[i])
+        total_active = sum(amounts[i] for i in active)
+        base = cap
+        t = 1.0
+        # Newton：從 t = 1 往下找，每次用最小割 (a + t·b) 與需求線 (fixed + t·D) 的交點當下一個 t
+        while True:
+            probes += 1
+            cap = list(base)
+            for i in active:
+                # 反向邊的殘量就是目前已經送到的量，正向殘量 = 新上限 - 已送量
+                cap[sink_edge[i]] = max(0.0, t * amounts[i] - cap[sink_edge[i] + 1])
+            min_cost_flow._blocking_flow(n, s, T, adj_start, adj_edges, to, cap, cst, pi)
+            flow = sum(cap[e + 1] for e in sink_edge)
+            need = fixed + t * total_active
+            if flow >= need - 1e-7 * max(1.0, need) or probes >= max_probes:
+                break
+            seen = _reachable(n, s, T, adj_start, adj_edges, to, cap)
+            cut_fixed = sum(all_cap[e] for e in range(m) if seen[all_tails[e]] and not seen[all_heads[e]])
+            cut_fixed += sum(level[i] * amounts[i] for i in range(n_comm) if frozen[i] and seen[sinks[i]])
+            cut_slope = sum(amounts[i] for i in active if seen[sinks[i]])
+            if total_active - cut_slope <= EPS:
+                break
+            t = max(level[active[0]], (cut_fixed - fixed) / (total_active - cut_slope))
+        for i in active:
+            level[i] = cap[sink_edge[i] + 1] / amounts[i]
+        if t >= 1.0 - 1e-9:
+            break
+        # 瓶頸：從來源走不到的災戶再也加不上去，凍結在目前的比例
+        seen = _reachable(n, s, T, adj_start, adj_edges, to, cap)
+        stuck = [i for i in active if not seen[sinks[i]]]
+        for i in stuck or active:
+            frozen[i] = True
+
+    # 比例決定後，用最小成本流找出送這些量的最便宜路線
+    delivered_target = [min(level[i], 1.0) * amounts[i] for i in range(n_comm)]
+    flows, delivered, total_cost = min_cost_flow.solve_arrays(
+        len(nodes), tails, heads, capacity, cost, s, sinks, delivered_target)
+    edge_flow = {e: f for e, f in zip(edges, flows) if f > EPS}
+    delivered = dict(zip(commodities, delivered))
+    return {
+        'fraction': {k: delivered[k] / demands[k] if demands[k] > 0 else 1.0 for k in commodities},
+        'delivered': delivered,
+        'unmet': {k: demands[k] - delivered[k] for k in commodities if demands[k] - delivered[k] > 1e-6},
+        'edge_flow': edge_flow,
+        'flows': flow_decomposition.split_aggregate(edge_flow, delivered, source),
+        'cost': total_cost,
+        'rounds': rounds,
+        'max_flow_calls': probes,
+        'time': time.perf_counter() - t0,
+    }
+
+
+if __name__ == '__main__':
+    import network_generator
+
+    # 需求故意比容量大很多，LP 不可行
+    graph, demands = network_generator.generate('geometric', n_nodes=2500, n_sources=10, n_shelters=100,
+                                                mean_demand=30, capacity_range=(10, 40), seed=0)
+    source = network_generator.SOURCE
+    lp = lp_sparse.solve_sparse(graph, demands, source=source)
+    print(f"LP：{lp['status']}，{lp['build_time'] + lp['solve_time']:.2f} s")
+    result = max_min_fair(graph, demands, source=source)
+    fractions = sorted(result['fraction'].values())
+    print(f"公平分配：{result['time']:.2f} s，{result['rounds']} 輪、{result['max_flow_calls']} 次最大流，"
+          f"最低比例 {fractions[0]:.1%}、中位數 {fractions[len(fractions) // 2]:.1%}，"
+          f"總送達 {sum(result['delivered'].values()):.0f} / {sum(demands.values())}，成本 {result['cost']:.0f}")
+    greedy = min_cost_flow.min_cost_flow(graph, demands, source=source)
+    zero = sum(1 for k in demands if greedy['delivered'][k] <= 1e-9)
+    print(f"對照（最小成本流，只求送最多）：總送達 {sum(greedy['delivered'].values()):.0f}，{zero} 戶完全沒拿到")
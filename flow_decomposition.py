@@ -0,0 +1,110 @@
+# 流量分解：把 LP / 最小成本流算出的邊流量拆成少量「路徑 + 流量」
+# 每找到一條路徑（或一個環）至少會把一條邊的流量歸零，
+# 再配合每個節點的 current-arc 指標（用完的邊不再掃），總成本約 O(E + 路徑總長)。
+from collections import defaultdict
+
+TOL = 1e-6
+
+
+# 單一災戶：edge_flow = {(u, v): flow}，回傳 [(節點路徑, 流量), ...]
+def decompose(edge_flow, source, sink, tol=TOL):
+    out = defaultdict(list)
+    flow = {}
+    for (u, v), f in edge_flow.items():
+        if f > tol:
+            out[u].append(v)
+            flow[(u, v)] = f
+    pointer = defaultdict(int)
+    paths = []
+
+    # 找下一條還有流量的出邊；用完的邊直接跳過，不會重掃
+    def next_edge(u):
+        succ = out[u]
+        while pointer[u] < len(succ):
+            v = succ[pointer[u]]
+            if flow[(u, v)] > tol:
+                return v
+            pointer[u] += 1
+        return None
+
+    while True:
+        path = [source]
+        on_path = {source: 0}
+        while path[-1] != sink:
+            u = path[-1]
+            v = next_edge(u)
+            if v is None:
+                if u == source:
+                    return paths
+                # 數值誤差造成的死路：把進來的那一點殘量清掉，從頭再走
+                flow[(path[-2], u)] = 0.0
+                break
+            if v in on_path:
+                # 遇到環：抵銷環上的流量（不影響送達量，成本只會下降），退回環的起點
+                cycle = path[on_path[v]:] + [v]
+                f = min(flow[(a, b)] for a, b in zip(cycle, cycle[1:]))
+                for a, b in zip(cycle, cycle[1:]):
+                    flow[(a, b)] -= f
+                for n in path[on_path[v] + 1:]:
+                    del on_path[n]
+                del path[on_path[v] + 1:]
+                continue
+            on_path[v] = len(path)
+            path.append(v)
+        else:
+            f = min(flow[(a, b)] for a, b in zip(path, path[1:]))
+            for a, b in zip(path, path[1:]):
+                flow[(a, b)] -= f
+            paths.append((path, f))
+
+
+# 多災戶：flows = {(k, u, v): flow}（lp_sparse / AllocationModel 的格式）
+def decompose_all(flows, commodities, source, tol=TOL):
+    per_commodity = {k: {} for k in commodities}
+    for (k, u, v), f in flows.items():
+        if f > tol:
+            per_commodity[k][(u, v)] = f
+    return {k: decompose(per_commodity[k], source, k, tol) for k in commodities}
+
+
+# 單一來源的彙總流量（所有災戶共用一個 {(u, v): flow}）拆回每戶：
+# 每戶接一條 容量 = 送達量 的邊到虛擬匯點，路徑的倒數第二個節點就是這條路徑屬於哪一戶
+def split_aggregate(edge_flow, delivered, source, tol=TOL):
+    sink = object()  # 超級匯點，不會跟任何節點名稱衝突
+    aggregate = {e: f for e, f in edge_flow.items() if f > tol}
+    for k, d in delivered.items():
+        if d > tol:
+            aggregate[(k, sink)] = aggregate.get((k, sink), 0.0) + d
+    flows = defaultdict(float)
+    for path, f in decompose(aggregate, source, sink, tol):
+        k = path[-2]
+        for u, v in zip(path, path[1:-1]):
+            flows[(k, u, v)] += f
+    return dict(flows)
+
+
+# 給 server 用的配置表：{災戶: {'resource': 實際送達量, 'routes': [{'path': [...], 'amount': x}]}}
+def allocation_from_flows(flows, commodities, source, digits=6):
+    allocation = {}
+    for k, paths in decompose_all(flows, commodities, source).items():
+        routes = [{'path': path, 'amount': round(f, digits)} for path, f in paths]
+        allocation[k] = {
+            'resource': round(sum(f for _, f in paths), digits),
+            'routes': routes,
+        }
+    return allocation
+
+
+if __name__ == '__main__':
+    import time
+    import lp_sparse
+    import network_generator
+
+    graph, demands = network_generator.generate('grid', n_nodes=900, n_shelters=30, seed=0)
+    result = lp_sparse.solve_sparse(graph, demands, source=network_generator.SOURCE)
+    t0 = time.perf_counter()
+    allocation = allocation_from_flows(result['flows'], list(demands), network_generator.SOURCE)
+    elapsed = time.perf_counter() - t0
+    n_paths = sum(len(a['routes']) for a in allocation.values())
+    print(f"LP 求解 {result['solve_time']:.2f} s，分解 {len(result['flows'])} 個流量變數成 {n_paths} 條路徑：{elapsed*1000:.1f} ms")
+    assert all(abs(allocation[k]['resource'] - d) < 1e-4 for k, d in demands.items())
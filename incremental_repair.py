@@ -0,0 +1,169 @@
+# 啟發式配置的增量修復：單一道路中斷時，不必整個貪婪流程重跑
+# 保留目前每戶的路徑、edge_flow 與 residual_capacity，另外記錄「每條邊上有哪些災戶」，
+# 道路中斷或容量下降時只處理經過那條邊的災戶：
+#   1. 先從斷點的起點 u 做局部 Dijkstra，找一條接回原路徑下游的繞道（只看附近的節點）
+#   2. 局部找不到（超過搜尋上限）才從來源重找整條路徑，且抵達該災戶就提早停止
+# 所以修復時間跟受影響的災戶數與繞道範圍成正比，而不是跟整張路網的大小成正比。
+import heapq
+import time
+from collections import defaultdict
+
+INF = float('inf')
+
+
+class HeuristicAllocation:
+    def __init__(self, G, source='S', detour_budget=2000):
+        self.G = G
+        self.source = source
+        self.detour_budget = detour_budget  # 局部繞道搜尋最多 settle 幾個節點
+        # 容量另存一份：set_capacity() 只改這裡，不會動到呼叫端傳進來的路網
+        self.capacity = {(u, v): G[u][v]['capacity'] for u, v in G.edges()}
+        self.residual_capacity = dict(self.capacity)
+        self.edge_flow = defaultdict(float)
+        self.routes = {}              # 災戶 -> 節點路徑
+        self.amount = {}              # 災戶 -> 需求量
+        self.edge_users = defaultdict(set)  # (u, v) -> 經過的災戶
+        self.unserved = set()
+        self.settled = 0              # 最近一次操作 settle 的節點數（觀察修復範圍用）
+
+    # 與 Heuristic_Method.py 相同的貪婪流程：需求大的先配，單一路徑載完整需求
+    def allocate_all(self, demands):
+        for node, demand in sorted(demands.items(), key=lambda x: -x[1]):
+            self.amount[node] = demand
+            path = self._search(self.source, {node}, demand, blocked=())
+            if path:
+                self._assign(node, path)
+            else:
+                self.unserved.add(node)
+                print(f"⚠️ 找不到容量足夠的路徑送達 {node}（需求 {demand}）")
+
+    # 容量限制 Dijkstra：從 start 出發，settle 到 targets 中任一點就停（budget 為 settle 上限）
+    def _search(self, start, targets, demand, blocked, budget=None):
+        dist = {start: 0}
+        prev = {start: None}
+        visited = set()
+        queue = [(0, start)]
+        succ = self.G.succ
+        while queue:
+            d, u = heapq.heappop(queue)
+            if u in visited:
+                continue
+            visited.add(u)
+            self.settled += 1
+            if u in targets:
+                path = [u]
+                while prev[path[-1]] is not None:
+                    path.append(prev[path[-1]])
+                return path[::-1]
+            if budget is not None and len(visited) >= budget:
+                return None
+            for v, attr in succ[u].items():
+                if v in blocked or self.residual_capacity[(u, v)] < demand:
+                    continue
+                nd = d + attr['cost']
+                if nd < dist.get(v, INF):
+                    dist[v] = nd
+                    prev[v] = u
+                    heapq.heappush(queue, (nd, v))
+        return None
+
+    def _assign(self, node, path):
+        demand = self.amount[node]
+        for e in zip(path, path[1:]):
+            self.residual_capacity[e] -= demand
+            self.edge_flow[e] += demand
+            self.edge_users[e].add(node)
+        self.routes[node] = path
+        self.unserved.discard(node)
+
+    def _release(self, node, edges):
+        demand = self.amount[node]
+        for e in edges:
+            self.residual_capacity[e] += demand
+            self.edge_flow[e] -= demand
+            self.edge_users[e].discard(node)
+
+    # 把一戶從斷掉的邊 (u, v) 移開：優先局部繞道，不行再整條重找
+    def _reroute(self, node, u, v):
+        path = self.routes.pop(node)
+        demand = self.amount[node]
+        i = path.index(u)
+        prefix, suffix = path[:i + 1], path[i + 1:]
+        self._release(node, [(u, v)])
+        detour = self._search(u, set(suffix), demand, blocked=set(prefix[:-1]), budget=self.detour_budget)
+        if detour:
+            # 繞道接回 suffix 的 w：釋放 v..w 之間不再使用的邊
+            j = suffix.index(detour[-1])
+            self._release(node, list(zip(suffix[:j + 1], suffix[1:j + 1])))
+            new_path = prefix[:-1] + detour + suffix[j + 1:]
+            self.routes[node] = new_path
+            demand_edges = list(zip(detour, detour[1:]))
+            for e in demand_edges:
+                self.residual_capacity[e] -= demand
+                self.edge_flow[e] += demand
+                self.edge_users[e].add(node)
+            return True
+        # 局部修不好：整條釋放，從來源重找（抵達該戶就停）
+        self._release(node, list(zip(prefix, prefix[1:])) + list(zip(suffix, suffix[1:])))
+        full = self._search(self.source, {node}, demand, blocked=())
+        if full:
+            self._assign(node, full)
+            return True
+        self.unserved.add(node)
+        return False
+
+    # 道路容量改變（0 = 中斷）：只動經過這條邊、超出新容量的那些災戶；回傳修復統計
+    def set_capacity(self, u, v, capacity):
+        t0 = time.perf_counter()
+        self.settled = 0
+        e = (u, v)
+        self.residual_capacity[e] += capacity - self.capacity[e]
+        self.capacity[e] = capacity
+        moved, lost = [], []
+        # 需求小的先移走，盡量少動到大戶
+        for node in sorted(self.edge_users[e], key=lambda n: self.amount[n]):
+            if self.residual_capacity[e] >= 0:
+                break
+            (moved if self._reroute(node, u, v) else lost).append(node)
+        # 容量增加時順便試著服務之前沒配到的災戶
+        if self.residual_capacity[e] > 0 and self.unserved:
+            for node in sorted(self.unserved, key=lambda n: -self.amount[n]):
+                path = self._search(self.source, {node}, self.amount[node], blocked=())
+                if path:
+                    self._assign(node, path)
+                    moved.append(node)
+        return {'moved': moved, 'lost': lost, 'settled': self.settled, 'time': time.perf_counter() - t0}
+
+    def fail_edge(self, u, v):
+        return self.set_capacity(u, v, 0)
+
+    def cost(self):
+        return sum(f * self.G[u][v]['cost'] for (u, v), f in self.edge_flow.items() if f > 0)
+
+
+if __name__ == '__main__':
+    import copy
+    import random
+    import network_generator
+
+    graph, demands = network_generator.generate('grid', n_nodes=10_000, n_sources=10, n_shelters=300,
+                                                capacity_range=(100, 300), seed=0)
+    G = graph.to_networkx()
+    state = HeuristicAllocation(G, source=network_generator.SOURCE)
+    t0 = time.perf_counter()
+    state.allocate_all(demands)
+    print(f"完整貪婪配置：{time.perf_counter() - t0:.2f} s，成本 {state.cost():.0f}")
+
+    # 依序讓 1、5、20 條正在使用的道路中斷，看修復時間是否跟損害大小成正比
+    rng = random.Random(0)
+    for n_failures in (1, 5, 20):
+        trial = copy.deepcopy(state)
+        used = [e for e, users in trial.edge_users.items() if users and e[0] != network_generator.SOURCE]
+        t0 = time.perf_counter()
+        settled = moved = 0
+        for u, v in rng.sample(used, n_failures):
+            r = trial.fail_edge(u, v)
+            settled += r['settled']
+            moved += len(r['moved'])
+        print(f"中斷 {n_failures:2d} 條道路：修復 {(time.perf_counter() - t0)*1000:.1f} ms，"
+              f"重新安排 {moved} 戶，settle {settled} 個節點，成本 {trial.cost():.0f}")
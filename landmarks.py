@@ -0,0 +1,236 @@
+# ALT（A* + Landmarks + 三角不等式）前處理：點對點查詢不必把整張路網都掃過
+# 前處理挑 L 個地標（farthest 選法：每次挑離現有地標最遠的點），
+# 算出每個地標到所有點、所有點到每個地標的最短距離，存成 NumPy 陣列（可存檔，下次直接載入）。
+# 查詢 s -> t 時用三角不等式當 A* 的下界：
+#   d(v, t) >= d(L, t) - d(L, v)   與   d(v, t) >= d(v, L) - d(t, L)
+# 容量限制只會把邊拿掉、讓距離變長，所以不看容量算出來的下界在「容量足夠的子圖」上一樣成立。
+import heapq
+import os
+import numpy as np
+import scipy.sparse as sp
+from scipy.sparse.csgraph import dijkstra
+import lp_sparse
+from solution_cache import structure_key
+
+INF = float('inf')
+
+
+class Landmarks:
+    def __init__(self, nodes, index, edges, tails, heads, cost, from_landmark, to_landmark, landmarks):
+        self.nodes = nodes
+        self.index = index
+        self.edges = edges
+        self.cost = np.asarray(cost, dtype=np.float64)
+        # 查詢用的鄰接表（依 tail 排序的 CSR），edge_id 對回原本的邊順序
+        order = np.argsort(tails, kind='stable')
+        self.offsets = np.searchsorted(tails[order], np.arange(len(nodes) + 1)).tolist()
+        self.adj_head = heads[order].tolist()
+        self.adj_edge = order.tolist()
+        self.adj_cost = self.cost[order].tolist()
+        # 距離表 (N, L)：一列是一個節點對所有地標的距離，查詢時取一列就好
+        self.from_landmark = from_landmark
+        self.to_landmark = to_landmark
+        self.landmarks = landmarks
+        self.last_settled = 0
+        self.last_cost = INF
+
+    # 前處理：scipy 的 dijkstra 一次跑一個地標，正向、反向各 L 次
+    # arrays：已經算好的 lp_sparse.edge_arrays(G)（大路網上這一步就要好幾秒，不必重算）
+    @classmethod
+    def build(cls, G, n_landmarks=16, seed=0, arrays=None):
+        nodes, index, edges, tails, heads, capacity, cost = arrays or lp_sparse.edge_arrays(G)
+        n = len(nodes)
+        tails, heads = np.asarray(tails, dtype=np.int64), np.asarray(heads, dtype=np.int64)
+        cost = np.asarray(cost, dtype=np.float64)
+        # 成本 0 的邊（例如超級來源）要保留成「顯式 0」，不能讓 scipy 當成沒有邊；平行邊取最便宜的
+        forward = _min_matrix(n, tails, heads, cost)
+        backward = _min_matrix(n, heads, tails, cost)
+        rng = np.random.default_rng(seed)
+        chosen = []
+        from_rows, to_rows = [], []
+        nearest = None
+        # 第一個地標：離隨機起點最遠的點（隨機起點本身通常在中間，當地標沒什麼用）
+        start = dijkstra(forward, indices=int(rng.integers(n)))
+        current = int(np.argmax(np.where(np.isfinite(start), start, -1.0)))
+        for _ in range(min(n_landmarks, n)):
+            chosen.append(current)
+            d_from = dijkstra(forward, indices=current)
+            from_rows.append(d_from)
+            to_rows.append(dijkstra(backward, indices=current))
+            # 下一個地標：離目前所有地標最遠、但還走得到的點
+            reach = np.where(np.isfinite(d_from), d_from, -1.0)
+            nearest = reach if nearest is None else np.minimum(nearest, reach)
+            nearest[chosen] = -1.0
+            current = int(np.argmax(nearest))
+            if nearest[current] <= 0:
+                # 剩下的點都走不到：從還沒覆蓋的點隨機挑一個
+                candidates = np.setdiff1d(np.arange(n), chosen)
+                if len(candidates) == 0:
+                    break
+                current = int(rng.choice(candidates))
+        # float32 省一半記憶體；走不到記成 inf，查詢時當作沒有資訊
+        from_landmark = np.ascontiguousarray(np.array(from_rows, dtype=np.float32).T)
+        to_landmark = np.ascontiguousarray(np.array(to_rows, dtype=np.float32).T)
+        return cls(nodes, index, edges, tails, heads, cost, from_landmark, to_landmark,
+                   np.array(chosen, dtype=np.int64))
+
+    # 距離表只跟節點、邊、成本有關（容量會一直變，不算進 key）
+    @staticmethod
+    def graph_key(G, arrays=None):
+        nodes, index, edges, tails, heads, capacity, cost = arrays or lp_sparse.edge_arrays(G)
+        return structure_key(nodes, tails, heads, cost)
+
+    def save(self, path, key):
+        np.savez(path, key=np.array(key), landmarks=self.landmarks,
+                 from_landmark=self.from_landmark, to_landmark=self.to_landmark)
+
+    # 有存檔且是同一張圖、同樣的地標數就直接載入，否則重新前處理並存檔
+    @classmethod
+    def load_or_build(cls, G, path, n_landmarks=16, seed=0):
+        arrays = lp_sparse.edge_arrays(G)
+        key = f'{cls.graph_key(G, arrays)}:{n_landmarks}:{seed}'
+        if os.path.exists(path):
+            with np.load(path) as data:
+                if str(data['key']) == key:
+                    nodes, index, edges, tails, heads, capacity, cost = arrays
+                    return cls(nodes, index, edges, np.asarray(tails, dtype=np.int64),
+                               np.asarray(heads, dtype=np.int64), cost,
+                               data['from_landmark'], data['to_landmark'], data['landmarks'])
+        landmarks = cls.build(G, n_landmarks, seed, arrays)
+        landmarks.save(path, key)
+        return landmarks
+
+    # 所有節點到 t 的下界（只用對這次查詢最有用的 active 個地標，整個向量一次算完）
+    def lower_bounds(self, s, t, active=8):
+        with np.errstate(invalid='ignore'):
+            pair = np.maximum(self.from_landmark[t] - self.from_landmark[s],
+                              self.to_landmark[s] - self.to_landmark[t])
+        lm = np.argsort(-np.where(np.isfinite(pair), pair, -INF))[:active]
+        with np.errstate(invalid='ignore'):
+            bound = np.hstack([self.from_landmark[t, lm] - self.from_landmark[:, lm],
+                               self.to_landmark[:, lm] - self.to_landmark[t, lm]])
+        # inf - inf（地標跟兩端都不相連）不提供資訊；+inf 代表 v 根本走不到 t，查詢時直接剪掉
+        bound = np.fmax.reduce(np.where(np.isnan(bound), -INF, bound), axis=1)
+        bound = np.maximum(bound.astype(np.float64), 0.0)
+        # float32 的捨入誤差：整體減掉同一個小常數，下界不會估過頭，節點之間的先後順序也不變
+        finite = bound[np.isfinite(bound)]
+        slack = 1e-6 * max(1.0, float(finite.max()) if len(finite) else 1.0)
+        return np.maximum(bound - slack, 0.0).tolist()
+
+    # 容量限制的 A* 查詢：residual 可以是 {(u, v): 剩餘容量} 或依邊順序的陣列；
+    # 回傳跟 find_shortest_path_with_capacity 一樣的 [(u, v), ...]，找不到回傳 None
+    def shortest_path(self, source, target, demand, residual, active=8):
+        s, t = self.index[source], self.index[target]
+        h = self.lower_bounds(s, t, active)
+        if isinstance(residual, dict):
+            edges = self.edges
+            ok = lambda e: residual.get(edges[e], 0) >= demand
+        else:
+            ok = lambda e: residual[e] >= demand
+        offsets, adj_head, adj_edge, adj_cost = self.offsets, self.adj_head, self.adj_edge, self.adj_cost
+        dist = {s: 0.0}
+        prev = {s: None}
+        closed = set()
+        # f 相同時先展開 g 大的（離終點近的）節點：格狀路網等長路徑很多，不這樣會把整個矩形都掃過
+        queue = [(h[s], 0.0, s)] if h[s] < INF else []
+        while queue:
+            _, _, u = heapq.heappop(queue)
+            if u in closed:
+                continue
+            closed.add(u)
+            if u == t:
+                break
+            du = dist[u]
+            for j in range(offsets[u], offsets[u + 1]):
+                e = adj_edge[j]
+                if not ok(e):
+                    continue
+                v = adj_head[j]
+                nd = du + adj_cost[j]
+                if nd < dist.get(v, INF) and h[v] < INF:
+                    dist[v] = nd
+                    prev[v] = e
+                    heapq.heappush(queue, (nd + h[v], -nd, v))
+        self.last_settled = len(closed)
+        if t not in closed:
+            self.last_cost = INF
+            return None
+        self.last_cost = dist[t]
+        path = []
+        node = t
+        while prev[node] is not None:
+            e = prev[node]
+            path.append(self.edges[e])
+            node = self.index[self.edges[e][0]]
+        path.reverse()
+        return path
+
+
+def _min_matrix(n, rows, cols, weight):
+    order = np.lexsort((weight, cols, rows))
+    key = rows[order] * n + cols[order]
+    keep = order[np.r_[True, key[1:] != key[:-1]]]
+    indptr = np.searchsorted(rows[keep], np.arange(n + 1))
+    return sp.csr_matrix((weight[keep], cols[keep], indptr), shape=(n, n))
+
+
+# 對照組：同樣的容量限制，但沒有下界（等於 Dijkstra，抵達終點就停）；回傳 (路徑成本, settle 數)
+def plain_dijkstra(landmarks, source, target, demand, residual):
+    s, t = landmarks.index[source], landmarks.index[target]
+    offsets, adj_head, adj_edge, adj_cost = landmarks.offsets, landmarks.adj_head, landmarks.adj_edge, landmarks.adj_cost
+    dist = {s: 0.0}
+    closed = set()
+    queue = [(0.0, s)]
+    while queue:
+        d, u = heapq.heappop(queue)
+        if u in closed:
+            continue
+        closed.add(u)
+        if u == t:
+            return d, len(closed)
+        for j in range(offsets[u], offsets[u + 1]):
+            if residual[adj_edge[j]] < demand:
+                continue
+            v = adj_head[j]
+            nd = d + adj_cost[j]
+            if nd < dist.get(v, INF):
+                dist[v] = nd
+                heapq.heappush(queue, (nd, v))
+    return INF, len(closed)
+
+
+if __name__ == '__main__':
+    import tempfile
+    import time
+    import network_generator
+
+    # 隨機幾何圖比較像真實道路（格狀路網等長路徑太多，是 ALT 最不利的情況）
+    graph, demands = network_generator.generate('geometric', n_nodes=250_000, n_shelters=50, seed=0)
+    path = os.path.join(tempfile.gettempdir(), 'landmarks_geometric_250k.npz')
+    for label in ('前處理', '從檔案載入'):
+        t0 = time.perf_counter()
+        alt = Landmarks.load_or_build(graph, path, n_landmarks=16)
+        print(f"{label}：{time.perf_counter() - t0:.2f} s（距離表 {alt.from_landmark.nbytes * 2 / 2**20:.0f} MiB）")
+
+    residual = np.asarray(graph.capacity, dtype=np.float64)
+    rng = np.random.default_rng(0)
+    candidates = [i for i, name in enumerate(graph.names) if name != network_generator.SOURCE]
+    pairs = rng.choice(candidates, size=(30, 2))
+    for demand in (0, 30):
+        alt_settled = plain_settled = alt_time = plain_time = 0
+        for s, t in pairs:
+            s, t = graph.names[s], graph.names[t]
+            t0 = time.perf_counter()
+            route = alt.shortest_path(s, t, demand, residual)
+            alt_time += time.perf_counter() - t0
+            alt_settled += alt.last_settled
+            t0 = time.perf_counter()
+            best, settled = plain_dijkstra(alt, s, t, demand, residual)
+            plain_time += time.perf_counter() - t0
+            plain_settled += settled
+            # A* 找到的路徑成本必須跟 Dijkstra 一樣（下界沒有估過頭）
+            assert (route is None) == (best == INF)
+            assert route is None or abs(alt.last_cost - best) < 1e-6 * max(1.0, best)
+        n = len(pairs)
+        print(f"需求 {demand}：Dijkstra 平均 settle {plain_settled / n:.0f} 個節點（{plain_time / n*1000:.0f} ms），"
+              f"ALT {alt_settled / n:.0f} 個（{alt_time / n*1000:.0f} ms），少 {plain_settled / max(1, alt_settled):.1f} 倍")
@@ -0,0 +1,249 @@
+# 稀疏矩陣版 LP：直接組出 node-arc incidence matrix 交給 HiGHS 求解
+# 原本 LP_method.py 的寫法是每個 (災戶, 邊) 一個 cp.Variable，
+# 流量守恆再用 list comprehension 掃過所有邊，建模就是 O(K·N·E) 的 Python 迴圈。
+# 這裡把 incidence matrix 只建一次，再用 kron 依災戶堆疊，建模成本幾乎只剩 numpy/scipy。
+import time
+import numpy as np
+import scipy.sparse as sp
+from scipy.optimize import linprog
+
+
+# 從 nx.DiGraph 或 CSRGraph 取出節點索引與邊陣列（tail, head, capacity, cost）
+def edge_arrays(G):
+    if hasattr(G, 'edge_arrays'):
+        return G.edge_arrays()
+    nodes = list(G.nodes())
+    index = {n: i for i, n in enumerate(nodes)}
+    edges = list(G.edges())
+    tails = np.fromiter((index[u] for u, v in edges), dtype=np.int64, count=len(edges))
+    heads = np.fromiter((index[v] for u, v in edges), dtype=np.int64, count=len(edges))
+    capacity = np.fromiter((G[u][v]['capacity'] for u, v in edges), dtype=np.float64, count=len(edges))
+    cost = np.fromiter((G[u][v]['cost'] for u, v in edges), dtype=np.float64, count=len(edges))
+    return nodes, index, edges, tails, heads, capacity, cost
+
+
+# node-arc incidence matrix（N x E）：流出 +1、流入 -1
+def incidence_matrix(n_nodes, tails, heads):
+    n_edges = len(tails)
+    cols = np.arange(n_edges)
+    rows = np.concatenate([tails, heads])
+    data = np.concatenate([np.ones(n_edges), -np.ones(n_edges)])
+    return sp.csr_matrix((data, (rows, np.concatenate([cols, cols]))), shape=(n_nodes, n_edges))
+
+
+# 供需向量（N x K）：來源 +d_k、災戶 -d_k，與 incidence matrix 的正負號一致
+def supply_matrix(n_nodes, source, sinks, amounts):
+    b = np.zeros((n_nodes, len(sinks)))
+    k = np.arange(len(sinks))
+    b[source, k] += amounts
+    b[sinks, k] -= amounts
+    return b
+
+
+# 組出 linprog 需要的矩陣；變數排列為 x[k*E + e]（依災戶分塊）
+# unmet_penalty 不為 None 時，最後再加 K 個「未送達量」變數（單位成本 = unmet_penalty），
+# 容量不夠時 LP 仍然可行，只是把送不到的量記在這些變數上
+def build_sparse_lp(n_nodes, tails, heads, capacity, cost, source, sinks, amounts, unmet_penalty=None):
+    n_edges = len(tails)
+    n_comm = len(sinks)
+    inc = incidence_matrix(n_nodes, tails, heads)
+    A_eq = sp.kron(sp.identity(n_comm, format='csr'), inc, format='csr')
+    b_eq = supply_matrix(n_nodes, source, sinks, amounts).T.ravel()
+    A_ub = sp.kron(np.ones((1, n_comm)), sp.identity(n_edges, format='csr'), format='csr')
+    b_ub = np.asarray(capacity, dtype=np.float64)
+    c = np.tile(np.asarray(cost, dtype=np.float64), n_comm)
+    if unmet_penalty is not None:
+        # 未送達量 u_k 等於一條 來源->災戶 的虛擬邊：第 k 塊的來源列 +1、災戶列 -1
+        k = np.arange(n_comm)
+        rows = np.concatenate([k * n_nodes + source, k * n_nodes + np.asarray(sinks)])
+        data = np.concatenate([np.ones(n_comm), -np.ones(n_comm)])
+        slack = sp.csr_matrix((data, (rows, np.concatenate([k, k]))), shape=(n_comm * n_nodes, n_comm))
+        A_eq = sp.hstack([A_eq, slack], format='csr')
+        A_ub = sp.hstack([A_ub, sp.csr_matrix((n_edges, n_comm))], format='csr')
+        c = np.concatenate([c, np.full(n_comm, float(unmet_penalty))])
+    return c, A_eq, b_eq, A_ub, b_ub
+
+
+# 未送達量的懲罰：比任何一條路徑的成本都高，LP 只會在真的送不到時才用
+def default_unmet_penalty(cost):
+    return float(np.sum(cost)) + 1.0
+
+
+# 把 (K*E) 的解向量轉回跟 LP_method.py 一樣的 {(k, u, v): flow} 格式
+def unpack_flows(x, commodities, edges):
+    X = np.asarray(x).reshape(len(commodities), len(edges))
+    flows = {}
+    for i, k in enumerate(commodities):
+        for e, (u, v) in enumerate(edges):
+            flows[(k, u, v)] = float(X[i, e])
+    return flows
+
+
+# 稀疏後端：scipy.optimize.linprog + HiGHS
+# cache（solution_cache.SolutionCache）不為 None 時：相同輸入直接讀檔；
+# 同一張圖只改了容量、舊解仍可由對偶價格證明最佳時也不重解；其餘才真的解，再把主/對偶解存回去。
+# 回傳的 'cache' 是 'hit' / 'reused' / 'miss'（沒給 cache 時為 None）
+def solve_sparse(G, demands, source='S', cache=None):
+    t0 = time.perf_counter()
+    nodes, index, edges, tails, heads, capacity, cost = edge_arrays(G)
+    commodities = list(demands.keys())
+    sinks = np.array([index[k] for k in commodities], dtype=np.int64)
+    amounts = np.array([demands[k] for k in commodities], dtype=np.float64)
+    cache_status = None
+    if cache is not None:
+        import solution_cache
+        key, structure_key = solution_cache.fingerprint(
+            nodes, tails, heads, capacity, cost, source, commodities, amounts)
+        entry = cache.get(key)
+        cache_status = 'hit'
+        if entry is None:
+            entry = cache.latest(structure_key)
+            cache_status = 'reused'
+            if entry is not None and solution_cache.still_optimal(entry, capacity, amounts):
+                cache.put(key, structure_key, entry['x'], entry['capacity_price'], entry['potential'],
+                          entry['objective'], capacity, amounts)
+            else:
+                entry = None
+        if entry is not None:
+            return {
+                'status': 'optimal',
+                'objective': entry['objective'],
+                'flows': unpack_flows(entry['x'], commodities, edges),
+                'build_time': time.perf_counter() - t0,
+                'solve_time': 0.0,
+                'cache': cache_status,
+            }
+        cache_status = 'miss'
+    c, A_eq, b_eq, A_ub, b_ub = build_sparse_lp(
+        len(nodes), tails, heads, capacity, cost, index[source], sinks, amounts)
+    t1 = time.perf_counter()
+    res = linprog(c, A_ub=A_ub, b_ub=b_ub, A_eq=A_eq, b_eq=b_eq,
+                  bounds=(0, None), method='highs')
+    t2 = time.perf_counter()
+    if cache is not None and res.status == 0:
+        # linprog 的 <= 限制對偶值是非正的，存成非負的「容量價格」
+        cache.put(key, structure_key, res.x, -res.ineqlin.marginals, res.eqlin.marginals,
+                  res.fun, capacity, amounts)
+    return {
+        'status': 'optimal' if res.status == 0 else res.message,
+        'objective': float(res.fun) if res.status == 0 else None,
+        'flows': unpack_flows(res.x, commodities, edges) if res.status == 0 else {},
+        'build_time': t1 - t0,
+        'solve_time': t2 - t1,
+        'cache': cache_status,
+    }
+
+
+# 向量化 cvxpy：整個問題只用一個 (E x K) 的變數
+def solve_vectorized_cvxpy(G, demands, source='S'):
+    import cvxpy as cp
+    t0 = time.perf_counter()
+    nodes, index, edges, tails, heads, capacity, cost = edge_arrays(G)
+    commodities = list(demands.keys())
+    sinks = np.array([index[k] for k in commodities], dtype=np.int64)
+    amounts = np.array([demands[k] for k in commodities], dtype=np.float64)
+    inc = incidence_matrix(len(nodes), tails, heads)
+    X = cp.Variable((len(edges), len(commodities)), nonneg=True)
+    constraints = [
+        cp.sum(X, axis=1) <= capacity,
+        inc @ X == supply_matrix(len(nodes), index[source], sinks, amounts),
+    ]
+    prob = cp.Problem(cp.Minimize(cp.sum(cost @ X)), constraints)
+    t1 = time.perf_counter()
+    prob.solve()
+    t2 = time.perf_counter()
+    ok = prob.status == cp.OPTIMAL
+    return {
+        'status': prob.status,
+        'objective': float(prob.value) if ok else None,
+        'flows': unpack_flows(X.value.T, commodities, edges) if ok else {},
+        'build_time': t1 - t0,
+        'solve_time': t2 - t1,
+    }
+
+
+# 參考實作：保留原本逐變數建模的 cvxpy 寫法，用來對照稀疏後端
+def solve_reference(G, demands, source='S'):
+    import cvxpy as cp
+    t0 = time.perf_counter()
+    commodities = list(demands.keys())
+    edges = list(G.edges())
+    nodes = list(G.nodes())
+    flow_vars = {
+        (k, u, v): cp.Variable(nonneg=True)
+        for k in commodities for (u, v) in edges
+    }
+    constraints = []
+    for (u, v) in edges:
+        total_flow = cp.sum([flow_vars[k, u, v] for k in commodities])
+        constraints.append(total_flow <= G[u][v]['capacity'])
+    for k in commodities:
+        for n in nodes:
+            inflow = cp.sum([flow_vars[k, u, n] for (u, v) in edges if v == n])
+            outflow = cp.sum([flow_vars[k, n, v] for (u, v) in edges if u == n])
+            if n == source:
+                constraints.append(outflow - inflow == demands[k])
+            elif n == k:
+                constraints.append(inflow - outflow == demands[k])
+            else:
+                constraints.append(inflow == outflow)
+    objective = cp.Minimize(cp.sum([
+        G[u][v]['cost'] * flow_vars[k, u, v]
+        for (k, u, v) in flow_vars
+    ]))
+    prob = cp.Problem(objective, constraints)
+    t1 = time.perf_counter()
+    prob.solve()
+    t2 = time.perf_counter()
+    ok = prob.status == cp.OPTIMAL
+    return {
+        'status': prob.status,
+        'objective': float(prob.value) if ok else None,
+        'flows': {key: float(var.value) for key, var in flow_vars.items()} if ok else {},
+        'build_time': t1 - t0,
+        'solve_time': t2 - t1,
+    }
+
+
+# 交叉檢查：稀疏後端與 cvxpy 參考解的目標值、每條邊總流量、守恆與容量都要一致
+def check_against_reference(G, demands, source='S', tol=1e-4):
+    sparse = solve_sparse(G, demands, source)
+    ref = solve_reference(G, demands, source)
+    if sparse['objective'] is None or ref['objective'] is None:
+        return sparse['objective'] is None and ref['objective'] is None
+    scale = max(1.0, abs(ref['objective']))
+    if abs(sparse['objective'] - ref['objective']) > tol * scale:
+        return False
+    # 最佳解可能不唯一，所以不比較個別 (k, u, v)，只檢查可行性
+    for (u, v) in G.edges():
+        total = sum(sparse['flows'][(k, u, v)] for k in demands)
+        if total > G[u][v]['capacity'] + tol * scale:
+            return False
+    for k, d in demands.items():
+        inflow = sum(sparse['flows'][(k, u, k)] for u in G.predecessors(k))
+        outflow = sum(sparse['flows'][(k, k, v)] for v in G.successors(k))
+        if abs(inflow - outflow - d) > tol * scale:
+            return False
+    return True
+
+
+if __name__ == '__main__':
+    import networkx as nx
+    G = nx.DiGraph()
+    G.add_edges_from([
+        ('S', 'A', {'capacity': 15, 'cost': 5}),
+        ('S', 'C', {'capacity': 10, 'cost': 3}),
+        ('A', 'B', {'capacity': 10, 'cost': 2}),
+        ('C', 'D', {'capacity': 10, 'cost': 4}),
+        ('B', 'H1', {'capacity': 10, 'cost': 1}),
+        ('D', 'H2', {'capacity': 10, 'cost': 1}),
+        ('A', 'D', {'capacity': 5, 'cost': 3}),
+        ('C', 'B', {'capacity': 5, 'cost': 2}),
+    ])
+    demands = {'H1': 8, 'H2': 7}
+    for name, solver in [('sparse/HiGHS', solve_sparse),
+                         ('cvxpy 向量化', solve_vectorized_cvxpy),
+                         ('cvxpy 參考', solve_reference)]:
+        r = solver(G, demands)
+        print(f"{name:12s} 目標值={r['objective']}  建模 {r['build_time']*1000:.2f} ms  求解 {r['solve_time']*1000:.2f} ms")
+    print("與參考解一致：", check_against_reference(G, demands))
@@ -0,0 +1,233 @@
+# 指揮中心的執行期指標：Prometheus text format，從另一個只聽本機的 port 提供（GET /metrics）
+# 以前只有 print，慢的時候分不出是 accept、JSON 解析、求解還是寫 socket；這裡把每個階段的耗時都記成直方圖。
+#   - 記錄只做整數 / 浮點數加法和一次 bisect，不拿 lock：asyncio server 全部在 event loop 執行緒上更新；
+#     多執行緒的 run_server_v1.py 偶爾會少算一次，監控用途可以接受，換來整條請求路徑不多一個 lock
+#   - 輸出（render）在 HTTP 執行緒裡做，只讀數字，不會卡住 server
+#   - Counter / Gauge 可以給一個函式（例如 CPU 時間、執行緒數），被抓取時才計算
+# 指標名稱都以 commandcenter_ 開頭；下面先定義好兩種 server 共用的指標。
+#
+# 範例：
+#   curl -s http://127.0.0.1:9091/metrics
+import bisect
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+METRICS_HOST = '127.0.0.1'
+METRICS_PORT = 9091
+# 延遲直方圖的上界（秒）：單戶查詢是幾十 µs，求解可能到幾秒
+LATENCY_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+registry = []
+
+
+class _Value:
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def dec(self, amount=1):
+        self.value -= amount
+
+    def set(self, value):
+        self.value = value
+
+
+class _Histogram:
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)   # 每一格各自的次數，輸出時才累加
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels_names = tuple(labels)
+        self.children = {}
+        registry.append(self)
+
+    # 帶標籤的指標：labels('lookup') 回傳那一組標籤的計數器；熱路徑上先存起來重複用
+    def labels(self, *values):
+        child = self.children.get(values)
+        if child is None:
+            child = self.children.setdefault(values, self._new())
+        return child
+
+    def _label_text(self, values, extra=()):
+        pairs = list(zip(self.labels_names, values)) + list(extra)
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        for values, child in sorted(list(self.children.items())):
+            lines.extend(self._render_child(values, child))
+        return lines
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def __init__(self, name, help, labels=(), fn=None):
+        self.fn = fn
+        super().__init__(name, help, labels)
+        if not labels:
+            self.labels()
+
+    def _new(self):
+        return _Value()
+
+    def inc(self, amount=1):
+        self.children[()].value += amount
+
+    def _render_child(self, values, child):
+        value = self.fn() if self.fn is not None else child.value
+        return [f'{self.name}{self._label_text(values)} {_number(value)}']
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def dec(self, amount=1):
+        self.children[()].value -= amount
+
+    def set(self, value):
+        self.children[()].value = value
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        super().__init__(name, help, labels)
+        if not labels:
+            self.labels()
+
+    def _new(self):
+        return _Histogram(self.buckets)
+
+    def observe(self, value):
+        self.children[()].observe(value)
+
+    def _render_child(self, values, child):
+        counts = list(child.counts)
+        lines, total = [], 0
+        for bound, count in zip(list(self.buckets) + ['+Inf'], counts):
+            total += count
+            le = bound if bound == '+Inf' else _number(bound)
+            lines.append(f'{self.name}_bucket{self._label_text(values, [("le", le)])} {total}')
+        lines.append(f'{self.name}_sum{self._label_text(values)} {_number(child.sum)}')
+        lines.append(f'{self.name}_count{self._label_text(values)} {total}')
+        return lines
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render():
+    lines = []
+    for metric in list(registry):
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+def _open_fds():
+    try:
+        return len(os.listdir('/proc/self/fd'))
+    except OSError:
+        return 0
+
+
+# 行程層級（Prometheus 慣用的名稱）
+Counter('process_cpu_seconds_total', 'CPU time used by this process (user + system)', fn=time.process_time)
+Gauge('process_open_fds', 'Open file descriptors', fn=_open_fds)
+Gauge('process_start_time_seconds', 'Process start time (unix seconds)').set(time.time())
+THREADS = Gauge('commandcenter_threads', 'Live OS threads in this process', fn=threading.active_count)
+# asyncio server 啟動時把 fn 換成「event loop 上的 task 數」
+TASKS = Gauge('commandcenter_tasks', 'Live asyncio tasks (one per connection plus background tasks)')
+
+# 連線與請求
+CONNECTIONS_ACTIVE = Gauge('commandcenter_connections_active', 'Open client connections')
+CONNECTIONS = Counter('commandcenter_connections_total', 'Accepted client connections')
+REJECTED = Counter('commandcenter_connections_rejected_total', 'Connections refused (over the connection limit)')
+REQUESTS = Counter('commandcenter_requests_total', 'Requests by kind', ['kind'])
+ERRORS = Counter('commandcenter_errors_total', 'Errors by kind', ['kind'])
+# 每個請求經過的階段：accept = 連線建立到收到第一個 byte、parse = 解碼請求、
+# lookup = 查快照 / 產生回覆（更新請求包含重解）、send = 寫出回覆並等傳送緩衝區消化
+STAGE = Histogram('commandcenter_stage_seconds', 'Per-request time spent in each stage', ['stage'])
+# 准入控制（admission.py）：回「忙碌中」擋掉的連線 / 請求（依原因），以及等 worker 的佇列長度（run_server_v1.py）
+SHED = Counter('commandcenter_shed_total', 'Connections or requests answered with a busy reply, by reason', ['reason'])
+QUEUE_DEPTH = Gauge('commandcenter_queue_depth', 'Ready connections waiting for a worker thread')
+
+# 求解與快照
+LP_BUILD = Histogram('commandcenter_lp_build_seconds', 'Time to build the LP model')
+LP_SOLVE = Histogram('commandcenter_lp_solve_seconds', 'Time per solve / re-solve', ['kind', 'cache'])
+SNAPSHOT_BUILD = Histogram('commandcenter_snapshot_build_seconds', 'Time to pre-serialize an allocation snapshot')
+SNAPSHOT_VERSION = Gauge('commandcenter_snapshot_version', 'Version of the snapshot being served')
+HOUSEHOLDS = Gauge('commandcenter_households', 'Households in the snapshot being served')
+
+# 訂閱推播
+SUBSCRIBED = Gauge('commandcenter_subscribed_households', 'Households with at least one subscriber')
+PUSHES = Counter('commandcenter_pushes_total', 'Push frames written to subscribers')
+FANOUT = Histogram('commandcenter_fanout_seconds', 'Time to push one snapshot version to all subscribers')
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/metrics', '/'):
+            self.send_error(404)
+            return
+        body = render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+# 在背景執行緒提供 /metrics；預設只聽 127.0.0.1（指標不對外公開）
+def serve(port=METRICS_PORT, host=METRICS_HOST):
+    server = ThreadingHTTPServer((host, port), _Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+    return server
+
+
+if __name__ == '__main__':
+    import urllib.request
+
+    lookup = STAGE.labels('lookup')
+    t0 = time.perf_counter()
+    for i in range(100000):
+        lookup.observe(i * 1e-7)
+    per_observe = (time.perf_counter() - t0) / 100000
+    REQUESTS.labels('name').inc()
+    server = serve(0)
+    with urllib.request.urlopen(f'http://127.0.0.1:{server.server_address[1]}/metrics') as r:
+        text = r.read().decode()
+    assert 'commandcenter_stage_seconds_count{stage="lookup"} 100000' in text
+    assert 'commandcenter_requests_total{kind="name"} 1' in text
+    print(text[:text.index('# HELP commandcenter_connections_active')])
+    print(f"observe() 每次 {per_observe * 1e6:.2f} µs")
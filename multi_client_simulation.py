@@ -1,34 +1,293 @@
-# simulate_clients.py
-import socket
+# 壓力測試 / 延遲 benchmark（asyncio）：部署前先量指揮中心撐得住多少災戶
+#   closed loop：N 個 client，各自一條長連線，收到回覆才送下一個（量「N 個人同時用」時的吞吐量）
+#   open loop：固定每秒送 R 個請求（分散在 --connections 條長連線上 pipelining），不管前一個回來了沒；
+#              延遲從「排定要送出的時間」開始算，server 跟不上時排隊的時間也算進去（不會低估尾端延遲）
+# 先 ramp（closed：client 陸續加入；open：速率從 0 線性升到 R），再維持 --duration 秒，只統計維持階段。
+# 輸出吞吐量、p50 / p95 / p99 / max 延遲、延遲分布直方圖、錯誤 / 逾時次數；--json 寫成機器可讀的檔案（- = stdout）。
+# server 回「忙碌中」（admission.py 的准入控制）另外計算，不算進正確回覆，也不算錯誤。
+#
+# 範例：
+#   python multi_client_simulation.py                                   # 3 個 client 跑 5 秒
+#   python multi_client_simulation.py --mode closed --concurrency 2000 --ramp 5 --duration 30
+#   python multi_client_simulation.py --mode open --rate 20000 --connections 64 --json result.json
+#   python multi_client_simulation.py --request batch --batch 100 --encoding binary
+import argparse
+import asyncio
+import bisect
+import itertools
 import json
-import threading
+import random
+import resource
+import sys
 import time
+import protocol
 
-HOST = '127.0.0.1'
-PORT = 9000
+# 延遲直方圖的上界（秒），最後一格是 +inf
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
 
-# 要模擬的災戶清單（包含一個非法災戶）
-clients = ['H1', 'H2', 'H3']
 
-def simulate_client(name):
+class Recorder:
+    def __init__(self, start, hold_start, hold_end):
+        self.start = start
+        self.hold_start = hold_start
+        self.hold_end = hold_end
+        self.latencies = []
+        self.counts = {'ok': 0, 'error_reply': 0, 'busy': 0, 'error': 0, 'timeout': 0}
+        self.completed = {'ok': 0, 'error_reply': 0, 'busy': 0}   # 在維持階段內「收到」的回覆（算吞吐量）
+        self.timeline = {}
+        self.lag_total = self.lag_max = 0.0
+        self.lag_count = 0
+
+    # open loop：實際送出比排定時間晚了多少（太大代表壓測端自己跟不上，結果不能當 server 的數字）
+    def record_lag(self, lag):
+        self.lag_total += lag
+        self.lag_count += 1
+        self.lag_max = max(self.lag_max, lag)
+
+    # sent = 開始（或排定）送出的時間；只有在維持階段送出的請求才算進統計
+    def record(self, sent, outcome, latency=None):
+        now = time.perf_counter()
+        second = int(now - self.start)
+        self.timeline[second] = self.timeline.get(second, 0) + (outcome == 'ok')
+        if outcome in self.completed and self.hold_start <= now < self.hold_end:
+            self.completed[outcome] += 1
+        if not self.hold_start <= sent < self.hold_end:
+            return
+        self.counts[outcome] += 1
+        if latency is not None:
+            self.latencies.append(latency)
+
+    def summary(self):
+        duration = self.hold_end - self.hold_start
+        lat = sorted(self.latencies)
+        pct = lambda p: lat[min(len(lat) - 1, int(p / 100 * len(lat)))] * 1000 if lat else None
+        histogram = [0] * (len(BUCKETS) + 1)
+        for x in lat:
+            histogram[bisect.bisect_left(BUCKETS, x)] += 1
+        return {
+            'duration_s': duration,
+            'requests': sum(self.counts.values()),
+            'throughput_rps': sum(self.completed.values()) / duration,
+            'goodput_rps': self.completed['ok'] / duration,
+            'counts': dict(self.counts),
+            'send_lag_ms': {'mean': self.lag_total / self.lag_count * 1000 if self.lag_count else None,
+                            'max': self.lag_max * 1000 if self.lag_count else None},
+            'latency_ms': {'mean': sum(lat) / len(lat) * 1000 if lat else None,
+                           'p50': pct(50), 'p95': pct(95), 'p99': pct(99), 'max': lat[-1] * 1000 if lat else None},
+            'histogram': [{'le_ms': (b * 1000 if b is not None else None), 'count': c}
+                          for b, c in zip(list(BUCKETS) + [None], histogram)],
+            'timeline_ok_per_s': [self.timeline.get(s, 0) for s in range(max(self.timeline, default=-1) + 1)],
+        }
+
+
+# 回覆裡有 "error"（未知災戶、pending...）就算錯誤回覆，不必完整解碼；server 忙碌中另外算
+def classify(payload):
+    if b'"error"' not in payload[:256]:
+        return 'ok'
+    return 'busy' if b'"status": "busy"' in payload[:64] else 'error_reply'
+
+
+def make_requests(args, names):
+    rng = random.Random(args.seed)
+    if args.request == 'prefix':
+        return lambda: {'prefix': args.prefix}
+    if args.request == 'batch':
+        size = min(args.batch, len(names))
+        return lambda: {'names': rng.sample(names, size)}
+    return lambda: {'name': rng.choice(names)}
+
+
+# --source 給了好幾個位址時，每條新連線輪流用（模擬來自不同 IP 的災戶）
+def next_source(args):
+    return next(args.sources) if args.sources is not None else None
+
+
+async def discover_names(args):
+    if args.names:
+        return args.names
+    try:
+        conn = await protocol.AsyncConnection.open(args.host, args.port, source=next_source(args))
+        reply = await asyncio.wait_for(conn.request({'prefix': ''}), args.timeout)
+        await conn.close()
+        if reply.get('allocations'):
+            return sorted(reply['allocations'])
+    except (OSError, asyncio.TimeoutError):
+        pass
+    return ['H1', 'H2']
+
+
+# 單一請求：長連線上送出、等回覆；per_request 時每次都重新連線（量握手成本或連線洪流）
+async def one_request(args, conn, request, sent, recorder):
     try:
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-            s.connect((HOST, PORT))
-            s.sendall(json.dumps({'name': name}).encode())
-            data = s.recv(1024).decode()
-            response = json.loads(data)
-            print(f"[Client:{name}] 收到回應：{response}")
-    except Exception as e:
-        print(f"[Client:{name}] 錯誤：{e}")
-
-# 同時啟動所有 client
-threads = []
-for name in clients:
-    t = threading.Thread(target=simulate_client, args=(name,))
-    threads.append(t)
-    t.start()
-    time.sleep(0.2)  # 小間隔模擬較真實的連線情況
-
-# 等待所有 thread 結束
-for t in threads:
-    t.join()
+        if conn is None:
+            conn = await asyncio.wait_for(
+                protocol.AsyncConnection.open(args.host, args.port, args.encoding, decode=False, source=next_source(args)),
+                args.timeout)
+            try:
+                payload = await asyncio.wait_for(conn.request(request), args.timeout)
+            finally:
+                await conn.close()
+        else:
+            future = await conn.send(request)
+            recorder.record_lag(time.perf_counter() - sent)
+            payload = await asyncio.wait_for(future, args.timeout)
+    except asyncio.TimeoutError:
+        recorder.record(sent, 'timeout')
+        return False
+    except protocol.ServerBusy:
+        # 連線在收下之前就被拒絕（連線數已達上限）
+        recorder.record(sent, 'busy', time.perf_counter() - sent)
+        return False
+    except OSError:
+        recorder.record(sent, 'error')
+        return False
+    recorder.record(sent, classify(payload), time.perf_counter() - sent)
+    return True
+
+
+async def open_conn(args):
+    if args.connect_per_request:
+        return None
+    return await protocol.AsyncConnection.open(args.host, args.port, args.encoding, decode=False,
+                                               source=next_source(args))
+
+
+async def closed_loop(args, next_request, recorder):
+    end = recorder.hold_end
+
+    async def client(i):
+        await asyncio.sleep(args.ramp * i / args.concurrency)
+        conn = None
+        while time.perf_counter() < end:
+            try:
+                if conn is None or conn.closed:
+                    conn = await open_conn(args)
+            except OSError as e:
+                recorder.record(time.perf_counter(), 'busy' if isinstance(e, protocol.ServerBusy) else 'error')
+                await asyncio.sleep(0.1)
+                continue
+            ok = await one_request(args, conn, next_request(), time.perf_counter(), recorder)
+            if not ok and conn is not None:
+                # 逾時之後這條連線上的回覆順序已經不可靠，換一條
+                await conn.close()
+                conn = None
+        if conn is not None:
+            await conn.close()
+
+    await asyncio.gather(*(client(i) for i in range(args.concurrency)))
+
+
+async def open_loop(args, next_request, recorder):
+    conns = [] if args.connect_per_request else \
+        await asyncio.gather(*(open_conn(args) for _ in range(args.connections)))
+    rate, ramp = args.rate, args.ramp
+    ramp_requests = rate * ramp / 2
+    start = recorder.start
+    tasks = set()
+    k = 0
+    while True:
+        # 第 k 個請求排定的時間：ramp 期間速率 = rate·t/ramp，所以累積數 = rate·t²/(2·ramp)
+        offset = (2 * ramp * k / rate) ** 0.5 if k < ramp_requests else ramp + (k - ramp_requests) / rate
+        due = start + offset
+        if due >= recorder.hold_end:
+            break
+        delay = due - time.perf_counter()
+        if delay > 0.001:
+            await asyncio.sleep(delay)
+        if conns:
+            conn = conns[k % len(conns)]
+            if conn.closed:
+                try:
+                    conn = conns[k % len(conns)] = await open_conn(args)
+                except OSError as e:
+                    recorder.record(due, 'busy' if isinstance(e, protocol.ServerBusy) else 'error')
+                    k += 1
+                    continue
+        else:
+            conn = None
+        task = asyncio.ensure_future(one_request(args, conn, next_request(), due, recorder))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+        k += 1
+    if tasks:
+        await asyncio.wait(tasks)
+    await asyncio.gather(*(c.close() for c in conns))
+
+
+async def run(args):
+    args.sources = itertools.cycle(args.source) if args.source else None
+    names = await discover_names(args)
+    next_request = make_requests(args, names)
+    start = time.perf_counter()
+    recorder = Recorder(start, start + args.ramp, start + args.ramp + args.duration)
+    if args.mode == 'closed':
+        await closed_loop(args, next_request, recorder)
+    else:
+        await open_loop(args, next_request, recorder)
+    result = recorder.summary()
+    result['config'] = {k: v for k, v in vars(args).items() if k not in ('json', 'names', 'sources')}
+    result['households'] = len(names)
+    return result
+
+
+def report(result):
+    lat = result['latency_ms']
+    fmt = lambda v: f'{v:.2f}' if v is not None else '-'
+    counts = result['counts']
+    print(f"[{result['config']['mode']}] {result['duration_s']:.0f} s：{result['requests']} 個請求，"
+          f"吞吐量 {result['throughput_rps']:.0f} req/s（正確回覆 {result['goodput_rps']:.0f} req/s）")
+    print(f"  延遲 ms：p50 {fmt(lat['p50'])}  p95 {fmt(lat['p95'])}  p99 {fmt(lat['p99'])}  max {fmt(lat['max'])}")
+    print(f"  忙碌中 {counts['busy']}，錯誤回覆 {counts['error_reply']}，連線錯誤 {counts['error']}，逾時 {counts['timeout']}")
+    lag = result['send_lag_ms']
+    if result['config']['mode'] == 'open' and lag['max'] is not None and lag['max'] > 10:
+        print(f"  ⚠️ 壓測端送出落後排程最多 {lag['max']:.0f} ms（平均 {lag['mean']:.1f} ms）：目標速率超過壓測端能力，"
+              f"延遲包含 client 端排隊")
+    peak = max((b['count'] for b in result['histogram']), default=0)
+    for b in result['histogram']:
+        if b['count']:
+            label = f"<= {b['le_ms']:g} ms" if b['le_ms'] is not None else '> 10000 ms'
+            print(f"  {label:>12s} {b['count']:9d} {'█' * max(1, round(40 * b['count'] / peak))}")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='指揮中心壓力測試')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9000)
+    parser.add_argument('--source', nargs='+', help='從這些本機位址連線，輪流使用（例如 127.0.0.2，模擬其他來源 IP）')
+    parser.add_argument('--mode', choices=('closed', 'open'), default='closed')
+    parser.add_argument('--concurrency', type=int, default=3, help='closed loop 的 client 數')
+    parser.add_argument('--rate', type=float, default=1000, help='open loop 每秒請求數')
+    parser.add_argument('--connections', type=int, default=16, help='open loop 使用的長連線數')
+    parser.add_argument('--connect-per-request', action='store_true', help='每個請求都重新連線')
+    parser.add_argument('--ramp', type=float, default=1.0, help='暖身秒數（不列入統計）')
+    parser.add_argument('--duration', type=float, default=5.0, help='維持秒數')
+    parser.add_argument('--timeout', type=float, default=5.0)
+    parser.add_argument('--request', choices=('name', 'batch', 'prefix'), default='name')
+    parser.add_argument('--names', nargs='+', help='查詢的災戶（預設向 server 查全部災戶）')
+    parser.add_argument('--batch', type=int, default=100)
+    parser.add_argument('--prefix', default='')
+    parser.add_argument('--encoding', choices=('json', 'binary'), default='json')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help='結果寫成 JSON（- 代表 stdout）')
+    return parser
+
+
+def main():
+    args = build_parser().parse_args()
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+    result = asyncio.run(run(args))
+    if args.json == '-':
+        json.dump(result, sys.stdout, indent=2, ensure_ascii=False)
+        print()
+        return
+    report(result)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+        print(f"結果已寫入 {args.json}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+# 合成災區路網產生器：grid、random geometric、scale-free 三種拓樸
+# 同一組參數 + seed 一定產生同一張圖，benchmark 才能重現、抓 regression。
+# 物資來源（depot）可以有好幾個，統一接到超級來源 'S'（容量不設限、成本 0），
+# 所以現有的單一來源 LP / 最小成本流都能直接用；避難所（shelter）就是需求點。
+import numpy as np
+from scipy.spatial import cKDTree
+from csr_graph import CSRGraph
+
+SOURCE = 'S'
+TOPOLOGIES = ('grid', 'geometric', 'scale_free')
+DISTRIBUTIONS = ('uniform', 'poisson', 'lognormal')
+
+
+# 格狀路網：每個格點與上下左右雙向相連，成本 = 距離
+def _grid(n_nodes, rng):
+    side = max(2, int(round(np.sqrt(n_nodes))))
+    ids = np.arange(side * side).reshape(side, side)
+    right = np.stack([ids[:, :-1].ravel(), ids[:, 1:].ravel()], axis=1)
+    down = np.stack([ids[:-1, :].ravel(), ids[1:, :].ravel()], axis=1)
+    pairs = np.concatenate([right, down])
+    xy = np.stack(np.divmod(np.arange(side * side), side), axis=1).astype(np.float64)
+    return side * side, pairs, xy
+
+
+# 隨機幾何圖：單位正方形內撒點，距離小於半徑就連線（半徑取到平均度數約 6）
+def _geometric(n_nodes, rng):
+    xy = rng.random((n_nodes, 2))
+    radius = np.sqrt(6.0 / (np.pi * n_nodes))
+    pairs = cKDTree(xy).query_pairs(radius, output_type='ndarray')
+    return n_nodes, pairs, xy
+
+
+# Barabási–Albert 無尺度圖：每個新節點依度數比例連到 m 個舊節點
+def _scale_free(n_nodes, rng, m=3):
+    targets = list(range(m))
+    repeated = []
+    pairs = []
+    for new in range(m, n_nodes):
+        for t in set(targets):
+            pairs.append((new, t))
+        repeated.extend(targets)
+        repeated.extend([new] * m)
+        targets = [repeated[i] for i in rng.integers(0, len(repeated), m)]
+    xy = rng.random((n_nodes, 2))
+    return n_nodes, np.array(pairs, dtype=np.int64), xy
+
+
+def _demands(n, distribution, mean, rng):
+    if distribution == 'uniform':
+        values = rng.integers(1, 2 * mean, n)
+    elif distribution == 'poisson':
+        values = rng.poisson(mean, n) + 1
+    elif distribution == 'lognormal':
+        # 少數避難所需求特別大的長尾分布
+        values = np.ceil(rng.lognormal(np.log(mean) - 0.5, 1.0, n))
+    else:
+        raise ValueError(f"未知需求分布：{distribution}")
+    return values.astype(np.float64)
+
+
+# 產生一個實例：回傳 (CSRGraph, demands dict)；return_positions=True 時多回傳節點座標 {名稱: (x, y)}（畫圖用）
+# 邊一律雙向，容量依 capacity_range 隨機，成本 = 歐氏距離 * cost_scale（至少 1）
+def generate(topology='grid', n_nodes=400, n_sources=1, n_shelters=20,
+             distribution='uniform', mean_demand=5, capacity_range=(20, 100),
+             cost_scale=10.0, seed=0, return_positions=False):
+    rng = np.random.default_rng(seed)
+    if topology == 'grid':
+        n, pairs, xy = _grid(n_nodes, rng)
+    elif topology == 'geometric':
+        n, pairs, xy = _geometric(n_nodes, rng)
+    elif topology == 'scale_free':
+        n, pairs, xy = _scale_free(n_nodes, rng)
+    else:
+        raise ValueError(f"未知拓樸：{topology}")
+    if n_sources + n_shelters > n:
+        raise ValueError("來源加避難所的數量超過節點數")
+
+    tails = np.concatenate([pairs[:, 0], pairs[:, 1]])
+    heads = np.concatenate([pairs[:, 1], pairs[:, 0]])
+    length = np.linalg.norm(xy[tails] - xy[heads], axis=1)
+    cost = np.maximum(1.0, np.round(length * cost_scale))
+    capacity = rng.integers(capacity_range[0], capacity_range[1] + 1, len(tails)).astype(np.float64)
+
+    chosen = rng.permutation(n)[:n_sources + n_shelters]
+    depots, shelters = chosen[:n_sources], chosen[n_sources:]
+    names = [f'N{i}' for i in range(n)] + [SOURCE]
+    super_source = n
+    # 超級來源 -> 每個 depot：成本 0、容量取總需求的 10 倍（等同無限，又不會讓 λ* 剛好卡在 1）
+    amounts = _demands(len(shelters), distribution, mean_demand, rng)
+    tails = np.concatenate([tails, np.full(len(depots), super_source)])
+    heads = np.concatenate([heads, depots])
+    capacity = np.concatenate([capacity, np.full(len(depots), 10 * amounts.sum())])
+    cost = np.concatenate([cost, np.zeros(len(depots))])
+
+    graph = CSRGraph.from_arrays(names, tails, heads, capacity, cost)
+    demands = {names[s]: float(a) for s, a in zip(shelters, amounts)}
+    if return_positions:
+        # 超級來源畫在所有 depot 的中心
+        positions = np.vstack([xy, xy[depots].mean(axis=0)])
+        return graph, demands, dict(zip(names, map(tuple, positions.tolist())))
+    return graph, demands
+
+
+if __name__ == '__main__':
+    for topology in TOPOLOGIES:
+        graph, demands = generate(topology, n_nodes=10_000, n_sources=3, n_shelters=200, seed=42)
+        print(f"{topology:10s} 節點 {graph.n_nodes}，邊 {graph.n_edges}，避難所 {len(demands)}，總需求 {sum(demands.values()):.0f}")
@@ -0,0 +1,300 @@
+# 多行程指揮中心（prefork）：一個 supervisor + N 個 worker 行程，worker 都 listen 同一個 port（SO_REUSEPORT），
+# 由 kernel 把新連線分給各個 worker；每個 worker 裡跑的就是 async_server.py 的 event loop，協定完全相同。
+# async_server.py 只用得到一個核心（Python 只有一個 GIL），指揮中心的機器有幾個核心就開幾個 worker。
+#   - supervisor 求解一次，把配置快照寫成檔案（allocation_snapshot.save，優先放 /dev/shm）；
+#     worker 用 mmap 讀同一個檔案（MappedSnapshot），N 個 worker 共用一份 page cache，不會各自複製一份配置
+#   - 更新請求：worker 轉給 supervisor（unix socket，同樣是 protocol.py 的框架），supervisor 重解、
+#     重寫快照檔（先寫暫存檔再 rename），再送 SIGHUP 給所有 worker 重新 mmap；
+#     worker 換好之前查詢還是舊版本的配置，回覆裡的 "version" 看得出來
+#   - worker 死掉（crash、OOM、被 kill）supervisor 會重新啟動；啟動後很快又死掉的話等久一點再重啟，避免一直空轉
+#   - supervisor 收到 SIGTERM / Ctrl-C 時先停掉所有 worker，再清掉快照檔和 unix socket；
+#     supervisor 自己被 kill -9 的話，worker 發現 parent 不見了也會自行結束
+#   - 執行期指標：supervisor 在 --metrics-port（求解時間、worker 重啟次數），
+#     第 i 個 worker 在 --metrics-port + 1 + i（各自的連線、請求、各階段延遲）
+# 只能在 Linux 上用（SO_REUSEPORT 的連線分配、/dev/shm）。
+#
+# 範例：
+#   python prefork_server.py --workers 16
+#   python prefork_server.py --workers 4 --synthetic 5000 --port 9100
+import argparse
+import asyncio
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import allocation_snapshot
+import async_server
+import metrics
+import protocol
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+CHECK_INTERVAL = 0.5     # 多久檢查一次 worker 還在不在（秒）
+MIN_UPTIME = 5.0         # worker 活不到這麼久就算「啟動失敗」，下次重啟前要等
+MAX_BACKOFF = 30.0
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='多行程（SO_REUSEPORT）指揮中心')
+    parser.add_argument('--host', default=async_server.HOST)
+    parser.add_argument('--port', type=int, default=async_server.PORT)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--backlog', type=int, default=4096)
+    parser.add_argument('--max-connections', type=int, default=async_server.settings['max_connections'],
+                        help='每個 worker 的同時連線數上限')
+    parser.add_argument('--read-timeout', type=float, default=async_server.settings['read_timeout'])
+    parser.add_argument('--write-timeout', type=float, default=async_server.settings['write_timeout'])
+    parser.add_argument('--idle-timeout', type=float, default=async_server.settings['idle_timeout'])
+    parser.add_argument('--per-ip-connections', type=int, default=async_server.settings['per_ip_connections'],
+                        help='每個 worker 各自計算')
+    parser.add_argument('--per-ip-rate', type=float, default=async_server.settings['per_ip_rate'],
+                        help='每個 worker 各自計算（0 = 不限制）')
+    parser.add_argument('--verbose', action='store_true')
+    parser.add_argument('--synthetic', type=int, default=0, help='改用這麼多戶的合成路網')
+    parser.add_argument('--metrics-port', type=int, default=metrics.METRICS_PORT,
+                        help='supervisor 的指標 port，worker 依序用後面的 port（0 = 關閉）')
+    # 以下由 supervisor 啟動 worker 時帶入
+    parser.add_argument('--worker', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--snapshot', help=argparse.SUPPRESS)
+    parser.add_argument('--control', help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def apply_settings(args):
+    async_server.settings.update(max_connections=args.max_connections, read_timeout=args.read_timeout,
+                                 write_timeout=args.write_timeout, idle_timeout=args.idle_timeout,
+                                 verbose=args.verbose, synthetic=args.synthetic,
+                                 per_ip_connections=args.per_ip_connections, per_ip_rate=args.per_ip_rate)
+
+
+# ---------------- worker ----------------
+
+# 每個 worker 自己 bind 一個 socket；SO_REUSEPORT 讓 kernel 依連線的 4-tuple 分給不同 worker 的 accept queue
+def listen_socket(host, port, backlog):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.setblocking(False)
+    return sock
+
+
+# 更新請求轉給 supervisor：所有 worker 共用同一個模型，只能在 supervisor 那裡重解
+def forward_updates(control):
+    async def forward(update):
+        try:
+            reader, writer = await asyncio.open_unix_connection(control)
+        except OSError as e:
+            return allocation_snapshot.stamp(async_server.encode({'error': f'無法連到 supervisor：{e}'}),
+                                             async_server.current_version())
+        try:
+            writer.write(protocol.pack({'update': update}))
+            await writer.drain()
+            reply = await protocol.read_frame_async(reader)
+        except (ConnectionError, ValueError):
+            reply = None
+        finally:
+            writer.close()
+        return reply or allocation_snapshot.stamp(async_server.encode({'error': '更新失敗：supervisor 沒有回覆'}),
+                                                  async_server.current_version())
+    return forward
+
+
+# 重新 mmap 快照檔（supervisor 重解後送 SIGHUP），再叫醒訂閱推播
+# 舊的 mapping 不主動關：推播還要拿它跟新版本比對，沒有人參考之後會自動釋放
+def reload_snapshot(index, path):
+    try:
+        async_server.snapshot = allocation_snapshot.MappedSnapshot(path)
+    except (OSError, ValueError) as e:
+        print(f"[Worker {index}] 快照重新載入失敗，繼續使用舊的配置：{e}")
+        return
+    async_server.notify()
+    if async_server.settings['verbose']:
+        print(f"[Worker {index}] 快照已重新載入（{len(async_server.snapshot)} 戶）")
+
+
+async def watch_parent(parent):
+    while os.getppid() == parent:
+        await asyncio.sleep(1.0)
+    print("[Worker] supervisor 已結束，worker 跟著結束")
+    os._exit(1)
+
+
+async def run_worker(args, sock):
+    loop = asyncio.get_running_loop()
+    loop.add_signal_handler(signal.SIGHUP, reload_snapshot, args.worker, args.snapshot)
+    loop.create_task(watch_parent(os.getppid()))
+    await async_server.serve(args.host, args.port, args.backlog, sock=sock, solve=False)
+
+
+def worker_main(args):
+    apply_settings(args)
+    if args.metrics_port:
+        async_server.serve_metrics(args.metrics_port + 1 + args.worker)
+    async_server.raise_fd_limit()
+    async_server.snapshot = allocation_snapshot.MappedSnapshot(args.snapshot)
+    async_server.updater = forward_updates(args.control)
+    sock = listen_socket(args.host, args.port, args.backlog)
+    try:
+        asyncio.run(run_worker(args, sock))
+    except KeyboardInterrupt:
+        pass
+
+
+# ---------------- supervisor ----------------
+
+class Supervisor:
+    def __init__(self, args):
+        self.args = args
+        shm = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+        self.snapshot_path = os.path.join(shm, f'command-center-{os.getpid()}.snapshot')
+        self.control_path = os.path.join(tempfile.gettempdir(), f'command-center-{os.getpid()}.sock')
+        self.workers = {}      # index -> (Popen, 啟動時間)
+        self.failures = {}     # index -> 連續啟動失敗次數
+        self.update_lock = None
+        # supervisor 自己的指標（worker 行程不會建立這兩個）
+        self.restarts = metrics.Counter('commandcenter_worker_restarts_total',
+                                        'Worker processes restarted by the supervisor')
+        metrics.Gauge('commandcenter_workers', 'Worker processes currently running',
+                      fn=lambda: sum(proc is not None and proc.poll() is None for proc, _ in self.workers.values()))
+
+    def worker_command(self, index):
+        args = self.args
+        command = [sys.executable, os.path.join(HERE, 'prefork_server.py'), '--worker', str(index),
+                   '--snapshot', self.snapshot_path, '--control', self.control_path,
+                   '--host', args.host, '--port', str(args.port), '--backlog', str(args.backlog),
+                   '--max-connections', str(args.max_connections), '--read-timeout', str(args.read_timeout),
+                   '--write-timeout', str(args.write_timeout), '--idle-timeout', str(args.idle_timeout),
+                   '--per-ip-connections', str(args.per_ip_connections), '--per-ip-rate', str(args.per_ip_rate),
+                   '--metrics-port', str(args.metrics_port)]
+        if args.verbose:
+            command.append('--verbose')
+        return command
+
+    def spawn(self, index):
+        # worker 不處理 Ctrl-C（終端機的 SIGINT 會送給整個 process group），由 supervisor 統一收尾
+        proc = subprocess.Popen(self.worker_command(index), cwd=HERE,
+                                preexec_fn=lambda: signal.signal(signal.SIGINT, signal.SIG_IGN))
+        self.workers[index] = (proc, time.monotonic())
+        return proc
+
+    async def monitor(self):
+        restart_at = {}
+        while True:
+            await asyncio.sleep(CHECK_INTERVAL)
+            now = time.monotonic()
+            for index, (proc, started) in list(self.workers.items()):
+                if proc is None:
+                    if now >= restart_at[index]:
+                        proc = self.spawn(index)
+                        self.restarts.inc()
+                        print(f"[Supervisor] 重新啟動 worker {index}（pid {proc.pid}）")
+                    continue
+                code = proc.poll()
+                if code is None:
+                    if now - started >= MIN_UPTIME:
+                        self.failures[index] = 0
+                    continue
+                failures = self.failures.get(index, 0) + (now - started < MIN_UPTIME)
+                self.failures[index] = failures
+                delay = min(MAX_BACKOFF, 0.5 * 2 ** failures) if failures else 0.0
+                print(f"[Supervisor] worker {index}（pid {proc.pid}）結束，exit {code}；{delay:.1f} s 後重新啟動")
+                self.workers[index] = (None, started)
+                restart_at[index] = now + delay
+
+    def signal_workers(self, signum):
+        for proc, _ in self.workers.values():
+            if proc is not None and proc.poll() is None:
+                proc.send_signal(signum)
+
+    # 重解後重寫快照檔，再通知所有 worker 重新 mmap
+    def update(self, update):
+        reply = async_server.apply_update(update)
+        async_server.snapshot.save(self.snapshot_path)
+        self.signal_workers(signal.SIGHUP)
+        return reply
+
+    async def handle_control(self, reader, writer):
+        try:
+            payload = await protocol.read_frame_async(reader)
+            data = json.loads(payload) if payload else None
+            version = async_server.current_version()
+            if not isinstance(data, dict) or not protocol.valid_update(data.get('update')):
+                reply = allocation_snapshot.stamp(async_server.BAD_REQUEST, version)
+            elif async_server.model is None:
+                reply = allocation_snapshot.stamp(async_server.NO_UPDATE, version)
+            else:
+                # 一次只重解一個更新：快照檔不會被兩個更新同時覆寫
+                async with self.update_lock:
+                    try:
+                        reply = await asyncio.get_running_loop().run_in_executor(None, self.update, data['update'])
+                    except (KeyError, ValueError, TypeError) as e:
+                        reply = allocation_snapshot.stamp(async_server.encode({'error': f'更新失敗：{e}'}), version)
+            writer.write(protocol.frame(reply))
+            await writer.drain()
+        except (ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        stop = asyncio.Event()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(signum, stop.set)
+        self.update_lock = asyncio.Lock()
+        async_server.bind_metrics(loop)
+        control = await asyncio.start_unix_server(self.handle_control, self.control_path)
+        for index in range(self.args.workers):
+            self.spawn(index)
+        print(f"[Supervisor] {self.args.workers} 個 worker 在 {self.args.host}:{self.args.port} 上服務"
+              f"（快照檔 {self.snapshot_path}）")
+        monitor = loop.create_task(self.monitor())
+        await stop.wait()
+        monitor.cancel()
+        control.close()
+
+    def shutdown(self):
+        print("[Supervisor] 停止所有 worker...")
+        self.signal_workers(signal.SIGTERM)
+        for proc, _ in self.workers.values():
+            if proc is None:
+                continue
+            try:
+                proc.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+                proc.wait()
+        for path in (self.snapshot_path, self.control_path):
+            if os.path.exists(path):
+                os.unlink(path)
+
+
+def supervisor_main(args):
+    apply_settings(args)
+    async_server.serve_metrics(args.metrics_port)
+    # 先求解完再開 worker：worker 一啟動就有配置可查
+    async_server.solve_initial()
+    if async_server.snapshot is None:
+        sys.exit("[Supervisor] 沒有可用的配置，無法啟動")
+    supervisor = Supervisor(args)
+    t0 = time.perf_counter()
+    async_server.snapshot.save(supervisor.snapshot_path)
+    print(f"[Supervisor] 快照檔寫入完成：{os.path.getsize(supervisor.snapshot_path) / 2**20:.1f} MiB，"
+          f"{(time.perf_counter() - t0)*1000:.0f} ms")
+    try:
+        asyncio.run(supervisor.run())
+    finally:
+        supervisor.shutdown()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    if args.worker is not None:
+        worker_main(args)
+    else:
+        supervisor_main(args)
@@ -0,0 +1,309 @@
+# 指揮中心的訊息框架：每則訊息 = 4 bytes 長度（big-endian）+ JSON 內容
+# 以前 server 只做一次 recv(1024)：訊息超過 1024 bytes 或被 TCP 拆成兩段就讀壞，
+# 而且每查一次就要重新連線一次。有了長度前綴：
+#   - 訊息大小跟緩衝區大小無關，分段送達也能正確組回來
+#   - 同一條連線可以一直用（keep-alive），client 可以連續送好幾個請求不等回覆（pipelining），
+#     server 依收到的順序回覆
+# 舊的「連上、送一個 JSON、收一個 JSON」client 還是能用：JSON 一定以 '{' 開頭，
+# 而長度前綴的第一個 byte 只有在訊息超過 2 GiB 時才可能是 '{'，server 看第一個 byte 就分得出來。
+# 訂閱（{ "subscribe": { "names": [...] } }）之後，server 會在配置變動時主動送推播，
+# 推播可能夾在一般回覆之間：client 用 is_push() 分出來，不會跟請求的回覆順序對錯。
+# server 忙不過來、在收下連線之前就拒絕時（連線數已達上限），不加框架直接送一個 JSON 再關閉：
+# 舊 client 照樣讀得懂；新 client 讀到的「長度」第一個 byte 是 '{'，就知道是拒絕，丟出 ServerBusy。
+import asyncio
+import collections
+import json
+import socket
+import struct
+import binary_codec
+
+HEADER = struct.Struct('!I')
+MAX_FRAME = 16 * 1024 * 1024
+LEGACY_FIRST_BYTE = b'{'
+JSON_PUSH_PREFIX = b'{"push"'
+
+
+class ServerBusy(ConnectionError):
+    def __init__(self, reply):
+        super().__init__(reply.get('error', 'server 忙碌中'))
+        self.reply = reply
+
+
+# 拒絕訊息送完 server 就關閉連線，我們送出的請求還沒被讀的話會變成 RST：讀到多少算多少，
+# JSON 被截斷也一樣是拒絕，只是拿不到原因
+def _busy(data):
+    try:
+        reply = json.loads(data)
+    except ValueError:
+        reply = None
+    raise ServerBusy(reply if isinstance(reply, dict) else {})
+
+
+def _read_rest(stream, limit):
+    data = b''
+    try:
+        while len(data) < limit:
+            chunk = stream.read1(limit - len(data))
+            if not chunk:
+                break
+            data += chunk
+    except ConnectionError:
+        pass
+    return data
+
+
+def encode(obj):
+    return json.dumps(obj, ensure_ascii=False).encode()
+
+
+# 更新請求的格式：{ "demands": { "H1": 10 }, "capacities": [["S", "A", 0]] }，兩項都可以省略
+# 兩個 server 都先用這個檢查，格式不對就回請求格式錯誤，不會在重解時才丟例外
+def valid_update(update):
+    if not isinstance(update, dict):
+        return False
+    demands = update.get('demands')
+    if demands is not None and not (
+            isinstance(demands, dict) and all(_is_number(d) for d in demands.values())):
+        return False
+    capacities = update.get('capacities', [])
+    return isinstance(capacities, list) and all(
+        isinstance(item, list) and len(item) == 3 and isinstance(item[0], str) and isinstance(item[1], str)
+        and _is_number(item[2]) for item in capacities)
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def frame(payload):
+    return HEADER.pack(len(payload)) + payload
+
+
+def pack(obj):
+    return frame(encode(obj))
+
+
+def is_push(payload, binary=False):
+    if binary:
+        return payload[:1] == bytes([binary_codec.REPLY_PUSH])
+    return payload.startswith(JSON_PUSH_PREFIX)
+
+
+# 從 buffered stream（sock.makefile('rb')）讀一則訊息；對方在訊息之間關閉連線回傳 None
+def read_frame(stream, max_frame=MAX_FRAME):
+    header = stream.read(HEADER.size)
+    if not header:
+        return None
+    if header[:1] == LEGACY_FIRST_BYTE:
+        _busy(header + _read_rest(stream, max_frame))
+    if len(header) < HEADER.size:
+        raise ConnectionError('連線在訊息中途中斷')
+    (length,) = HEADER.unpack(header)
+    if length > max_frame:
+        raise ValueError(f'訊息太大（{length} bytes）')
+    payload = stream.read(length)
+    if len(payload) < length:
+        raise ConnectionError('連線在訊息中途中斷')
+    return payload
+
+
+# asyncio 版：header 已經讀到的部分可以從 prefix 傳進來（server 先讀一個 byte 判斷是不是舊協定）
+async def read_frame_async(reader, prefix=b'', max_frame=MAX_FRAME):
+    try:
+        header = prefix + await reader.readexactly(HEADER.size - len(prefix))
+    except asyncio.IncompleteReadError as e:
+        if not prefix and not e.partial:
+            return None
+        if e.partial[:1] == LEGACY_FIRST_BYTE:
+            _busy(e.partial)
+        raise ConnectionError('連線在訊息中途中斷')
+    if header[:1] == LEGACY_FIRST_BYTE and not prefix:
+        try:
+            rest = await reader.read(max_frame)
+        except ConnectionError:
+            rest = b''
+        _busy(header + rest)
+    (length,) = HEADER.unpack(header)
+    if length > max_frame:
+        raise ValueError(f'訊息太大（{length} bytes）')
+    try:
+        return await reader.readexactly(length)
+    except asyncio.IncompleteReadError:
+        raise ConnectionError('連線在訊息中途中斷')
+
+
+# client 端的長連線：request() 一問一答，pipeline() 一次送出多個請求再依序收回覆
+# encoding='binary' 時先跟 server 協商（binary_codec.py）；server 不支援就維持 JSON，self.encoding 是實際用的編碼
+# 訂閱之後收到的推播先放進 self.pushes，wait_push() 依序取出
+class Connection:
+    def __init__(self, host, port, timeout=10.0, encoding='json'):
+        self.timeout = timeout
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.stream = self.sock.makefile('rb')
+        self.bytes_sent = self.bytes_received = 0   # 含框架的傳輸量（benchmark 用）
+        self.pushes = collections.deque()
+        self.encoding = 'json'
+        if encoding != 'json':
+            reply = self.request({'hello': {'encoding': encoding}})
+            self.encoding = reply.get('encoding', 'json')
+
+    def _pack(self, obj):
+        if self.encoding == 'binary':
+            return frame(binary_codec.encode_request(obj))
+        return pack(obj)
+
+    def _send(self, data):
+        self.bytes_sent += len(data)
+        self.sock.sendall(data)
+
+    def send(self, obj):
+        self._send(self._pack(obj))
+
+    def _receive(self):
+        payload = read_frame(self.stream)
+        if payload is None:
+            raise ConnectionError('server 已關閉連線')
+        self.bytes_received += HEADER.size + len(payload)
+        if self.encoding == 'binary':
+            return is_push(payload, True), binary_codec.decode_reply(payload)
+        return is_push(payload), json.loads(payload)
+
+    def receive(self):
+        while True:
+            push, obj = self._receive()
+            if not push:
+                return obj
+            self.pushes.append(obj)
+
+    # 等下一則推播；timeout=None 一直等（訂閱的 client 通常很久才收到一次）
+    def wait_push(self, timeout=None):
+        if self.pushes:
+            return self.pushes.popleft()
+        self.sock.settimeout(timeout)
+        try:
+            while True:
+                push, obj = self._receive()
+                if push:
+                    return obj
+        finally:
+            self.sock.settimeout(self.timeout)
+
+    def request(self, obj):
+        self.send(obj)
+        return self.receive()
+
+    # 一次最多送出 window 個請求再收回覆：全部先送完才開始收的話，回覆把雙方的 socket 緩衝區塞滿就會互等
+    def pipeline(self, objs, window=256):
+        objs = list(objs)
+        responses = []
+        for i in range(0, len(objs), window):
+            batch = objs[i:i + window]
+            self._send(b''.join(self._pack(obj) for obj in batch))
+            responses.extend(self.receive() for _ in batch)
+        return responses
+
+    def close(self):
+        self.stream.close()
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# asyncio 版的長連線：send() 送出後馬上回傳 future，不等前一個回覆（pipelining）；
+# 背景 task 依序讀回覆、依序完成 future。decode=False 時 future 拿到的是原始 payload（壓測時省掉解碼）
+# 推播不對應任何請求，放進 self.pushes（asyncio.Queue）
+class AsyncConnection:
+    def __init__(self, reader, writer, decode=True):
+        self.reader = reader
+        self.writer = writer
+        self.decode = decode
+        self.encoding = 'json'
+        self.pending = collections.deque()
+        self.pushes = asyncio.Queue()
+        self.closed = False
+        self.task = asyncio.get_running_loop().create_task(self._read_loop())
+
+    @classmethod
+    async def open(cls, host, port, encoding='json', decode=True, source=None):
+        reader, writer = await asyncio.open_connection(host, port, local_addr=(source, 0) if source else None)
+        conn = cls(reader, writer, decode)
+        if encoding != 'json':
+            reply = await conn.request({'hello': {'encoding': encoding}})
+            if not decode:
+                reply = json.loads(reply)
+            conn.encoding = reply.get('encoding', 'json')
+        return conn
+
+    async def send(self, obj):
+        if self.closed or self.writer.is_closing():
+            raise ConnectionError('連線已關閉')
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append(future)
+        if self.encoding == 'binary':
+            self.writer.write(frame(binary_codec.encode_request(obj)))
+        else:
+            self.writer.write(pack(obj))
+        try:
+            await self.writer.drain()
+        except Exception:
+            future.cancel()   # 送不出去：呼叫端拿到例外，不會再等這個 future
+            raise
+        return future
+
+    async def request(self, obj):
+        return await (await self.send(obj))
+
+    async def _read_loop(self):
+        error = ConnectionError('server 已關閉連線')
+        try:
+            while True:
+                payload = await read_frame_async(self.reader)
+                if payload is None:
+                    break
+                binary = self.encoding == 'binary'
+                if self.decode:
+                    result = binary_codec.decode_reply(payload) if binary else json.loads(payload)
+                else:
+                    result = payload
+                if is_push(payload, binary):
+                    self.pushes.put_nowait(result)
+                    continue
+                future = self.pending.popleft()
+                if not future.done():   # done = 呼叫端已經逾時放棄
+                    future.set_result(result)
+        except ServerBusy as e:
+            error = e
+        except (ConnectionError, ValueError, IndexError) as e:
+            error = ConnectionError(str(e))
+        finally:
+            self.closed = True
+            while self.pending:
+                future = self.pending.popleft()
+                if not future.done():
+                    future.set_exception(error)
+
+    async def close(self):
+        self.closed = True
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except (ConnectionError, OSError):
+            pass
+        self.task.cancel()
+
+
+if __name__ == '__main__':
+    import io
+
+    # 分段送達：把兩則訊息接在一起、再切成 1 byte 的小段也能正確讀回
+    messages = [{'name': 'H1'}, {'name': 'H' * 5000}]
+    data = b''.join(pack(m) for m in messages)
+    stream = io.BufferedReader(io.BytesIO(data), buffer_size=1)
+    decoded = [json.loads(read_frame(stream)) for _ in messages]
+    assert decoded == messages and read_frame(stream) is None
+    print(f"{len(messages)} 則訊息共 {len(data)} bytes，解回來一致")
@@ -0,0 +1,142 @@
+# 無視窗繪圖：把流量配置結果直接存成 PNG / SVG（headless server 也能用）
+# 原本的畫法每次都跑 nx.spring_layout（每輪 O(n²)），再用 nx.draw 一條邊一個 artist，
+# 上萬條邊要畫好幾分鐘，而且 plt.show() 一定要有螢幕。這裡：
+#   - 節點座標優先用給定的座標（例如 network_generator 的 return_positions），
+#     沒有才計算一次（小圖 spring、大圖 spectral），依圖的結構存到快取資料夾，下次直接載入
+#   - 所有邊用一個 LineCollection 畫，顏色 / 寬度依使用率（流量 / 容量）
+import os
+import numpy as np
+import matplotlib.pyplot as plt
+from matplotlib.collections import LineCollection
+import lp_sparse
+from solution_cache import structure_key
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.layout_cache')
+SMALL_GRAPH = 50     # 節點數在這以下才畫節點名稱與「容量/成本」標籤
+SPRING_LIMIT = 500   # 節點數在這以下用 spring layout，更大的圖用 spectral layout
+
+
+# 大圖的 layout：spectral 在不連通的圖上會退化（特徵向量只分得出是哪一個連通塊），
+# 所以每個連通塊各自算，再依大小一排一排擺好；超級來源連到所有物資點，不參與計算，放在鄰居的中心
+def _spectral(graph, source):
+    import networkx as nx
+    und = graph.to_undirected(as_view=True)
+    core = nx.subgraph_view(und, filter_node=lambda n: n != source)
+    parts = sorted(nx.connected_components(core), key=len, reverse=True)
+    width = 1.2 * np.sqrt(sum(len(p) for p in parts))
+    pos = {}
+    x = y = row = 0.0
+    for part in parts:
+        side = np.sqrt(len(part))
+        if x > 0 and x + side > width:
+            x, y, row = 0.0, y - row - 1.0, 0.0
+        if len(part) > 2:
+            sub = nx.spectral_layout(core.subgraph(part))
+            xy = np.array(list(sub.values()))
+            lo, span = xy.min(axis=0), np.ptp(xy, axis=0)
+            xy = (xy - lo) / np.where(span > 0, span, 1.0) * side
+            sub = dict(zip(sub, xy))
+        else:
+            sub = {n: np.array([i * 0.5, 0.0]) for i, n in enumerate(part)}
+        for n, p in sub.items():
+            pos[n] = (x + p[0], y - p[1])
+        x, row = x + side + 1.0, max(row, side)
+    if source in graph:
+        near = [pos[n] for n in und[source] if n in pos]
+        pos[source] = tuple(np.mean(near, axis=0)) if near else (0.0, 0.0)
+    return pos
+
+
+# 回傳 (N, 2) 的座標陣列，順序與 lp_sparse.edge_arrays(G) 的節點相同
+# coords：{節點: (x, y)}；cache_dir 為 None 時不讀寫快取
+def layout(G, coords=None, cache_dir=DEFAULT_CACHE_DIR, seed=42, source='S'):
+    nodes, index, edges, tails, heads, capacity, cost = lp_sparse.edge_arrays(G)
+    if coords is not None:
+        return np.array([coords[n] for n in nodes], dtype=np.float64)
+    path = None
+    if cache_dir is not None:
+        key = structure_key(nodes, tails, heads)
+        path = os.path.join(cache_dir, f'{key}_{seed}.npy')
+        if os.path.exists(path):
+            return np.load(path)
+    import networkx as nx
+    graph = G.to_networkx() if hasattr(G, 'to_networkx') else G
+    if len(nodes) <= SPRING_LIMIT:
+        pos = nx.spring_layout(graph, seed=seed)
+    else:
+        pos = _spectral(graph, source)
+    xy = np.array([pos[n] for n in nodes], dtype=np.float64)
+    if path is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp = f'{path}.{os.getpid()}.tmp.npy'
+        np.save(tmp, xy)
+        os.replace(tmp, path)
+    return xy
+
+
+# 畫出配置結果，回傳 Figure；edge_flow = {(u, v): flow}
+def draw_allocation(G, edge_flow, xy=None, title=None, cmap='Reds', node_color='lightgreen',
+                    highlight=(), figsize=(10, 6)):
+    nodes, index, edges, tails, heads, capacity, cost = lp_sparse.edge_arrays(G)
+    if xy is None:
+        xy = layout(G)
+    flow = np.array([edge_flow.get(e, 0.0) for e in edges], dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        usage = np.clip(np.where(capacity > 0, flow / capacity, 0.0), 0.0, 1.0)
+    small = len(nodes) <= SMALL_GRAPH
+    # 使用率高的邊最後畫，雙向道路重疊時壅塞的那條在上面
+    order = np.argsort(usage, kind='stable')
+    segments = np.stack([xy[tails[order]], xy[heads[order]]], axis=1)
+    colormap = plt.get_cmap(cmap)
+    widths = (1 + 4 * usage[order]) if small else (0.3 + 2.5 * usage[order])
+    lines = LineCollection(segments, colors=colormap(np.maximum(usage[order], 0.08)), linewidths=widths, zorder=1)
+
+    fig, ax = plt.subplots(figsize=figsize)
+    ax.add_collection(lines)
+    ax.scatter(xy[:, 0], xy[:, 1], s=1000 if small else 4, c=node_color, edgecolors='none', zorder=2)
+    if len(highlight):
+        hi = np.array([index[n] for n in highlight])
+        ax.scatter(xy[hi, 0], xy[hi, 1], s=1000 if small else 25, c='gold', edgecolors='black', zorder=3)
+    if small:
+        for n, (x, y) in zip(nodes, xy):
+            ax.text(x, y, str(n), ha='center', va='center', fontsize=12, zorder=4)
+        mid = (xy[tails] + xy[heads]) / 2
+        for (x, y), c, w in zip(mid, capacity, cost):
+            ax.text(x, y, f'{c:g}/{w:g}', ha='center', va='center', fontsize=9, zorder=4,
+                    bbox={'boxstyle': 'round', 'fc': 'white', 'ec': 'none', 'alpha': 0.8})
+    fig.colorbar(plt.cm.ScalarMappable(cmap=colormap), ax=ax, label='使用率（流量 / 容量）', shrink=0.8)
+    ax.autoscale_view()
+    if not small:
+        # 大圖的座標通常是地理座標，不要拉伸；小圖跟原本 nx.draw 一樣填滿畫面
+        ax.set_aspect('equal', adjustable='datalim')
+    ax.set_axis_off()
+    if title:
+        ax.set_title(title)
+    return fig
+
+
+# 依副檔名存成 PNG / SVG，存完就關掉 Figure（長時間執行的 server 不會累積記憶體）
+def save(fig, path, dpi=150):
+    fig.savefig(path, dpi=dpi, bbox_inches='tight')
+    plt.close(fig)
+
+
+if __name__ == '__main__':
+    import sys
+    import tempfile
+    import time
+    import min_cost_flow
+    import network_generator
+
+    out = sys.argv[1] if len(sys.argv) > 1 else os.path.join(tempfile.gettempdir(), 'allocation_10k.png')
+    graph, demands, coords = network_generator.generate('geometric', n_nodes=3000, n_sources=5, n_shelters=80,
+                                                        return_positions=True, seed=0)
+    result = min_cost_flow.min_cost_flow(graph, demands, source=network_generator.SOURCE)
+    print(f"路網：{graph.n_nodes} 節點、{graph.n_edges} 邊")
+    for label, kwargs in (('給定座標', {'coords': coords}), ('計算 layout（首次）', {}), ('計算 layout（快取）', {})):
+        t0 = time.perf_counter()
+        xy = layout(graph, **kwargs)
+        t1 = time.perf_counter()
+        fig = draw_allocation(graph, result['edge_flow'], xy, title='最小成本流配置', highlight=list(demands))
+        save(fig, out)
+        print(f"{label}：layout {t1 - t0:.2f} s，繪圖 + 存檔 {time.perf_counter() - t1:.2f} s → {out}")
@@ -2,7 +2,10 @@
 # run_server.py
 import socket
 import json
-import cvxpy as cp
+import lp_sparse
+import flow_decomposition
+import protocol
+from solution_cache import SolutionCache
 import networkx as nx
 from collections import defaultdict
 
@@ -37,55 +40,31 @@ edges = [
 ]
 G.add_edges_from([(u, v, attr) for u, v, attr in edges])
 demands = {'H1': 8, 'H2': 7}
-commodities = list(demands.keys())
-edges = list(G.edges())
-nodes = list(G.nodes())
+# 用稀疏矩陣後端（scipy + HiGHS）求解，建模不再逐變數掃邊；路網與需求沒變時直接讀磁碟快取
+lp_result = lp_sparse.solve_sparse(G, demands, source='S', cache=SolutionCache())
+print(f"[Server] 快取 {lp_result['cache']}，LP 建模 {lp_result['build_time']*1000:.1f} ms，求解 {lp_result['solve_time']*1000:.1f} ms")
 
-# LP 變數
-flow_vars = {
-    (k, u, v): cp.Variable(nonneg=True)
-    for k in commodities for (u, v) in edges
-}
+# 彙總結果：從 LP 的邊流量拆出每戶實際送達量與運送路徑
+allocation = flow_decomposition.allocation_from_flows(lp_result['flows'], list(demands), source='S')
 
-constraints = []
-for (u, v) in edges:
-    total_flow = cp.sum([flow_vars[k, u, v] for k in commodities])
-    constraints.append(total_flow <= G[u][v]['capacity'])
-
-for k in commodities:
-    for n in nodes:
-        inflow = cp.sum([flow_vars[k, u, n] for (u, v) in edges if v == n])
-        outflow = cp.sum([flow_vars[k, n, v] for (u, v) in edges if u == n])
-        if n == 'S':
-            constraints.append(outflow - inflow == demands[k])
-        elif n == k:
-            constraints.append(inflow - outflow == demands[k])
-        else:
-            constraints.append(inflow == outflow)
-
-objective = cp.Minimize(cp.sum([
-    G[u][v]['cost'] * flow_vars[k, u, v]
-    for (k, u, v) in flow_vars
-]))
-prob = cp.Problem(objective, constraints)
-prob.solve()
-
-# 彙總結果：每戶應收總流量
-allocation = {k: demands[k] for k in demands}
-
-# 啟動 socket server
+# 啟動 socket server：每個災戶一條長連線，訊息用長度前綴框架（protocol.py），同一條連線可以查很多次
 with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+    s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
     s.bind((HOST, PORT))
     s.listen()
     print("[Server] 指揮中心啟動，等待災戶連線...")
     for _ in range(len(allocation)):
         conn, addr = s.accept()
-        with conn:
+        with conn, conn.makefile('rb') as stream:
             print(f"[Server] 已連線：{addr}")
-            name = conn.recv(1024).decode()
-            if name in allocation:
-                data = {'resource': allocation[name]}
-                conn.sendall(json.dumps(data).encode())
-                print(f"[Server] 已送出 {allocation[name]} 單位資源給 {name}")
-            else:
-                conn.sendall(json.dumps({'error': '未知災戶'}).encode())
+            while True:
+                payload = protocol.read_frame(stream)
+                if payload is None:
+                    break
+                name = json.loads(payload).get('name')
+                if name in allocation:
+                    data = allocation[name]
+                    conn.sendall(protocol.pack(data))
+                    print(f"[Server] 已送出 {data['resource']} 單位資源給 {name}（{len(data['routes'])} 條路徑）")
+                else:
+                    conn.sendall(protocol.pack({'error': '未知災戶'}))
@@ -1,33 +1,82 @@
-# 多執行緒處理：使用 threading.Thread 處理每個 client。
+# 多執行緒處理：固定數量的 worker 執行緒處理請求，不再每條連線開一個執行緒。
+# 主執行緒用 selectors 同時看著所有連線：accept 新連線、哪條連線有資料可讀就交給 worker（有界佇列）；
+# worker 只處理已經收到的資料，不會卡在讀取上；回覆也只做 non-blocking send，送不完的交回主執行緒等 socket 可寫，
+# 不收回覆的 client 不會佔住 worker。大量報到或連線洪流（final_1 的 SYN / 連線洪流工具）時：
+#   - 執行緒數固定（WORKERS），listen() backlog、同時連線數、等 worker 的佇列都有上限
+#   - 每個來源 IP 的連線數、每秒請求數、同時在佇列 / worker 手上的連線數有上限（admission.py）
+#   - 回覆還沒送完的連線不再讀新的請求（pipelining 但不收回覆的 client 最多只積一批回覆）
+#   - 讀取期限：連上後、或一個請求送到一半，超過 READ_DEADLINE 秒還沒送完就關閉（慢速 client 不會佔著資源）
+#   - 超量的負載明確回 { "status": "busy", "error": ..., "retry_after": 1 }：佇列滿時請求照樣收下但直接回忙碌中；
+#     連線數超過上限時不加框架直接送這個 JSON 再關閉（protocol.py 的 client 會丟出 ServerBusy）
 
-# JSON 通訊格式：client 傳送格式 { "name": "H1" }，server 回傳格式 { "resource": 8 } 或 { "error": "未知災戶" }。
+# JSON 通訊格式：client 傳送格式 { "name": "H1" }，server 回傳格式 { "resource": 8, "routes": [{ "path": ["S", "A", "B", "H1"], "amount": 8 }] } 或 { "error": "未知災戶" }。
+# 訊息框架：每則訊息前面加 4 bytes 長度（protocol.py），同一條連線可以連續送多個請求；直接送 JSON 的舊 client 一樣能用（一問一答後關閉）。
 
-# 保留 LP 計算邏輯：指揮中心在啟動時就先完成資源配置。
+# 啟動順序：先 bind()/listen()，LP 建模與求解丟到背景執行緒；算完之前查詢一律回 { "status": "pending", "error": ... }。
+# cvxpy / networkx 很重，只在背景執行緒裡才 import，指揮中心一啟動就能接受連線。
+
+# 更新需求/容量：client 傳送 { "update": { "demands": {"H1": 10}, "capacities": [["S", "A", 0]] } }，
+# server 用常駐的 AllocationModel warm start 重解，回傳 { "status": ..., "objective": ..., "resolve_ms": ... }。
+
+# 配置快照：每戶的回覆事先編好（allocation_snapshot.py），每個回覆都帶 "version"；重解成功就建新快照（版本號 + 1）
+# 再換掉 snapshot 這個參考，worker 執行緒讀取時不用 lock，也不會看到重解到一半的配置。
+
+# 執行期指標（metrics.py）：http://127.0.0.1:9091/metrics，Prometheus text format；
+# 連線數、執行緒數、各種請求 / 錯誤次數、每個請求 accept → parse → lookup → send 各階段的耗時、LP 建模與求解時間。
+# accept 階段從 accept() 回傳算到 worker 開始處理第一個 byte，等 worker 的佇列排太長時會先在這裡變慢；
+# 被擋掉的連線 / 請求依原因記在 commandcenter_shed_total。
 
 # 支援同時連線多災戶：不會依序等待。
 # run_server.py（多 client 多任務 + JSON 格式）
 import socket
 import json
-import cvxpy as cp
-import networkx as nx
+import collections
+import queue
+import selectors
 import threading
+import time
+import admission
+import allocation_snapshot
+import flow_decomposition
+import metrics
+import protocol
 
 HOST = '0.0.0.0'
 PORT = 9000
+IDLE_TIMEOUT = 60  # keep-alive 連線閒置超過這個秒數就關閉
+METRICS_PORT = metrics.METRICS_PORT  # 0 = 不開指標
+STARTED = time.perf_counter()
+
+WORKERS = 16             # 處理請求的執行緒數（查詢只是查快照，很快；更新重解時會佔住一個）
+QUEUE_SIZE = 256         # 有資料、等 worker 處理的連線最多幾條；滿了就直接回忙碌中
+BACKLOG = 128            # listen() backlog：kernel 裡還沒 accept() 的連線最多幾條
+# 同時連線數上限；Windows 的 select() 最多只能看 512 個 socket
+MAX_CONNECTIONS = 500 if selectors.DefaultSelector is selectors.SelectSelector else 4096
+PER_IP_CONNECTIONS = 256 # 同一個來源 IP 同時最多幾條連線（同一個避難所的災戶可能共用一個 NAT 出口）
+PER_IP_WORKERS = WORKERS // 4  # 同一個來源 IP 同時最多幾條連線在佇列或 worker 手上，單一 IP 佔不滿全部 worker
+PER_IP_RATE = 1000       # 同一個來源 IP 平均每秒最多幾個請求，瞬間最多 PER_IP_BURST 個
+PER_IP_BURST = 2000
+READ_DEADLINE = 5        # 連上後送出第一個請求、或一個請求從第一個 byte 到送完，最多幾秒
+WRITE_TIMEOUT = 5        # 回覆送不出去（client 不收）超過幾秒就關閉；等待時在 selector 裡，不佔 worker
+MAX_REQUEST = 1024 * 1024
+SWEEP_INTERVAL = 0.5     # 多久檢查一次讀取期限 / 閒置逾時
+ACCEPT_BATCH = 64        # 一次最多連續 accept 幾條，已經連上的連線不會被新連線餓死
+VERBOSE = False          # 每條連線、每個請求都印 log（大量請求時印 log 本身就是瓶頸）
+
 
+# 不對外連線（離線的現場筆電也能用）：只查本機 hostname 對應的位址，查不到就退回 127.0.0.1
 def get_local_ip():
-    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
     try:
-        s.connect(('8.8.8.8', 80))
-        ip = s.getsockname()[0]
-    finally:
-        s.close()
-    return ip
+        infos = socket.getaddrinfo(socket.gethostname(), None, socket.AF_INET)
+    except OSError:
+        infos = []
+    for *_, addr in infos:
+        if not addr[0].startswith('127.'):
+            return addr[0]
+    return '127.0.0.1'
 
-print("🧠 我的 IP 是：", get_local_ip())
 
-# 建立圖與流量 LP 求解
-G = nx.DiGraph()
+# 路網與需求（建圖本身放到背景求解時才做）
 edges = [
     ('S', 'A', {'capacity': 15, 'cost': 5}),
     ('S', 'C', {'capacity': 10, 'cost': 3}),
@@ -38,73 +87,477 @@ edges = [
     ('A', 'D', {'capacity': 5, 'cost': 3}),
     ('C', 'B', {'capacity': 5, 'cost': 2}),
 ]
-G.add_edges_from([(u, v, attr) for u, v, attr in edges])
-
 demands = {'H1': 8, 'H2': 7}
-commodities = list(demands.keys())
-edges = list(G.edges())
-nodes = list(G.nodes())
-
-flow_vars = {
-    (k, u, v): cp.Variable(nonneg=True)
-    for k in commodities for (u, v) in edges
-}
-
-constraints = []
-for (u, v) in edges:
-    total_flow = cp.sum([flow_vars[k, u, v] for k in commodities])
-    constraints.append(total_flow <= G[u][v]['capacity'])
-
-for k in commodities:
-    for n in nodes:
-        inflow = cp.sum([flow_vars[k, u, n] for (u, v) in edges if v == n])
-        outflow = cp.sum([flow_vars[k, n, v] for (u, v) in edges if u == n])
-        if n == 'S':
-            constraints.append(outflow - inflow == demands[k])
-        elif n == k:
-            constraints.append(inflow - outflow == demands[k])
+
+# 背景求解完成前 model / snapshot 都是 None，worker 看到 None 就回 pending
+model = None
+snapshot = None
+startup_error = None
+model_lock = threading.Lock()
+PENDING = {'status': 'pending', 'error': '配置計算中，請稍後再試（allocation pending）'}
+
+ACCEPT, PARSE, LOOKUP, SEND = (metrics.STAGE.labels(stage) for stage in ('accept', 'parse', 'lookup', 'send'))
+SHED = {reason: metrics.SHED.labels(reason)
+        for reason in ('max_connections', 'per_ip_connections', 'queue_full', 'per_ip_queue', 'rate_limited')}
+
+
+# 每戶的實際送達量與路徑都從 LP 的邊流量拆出來，不再直接回傳需求量；呼叫端要拿著 model_lock
+def build_snapshot():
+    t0 = time.perf_counter()
+    allocation = flow_decomposition.allocation_from_flows(model.flows(), model.commodities, source='S')
+    built = allocation_snapshot.Snapshot(allocation, version=current_version() + 1)
+    metrics.SNAPSHOT_BUILD.observe(time.perf_counter() - t0)
+    return built
+
+
+def current_version():
+    current = snapshot
+    return current.version if current is not None else 0
+
+
+def reply(obj, version):
+    return protocol.encode({'version': version, **obj})
+
+
+# 背景執行緒：載入求解器、建模、首次求解（先查共用的磁碟快取）；模型常駐記憶體，之後需求/容量改變只更新 Parameter 再重解
+def solve_in_background():
+    global model, snapshot, startup_error
+    print("🧠 我的 IP 是：", get_local_ip())
+    t0 = time.perf_counter()
+    try:
+        import networkx as nx
+        from allocation_model import AllocationModel
+        from solution_cache import SolutionCache
+        imported = time.perf_counter()
+        G = nx.DiGraph()
+        G.add_edges_from([(u, v, attr) for u, v, attr in edges])
+        with model_lock:
+            model = AllocationModel(G, demands, source='S', cache=SolutionCache())
+            metrics.LP_BUILD.observe(model.build_time)
+            stats = model.solve()
+            metrics.LP_SOLVE.labels('initial', str(stats['cache'])).observe(stats['total_time'])
+            snapshot = build_snapshot()
+    except Exception as e:
+        startup_error = f'配置計算失敗：{e}'
+        print(f"[Server] {startup_error}")
+        return
+    print(f"[Server] 載入求解器 {(imported - t0)*1000:.0f} ms，LP 建模 {model.build_time*1000:.1f} ms，"
+          f"首次求解 {stats['total_time']*1000:.1f} ms（快取 {stats['cache']}），啟動後 {(time.perf_counter() - STARTED)*1000:.0f} ms 可查詢")
+
+
+# 套用更新並重解；新快照建好才換掉 snapshot 參考，讀取的執行緒不會看到一半的結果
+def apply_update(update):
+    global snapshot
+    capacities = {(u, v): c for u, v, c in update.get('capacities', [])}
+    with model_lock:
+        stats = model.update(demands=update.get('demands'), capacities=capacities)
+        metrics.LP_SOLVE.labels('update', str(stats['cache'])).observe(stats['total_time'])
+        if stats['status'] == 'optimal':
+            snapshot = build_snapshot()
+    print(f"[Server] 重解完成：{stats['status']}，耗時 {stats['total_time']*1000:.1f} ms")
+    return reply({
+        'status': stats['status'],
+        'objective': stats['objective'],
+        'resolve_ms': round(stats['total_time'] * 1000, 3),
+    }, current_version())
+
+
+# 依請求內容產生回覆（已經編好的 JSON bytes）；整個請求只讀一次 snapshot
+def respond(data):
+    current = snapshot
+    version = current.version if current is not None else 0
+    if not isinstance(data, dict):
+        metrics.REQUESTS.labels('invalid').inc()
+        metrics.ERRORS.labels('bad_request').inc()
+        return reply({'error': '請求格式錯誤'}, version)
+    name = data.get("name")
+    if current is None:
+        # 背景求解還沒完成（或失敗）：先回覆狀態，不讓 client 卡在連線上
+        metrics.ERRORS.labels('pending').inc()
+        return reply({'error': startup_error} if startup_error else PENDING, version)
+    if "update" in data:
+        metrics.REQUESTS.labels('update').inc()
+        if not protocol.valid_update(data["update"]):
+            metrics.ERRORS.labels('bad_request').inc()
+            return reply({'error': '請求格式錯誤'}, version)
+        try:
+            return apply_update(data["update"])
+        except (KeyError, ValueError, TypeError) as e:
+            metrics.ERRORS.labels('update_failed').inc()
+            return reply({'error': f'更新失敗：{e}'}, current_version())
+    metrics.REQUESTS.labels('name').inc()
+    result = current.get(name) if isinstance(name, str) else None
+    if result is not None:
+        if VERBOSE:
+            print(f"[Server] 已送出 {current.allocation[name]['resource']} 單位資源給 {name}（版本 {version}）")
+        return result
+    if VERBOSE:
+        print(f"[Server] 無法識別災戶：{name}")
+    metrics.ERRORS.labels('unknown_household').inc()
+    return reply({'error': '未知災戶'}, version)
+
+
+def busy(body):
+    return allocation_snapshot.stamp(body, current_version())
+
+
+# 主執行緒與 worker 共用：等 worker 的連線（有界）、worker 處理完交回主執行緒的連線、叫醒主執行緒的 socket
+selector = selectors.DefaultSelector()
+work = queue.Queue(QUEUE_SIZE)
+finished = collections.deque()
+wake_r, wake_w = socket.socketpair()
+wake_r.setblocking(False)
+wake_w.setblocking(False)
+clients = set()   # 所有開著的連線（只有主執行緒會改）
+in_flight = {}    # ip -> 在佇列或 worker 手上的連線數（只有主執行緒會改）
+limiter = admission.IPLimiter(PER_IP_CONNECTIONS, PER_IP_RATE, PER_IP_BURST)
+
+
+# 一條連線的狀態：不是在 selector 裡等資料 / 等可寫，就是在某個 worker 手上，不會同時兩邊
+class Client:
+    def __init__(self, conn, addr, accepted):
+        self.conn = conn
+        self.addr = addr
+        self.ip = addr[0]
+        self.accepted = accepted          # accept() 回傳的時間（accept 階段指標）
+        self.buf = bytearray()            # 收到了、但還不成一個完整請求的資料
+        self.legacy = None                # 看到第一個 byte 才知道：True = 舊協定（一問一答後關閉）
+        self.started = time.monotonic()   # 讀取期限從這裡算（連上的時間、或送到一半的請求的第一個 byte）；None = 沒有送到一半的請求
+        self.last = self.started          # 上次收到資料的時間（閒置逾時）
+        self.waiting = False              # 在 selector 裡等資料或等可寫
+        self.out = bytearray()            # 還沒送進 kernel 的回覆
+        self.sending = None               # out 開始積著送不出去的時間（寫出逾時）；None = 沒有積著
+        self.closing = False              # out 送完就關閉（舊協定、或 client 已經關閉寫入端）
+
+
+# 處理一條連線上已經收到的資料：回覆每一個完整的請求，回傳這條連線要不要留著
+# shed 是主執行緒不交給 worker 時的原因（'queue_full' / 'per_ip_queue'）：請求一樣讀掉（框架才不會對不上），但一律回忙碌中
+def serve_ready(client, shed=None):
+    conn = client.conn
+    try:
+        data = conn.recv(65536)
+    except (BlockingIOError, InterruptedError):
+        return True
+    except OSError:
+        metrics.ERRORS.labels('connection').inc()
+        return False
+    now = time.monotonic()
+    client.last = now
+    if client.legacy is None:
+        if not data:
+            return False
+        ACCEPT.observe(time.perf_counter() - client.accepted)
+        client.legacy = data[:1] == protocol.LEGACY_FIRST_BYTE
+        if not client.legacy:
+            # 回覆都很小，關掉 Nagle，不然 pipelining 時會跟 client 的 delayed ACK 互等
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    if data and client.started is None:
+        client.started = now
+    client.buf += data
+    try:
+        if client.legacy:
+            return serve_legacy(client, not data, shed)
+        return serve_framed(client, not data, shed)
+    except OSError as e:
+        metrics.ERRORS.labels('connection').inc()
+        if VERBOSE:
+            print(f"[Server] 連線中斷 {client.addr}：{e}")
+    return False
+
+
+# 舊協定：收到完整的 JSON（或 client 關閉寫入端）就回覆，然後關閉連線
+def serve_legacy(client, eof, shed):
+    try:
+        json.loads(client.buf)
+    except ValueError:
+        if not eof and len(client.buf) <= MAX_REQUEST:
+            return True
+    t0 = time.perf_counter()
+    send(client, handle(client, client.buf, shed))
+    SEND.observe(time.perf_counter() - t0)
+    return False
+
+
+# 長度前綴框架：目前收到的每個完整請求都回覆（pipelining 時一次可能好幾個），回覆一起寫出
+def serve_framed(client, eof, shed):
+    buf = client.buf
+    replies = []
+    keep = not eof
+    while len(buf) >= protocol.HEADER.size:
+        (length,) = protocol.HEADER.unpack_from(buf)
+        if length > MAX_REQUEST:
+            # 後面的資料已經對不上框架：回覆錯誤後關閉
+            metrics.ERRORS.labels('too_large').inc()
+            replies.append(protocol.frame(reply({'error': '請求太大'}, current_version())))
+            keep = False
+            break
+        end = protocol.HEADER.size + length
+        if len(buf) < end:
+            break
+        payload = bytes(buf[protocol.HEADER.size:end])
+        del buf[:end]
+        replies.append(protocol.frame(handle(client, payload, shed)))
+    if replies:
+        client.started = time.monotonic() if buf else None
+        t0 = time.perf_counter()
+        send(client, b''.join(replies))
+        SEND.observe(time.perf_counter() - t0)
+    return keep
+
+
+# 一個請求：先看這個 IP 的請求頻率，再 parse → lookup（產生回覆）
+def handle(client, payload, shed):
+    if shed:
+        SHED[shed].inc()
+        return busy(admission.BUSY)
+    if not limiter.allow(client.ip):
+        SHED['rate_limited'].inc()
+        return busy(admission.RATE_LIMITED)
+    t0 = time.perf_counter()
+    try:
+        data = json.loads(payload)
+    except ValueError:
+        data = None
+    t1 = time.perf_counter()
+    PARSE.observe(t1 - t0)
+    result = respond(data)
+    LOOKUP.observe(time.perf_counter() - t1)
+    return result
+
+
+# 不等 client 收：能送進 kernel 的先送，其餘留在 client.out，由主執行緒等 socket 可寫再送
+def send(client, data):
+    client.out += data
+    flush(client)
+
+
+def flush(client):
+    while client.out:
+        try:
+            sent = client.conn.send(client.out)
+        except (BlockingIOError, InterruptedError):
+            break
+        del client.out[:sent]
+    if not client.out:
+        client.sending = None
+    elif client.sending is None:
+        client.sending = time.monotonic()
+
+
+def worker():
+    while True:
+        client = work.get()
+        try:
+            keep = serve_ready(client)
+        except Exception as e:
+            print(f"[Server] 發生錯誤：{e}")
+            keep = False
+        finished.append((client, keep))
+        try:
+            wake_w.send(b'\0')
+        except OSError:
+            pass   # 叫醒用的 socket 已經塞滿：主執行緒本來就會醒來
+
+
+def wait_for_data(client):
+    client.waiting = True
+    selector.register(client.conn, selectors.EVENT_READ, client)
+
+
+def wait_to_send(client):
+    client.waiting = True
+    selector.register(client.conn, selectors.EVENT_WRITE, client)
+
+
+# worker（或主執行緒）處理完：回覆沒送完就先等可寫，送完再決定留著或關閉
+def park(client, keep):
+    if client.out:
+        client.closing = not keep
+        wait_to_send(client)
+    elif keep:
+        wait_for_data(client)
+    else:
+        close(client)
+
+
+def close(client):
+    if client.waiting:
+        selector.unregister(client.conn)
+        client.waiting = False
+    clients.discard(client)
+    limiter.disconnect(client.ip)
+    client.conn.close()
+    if VERBOSE:
+        print(f"[Server] 連線結束：{client.addr}")
+
+
+# 連線數超過上限：不加框架直接送忙碌中（舊 client 本來就讀 JSON，新 client 看第一個 byte 就知道），然後關閉
+def reject(conn, reason, body):
+    metrics.REJECTED.inc()
+    SHED[reason].inc()
+    conn.setblocking(False)
+    try:
+        conn.send(busy(body))
+    except OSError:
+        pass
+    try:
+        conn.recv(65536)   # 先讀掉已經送到的請求，不然 close() 會送 RST，client 可能還沒讀到回覆就被重置
+    except OSError:
+        pass
+    conn.close()
+
+
+def accept_ready(s):
+    for _ in range(ACCEPT_BATCH):
+        try:
+            conn, addr = s.accept()
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError as e:
+            # 例如 file descriptor 用完：連線先留在 backlog，等有連線關閉再收
+            print(f"[Server] accept 失敗：{e}")
+            return
+        metrics.CONNECTIONS.inc()
+        if len(clients) >= MAX_CONNECTIONS:
+            reject(conn, 'max_connections', admission.BUSY)
+        elif not limiter.connect(addr[0]):
+            reject(conn, 'per_ip_connections', admission.TOO_MANY_FROM_IP)
         else:
-            constraints.append(inflow == outflow)
+            conn.setblocking(False)
+            client = Client(conn, addr, time.perf_counter())
+            clients.add(client)
+            wait_for_data(client)
+            if VERBOSE:
+                print(f"[Server] 已連線：{addr}")
 
-objective = cp.Minimize(cp.sum([
-    G[u][v]['cost'] * flow_vars[k, u, v]
-    for (k, u, v) in flow_vars
-]))
-prob = cp.Problem(objective, constraints)
-prob.solve()
 
-allocation = {k: demands[k] for k in demands}
+# 有資料可讀：交給 worker；佇列滿了、或這個 IP 已經佔了 PER_IP_WORKERS 個位置，
+# 就在主執行緒直接回忙碌中（不 parse、不查快照，很便宜）
+def dispatch(client):
+    selector.unregister(client.conn)
+    client.waiting = False
+    shed = 'per_ip_queue'
+    if in_flight.get(client.ip, 0) < PER_IP_WORKERS:
+        try:
+            work.put_nowait(client)
+            in_flight[client.ip] = in_flight.get(client.ip, 0) + 1
+            return
+        except queue.Full:
+            shed = 'queue_full'
+    park(client, serve_ready(client, shed=shed))
 
 
-# 處理每個 client 的執行緒
-def handle_client(conn, addr):
-    print(f"[Server] 已連線：{addr}")
+# 可寫：把積著的回覆送出去，送完就回去等下一個請求（或關閉）
+def write_ready(client):
     try:
-        msg = conn.recv(1024).decode()
-        data = json.loads(msg)
-        name = data.get("name")
+        flush(client)
+    except OSError:
+        metrics.ERRORS.labels('connection').inc()
+        close(client)
+        return
+    if client.out:
+        return
+    selector.unregister(client.conn)
+    client.waiting = False
+    if client.closing:
+        close(client)
+    else:
+        wait_for_data(client)
+
 
-        if name in allocation:
-            response = {'resource': allocation[name]}
-            print(f"[Server] 已送出 {allocation[name]} 單位資源給 {name}")
+# worker 處理完的連線：還要用的放回 selector 等下一個請求（回覆沒送完的先等可寫），其他的關閉
+def finish():
+    try:
+        wake_r.recv(4096)
+    except OSError:
+        pass
+    while finished:
+        client, keep = finished.popleft()
+        count = in_flight.pop(client.ip) - 1
+        if count:
+            in_flight[client.ip] = count
+        park(client, keep)
+
+
+# 寫出逾時 / 讀取期限 / 閒置逾時：只看在 selector 裡的連線（worker 手上的正在處理）
+def sweep(now):
+    for client in [c for c in clients if c.waiting]:
+        if client.out:
+            expired = now - client.sending > WRITE_TIMEOUT
+        elif client.started is not None:
+            expired = now - client.started > READ_DEADLINE
         else:
-            response = {'error': '未知災戶'}
-            print(f"[Server] 無法識別災戶：{name}")
+            expired = now - client.last > IDLE_TIMEOUT
+        if expired:
+            metrics.ERRORS.labels('timeout').inc()
+            close(client)
+    limiter.prune(now)
 
-        conn.sendall(json.dumps(response).encode())
-    except Exception as e:
-        print(f"[Server] 發生錯誤：{e}")
-    finally:
-        conn.close()
+
+def serve_forever(s):
+    s.setblocking(False)
+    selector.register(s, selectors.EVENT_READ)
+    selector.register(wake_r, selectors.EVENT_READ)
+    for i in range(WORKERS):
+        threading.Thread(target=worker, name=f'worker-{i}', daemon=True).start()
+    next_sweep = time.monotonic() + SWEEP_INTERVAL
+    while True:
+        for key, events in selector.select(SWEEP_INTERVAL):
+            if key.fileobj is s:
+                accept_ready(s)
+            elif key.fileobj is wake_r:
+                finish()
+            elif events & selectors.EVENT_WRITE:
+                write_ready(key.data)
+            else:
+                dispatch(key.data)
+        now = time.monotonic()
+        if now >= next_sweep:
+            sweep(now)
+            next_sweep = now + SWEEP_INTERVAL
+
+
+# 每條連線一個 file descriptor：軟上限拉到硬上限，最多 MAX_FDS（Windows 沒有 resource 模組，不調整）
+# 硬上限是 RLIM_INFINITY 時不能照抄（macOS 會丟 ValueError）；系統不讓調就維持原本的上限
+MAX_FDS = 1 << 20
+
+
+def fd_limit():
+    try:
+        import resource
+    except ImportError:
+        return None
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    target = MAX_FDS if hard == resource.RLIM_INFINITY else min(hard, MAX_FDS)
+    if soft != resource.RLIM_INFINITY and soft < target:
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+        except (ValueError, OSError) as e:
+            print(f"⚠️ 無法調高 file descriptor 上限：{e}")
+    return resource.getrlimit(resource.RLIMIT_NOFILE)[0]
 
 
 # 啟動多 client server
 with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+    s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
     s.bind((HOST, PORT))
-    s.listen()
-    print("[Server] 指揮中心啟動，等待災戶連線...")
-
-    while True:
-        conn, addr = s.accept()
-        thread = threading.Thread(target=handle_client, args=(conn, addr), daemon=True)
-        thread.start()
+    s.listen(BACKLOG)
+    fds = fd_limit()
+    if fds is not None and fds < MAX_CONNECTIONS + 64:
+        MAX_CONNECTIONS = fds - 64
+        print(f"⚠️ file descriptor 上限只有 {fds}，同時連線數上限降為 {MAX_CONNECTIONS}")
+    print(f"[Server] 指揮中心啟動（{(time.perf_counter() - STARTED)*1000:.0f} ms），"
+          f"{WORKERS} 個 worker、最多 {MAX_CONNECTIONS} 條連線，等待災戶連線...")
+    # 指標 port 被占用時只印警告，不影響指揮中心本身
+    if METRICS_PORT:
+        try:
+            metrics.serve(METRICS_PORT)
+            print(f"[Server] 執行期指標：http://{metrics.METRICS_HOST}:{METRICS_PORT}/metrics")
+        except OSError as e:
+            print(f"⚠️ 指標 port {METRICS_PORT} 無法使用：{e}")
+    metrics.SNAPSHOT_VERSION.fn = current_version
+    metrics.HOUSEHOLDS.fn = lambda: len(snapshot) if snapshot is not None else 0
+    metrics.CONNECTIONS_ACTIVE.fn = lambda: len(clients)
+    metrics.QUEUE_DEPTH.fn = work.qsize
+    threading.Thread(target=solve_in_background, daemon=True).start()
+    serve_forever(s)
@@ -0,0 +1,139 @@
+# 道路中斷 what-if 掃描：一次評估上百個「某些邊斷掉 / 容量打折」的情境
+# 基本 LP（含未送達量變數，所以斷路時仍然可行）只建一次，
+# 透過 process pool 的 initializer 傳給每個 worker；每個情境只改容量上限 b_ub 再重解。
+# 結果依完成順序邊算邊寫進 CSV（一行一個情境，第一欄是情境 id），可以中途中斷、也可以拿去畫圖。
+#
+# 範例：
+#   python scenario_sweep.py --scenarios 200 --failures 3 --workers 8 --out sweep.csv
+#   python scenario_sweep.py --graph roads.csv --demands demands.json --scenario-file scenarios.json
+import argparse
+import csv
+import json
+import os
+import time
+from multiprocessing import Pool
+import numpy as np
+from scipy.optimize import linprog
+import lp_sparse
+
+# worker 端共用的基本模型（由 _init_worker 設定，每個行程只收一次）
+_BASE = None
+
+
+# 建立基本模型：回傳可以直接 pickle 給 worker 的 dict
+def build_base(G, demands, source='S'):
+    nodes, index, edges, tails, heads, capacity, cost = lp_sparse.edge_arrays(G)
+    commodities = list(demands.keys())
+    sinks = np.array([index[k] for k in commodities], dtype=np.int64)
+    amounts = np.array([demands[k] for k in commodities], dtype=np.float64)
+    c, A_eq, b_eq, A_ub, b_ub = lp_sparse.build_sparse_lp(
+        len(nodes), tails, heads, capacity, cost, index[source], sinks, amounts,
+        unmet_penalty=lp_sparse.default_unmet_penalty(cost))
+    return {
+        'c': c, 'A_eq': A_eq, 'b_eq': b_eq, 'A_ub': A_ub, 'b_ub': b_ub,
+        'n_flow_vars': len(commodities) * len(edges),
+        'penalty': lp_sparse.default_unmet_penalty(cost),
+        'edge_index': {e: i for i, e in enumerate(edges)},
+    }
+
+
+def _init_worker(base):
+    global _BASE
+    _BASE = base
+
+
+# 解一個情境：changes = [(邊索引, 容量倍率), ...]，倍率 0 代表道路中斷
+def solve_scenario(base, scenario_id, changes):
+    t0 = time.perf_counter()
+    b_ub = base['b_ub'].copy()
+    for e, factor in changes:
+        b_ub[e] *= factor
+    res = linprog(base['c'], A_ub=base['A_ub'], b_ub=b_ub, A_eq=base['A_eq'], b_eq=base['b_eq'],
+                  bounds=(0, None), method='highs')
+    if res.status != 0:
+        return scenario_id, 'failed', None, None, 0, time.perf_counter() - t0
+    unmet = res.x[base['n_flow_vars']:]
+    # 目標值扣掉懲罰項才是真正的運送成本
+    cost = float(res.fun - base['penalty'] * unmet.sum())
+    return (scenario_id, 'optimal', cost, float(unmet.sum()),
+            int(np.count_nonzero(unmet > 1e-6)), time.perf_counter() - t0)
+
+
+def _run(task):
+    return solve_scenario(_BASE, *task)
+
+
+# 隨機情境：每個情境挑 n_failures 條邊，乘上 factor（0 = 完全中斷）
+def random_scenarios(n_edges, n_scenarios, n_failures, factor=0.0, seed=0):
+    rng = np.random.default_rng(seed)
+    return [
+        (i, [(int(e), factor) for e in rng.choice(n_edges, size=min(n_failures, n_edges), replace=False)])
+        for i in range(n_scenarios)
+    ]
+
+
+# 情境檔：[{"id": ..., "edges": [["A", "B", 0.0], ...]}, ...]
+def load_scenarios(path, edge_index):
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    return [
+        (item.get('id', i), [(edge_index[(u, v)], factor) for u, v, factor in item['edges']])
+        for i, item in enumerate(data)
+    ]
+
+
+# 平行掃描，結果一完成就寫進 CSV（imap_unordered：慢的情境不會擋住後面已經算完的）；回傳 (情境數, 總耗時)
+def sweep(base, scenarios, out_path, workers=None, chunksize=4):
+    t0 = time.perf_counter()
+    with open(out_path, 'w', newline='') as f, \
+            Pool(processes=workers, initializer=_init_worker, initargs=(base,)) as pool:
+        writer = csv.writer(f)
+        writer.writerow(['scenario', 'status', 'cost', 'unmet', 'unmet_households', 'solve_s'])
+        for row in pool.imap_unordered(_run, scenarios, chunksize=chunksize):
+            writer.writerow(row)
+            f.flush()
+    return len(scenarios), time.perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='道路中斷情境掃描')
+    parser.add_argument('--graph', help='路網檔（csv / json / jsonl / edge list），不給就用合成路網')
+    parser.add_argument('--demands', help='需求 JSON：{"H1": 8, ...}')
+    parser.add_argument('--source', default='S')
+    parser.add_argument('--topology', default='grid')
+    parser.add_argument('--n-nodes', type=int, default=400)
+    parser.add_argument('--shelters', type=int, default=20)
+    parser.add_argument('--scenario-file', help='情境 JSON，不給就隨機產生')
+    parser.add_argument('--scenarios', type=int, default=100)
+    parser.add_argument('--failures', type=int, default=3)
+    parser.add_argument('--factor', type=float, default=0.0, help='受影響道路的容量倍率（0 = 中斷）')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--out', default='sweep_results.csv')
+    args = parser.parse_args()
+
+    if args.graph:
+        from csr_graph import load_edges
+        G = load_edges(args.graph)
+        with open(args.demands, encoding='utf-8') as f:
+            demands = json.load(f)
+        source = args.source
+    else:
+        import network_generator
+        G, demands = network_generator.generate(args.topology, n_nodes=args.n_nodes,
+                                                n_shelters=args.shelters, seed=args.seed)
+        source = network_generator.SOURCE
+
+    t0 = time.perf_counter()
+    base = build_base(G, demands, source)
+    print(f"基本模型建立：{time.perf_counter() - t0:.2f} s，{base['A_eq'].shape[1]} 個變數")
+    if args.scenario_file:
+        scenarios = load_scenarios(args.scenario_file, base['edge_index'])
+    else:
+        scenarios = random_scenarios(len(base['b_ub']), args.scenarios, args.failures, args.factor, args.seed)
+    n, elapsed = sweep(base, scenarios, args.out, args.workers)
+    print(f"{n} 個情境，{args.workers} 個 worker：{elapsed:.2f} s（{n / elapsed:.1f} 情境/秒），結果寫入 {args.out}")
+
+
+if __name__ == '__main__':
+    main()
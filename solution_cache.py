@@ -0,0 +1,204 @@
+# 解的磁碟快取：路網 + 需求沒變就不用重解
+# key 是節點、邊、容量、成本、來源與需求的 SHA-256（內容定址），
+# 另外用「結構 key」（只看節點/邊/成本/災戶名稱，不看容量與需求值）記住同一張圖最近一次的解，
+# 完整 key 沒命中時，用對偶價格（still_optimal）驗證這個舊解在新的容量下還是最佳解，是的話就不必重解；
+# 驗證不過就照常重解（lp_sparse 的 HiGHS 不吃起始解，舊解不會拿來當起點）。
+#
+# 每筆存成一個 .npz：x（依災戶分塊的邊流量，跟 lp_sparse 的 x[k*E + e] 一樣）、
+# capacity_price（每條邊容量限制的對偶價格，>= 0）、potential（每個災戶 x 節點的對偶位勢）、
+# objective 與當時的 capacity / amounts。
+# 多個 server 行程共用同一個資料夾：寫入先寫暫存檔再 os.replace（原子操作），
+# 讀到一半被別的行程淘汰掉就當作沒命中；總大小超過上限時依最後使用時間（mtime）淘汰，
+# 指向已淘汰解的 .latest 與寫到一半就中斷的暫存檔也一起清掉。
+import hashlib
+import os
+import tempfile
+import time
+import numpy as np
+
+DEFAULT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.solution_cache')
+TOL = 1e-6
+STALE_TMP = 3600   # 暫存檔超過這麼多秒還在，就是寫入的行程中斷了，可以刪
+
+
+def _hash_arrays(h, *arrays):
+    for a in arrays:
+        a = np.ascontiguousarray(a)
+        h.update(str(a.dtype).encode())
+        h.update(str(a.shape).encode())
+        h.update(a.tobytes())
+
+
+def _graph_hash(nodes, tails, heads, cost):
+    h = hashlib.sha256()
+    h.update('\x00'.join(map(str, nodes)).encode())
+    _hash_arrays(h, np.asarray(tails, dtype=np.int64), np.asarray(heads, dtype=np.int64),
+                 np.asarray(cost, dtype=np.float64))
+    return h
+
+
+# 只看路網本身（節點、邊，有給的話再加成本）的 key：landmarks.py 的前處理、render.py 的版面快取用
+def structure_key(nodes, tails, heads, cost=()):
+    return _graph_hash(nodes, tails, heads, cost).hexdigest()
+
+
+# 回傳 (完整 key, 結構 key)；陣列一律轉成固定 dtype，nx.DiGraph 與 CSRGraph 算出來的 key 一樣
+def fingerprint(nodes, tails, heads, capacity, cost, source, commodities, amounts):
+    structure = _graph_hash(nodes, tails, heads, cost)
+    structure.update(b'\x01' + str(source).encode() + b'\x01')
+    structure.update('\x00'.join(map(str, commodities)).encode())
+    full = structure.copy()
+    _hash_arrays(full, np.asarray(capacity, dtype=np.float64), np.asarray(amounts, dtype=np.float64))
+    return full.hexdigest(), structure.hexdigest()
+
+
+# 舊解在新的容量 / 需求下是否仍是最佳解：
+# 需求一樣（流量守恆不變）、舊解沒有超過新容量，且有對偶價格的邊仍然滿載（互補鬆弛），
+# 對偶可行性只跟成本有關，所以成立時舊解 + 舊對偶價格就是新問題的最佳性證明，不必重解
+def still_optimal(entry, capacity, amounts, tol=TOL):
+    if entry['amounts'].shape != np.shape(amounts) or not np.allclose(entry['amounts'], amounts, atol=tol):
+        return False
+    capacity = np.asarray(capacity, dtype=np.float64)
+    if entry['capacity'].shape != capacity.shape:
+        return False
+    load = entry['x'].reshape(len(amounts), len(capacity)).sum(axis=0)
+    if np.any(load > capacity + tol):
+        return False
+    priced = entry['capacity_price'] > tol
+    return bool(np.all(load[priced] >= capacity[priced] - tol))
+
+
+class SolutionCache:
+    def __init__(self, directory=DEFAULT_DIR, max_bytes=256 * 2**20):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key, suffix='.npz'):
+        return os.path.join(self.directory, key + suffix)
+
+    # 命中時回傳 dict（並更新 mtime 當作最近使用），沒有或檔案壞掉 / 正被淘汰就回傳 None
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with np.load(path) as data:
+                entry = {name: data[name] for name in data.files}
+            os.utime(path)
+        except (OSError, ValueError, KeyError):
+            return None
+        entry['objective'] = float(entry['objective'])
+        return entry
+
+    # 同一張圖最近一次存進來的解（給 still_optimal 驗證用）
+    def latest(self, structure_key):
+        try:
+            with open(self._path(structure_key, '.latest'), encoding='ascii') as f:
+                key = f.read().strip()
+        except OSError:
+            return None
+        return self.get(key)
+
+    # 先寫暫存檔再 os.replace：其他行程只會看到完整的舊檔或新檔
+    def _atomic_write(self, path, write):
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                write(f)
+            os.replace(tmp, path)
+        except BaseException:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            raise
+
+    def put(self, key, structure_key, x, capacity_price, potential, objective, capacity, amounts):
+        self._atomic_write(self._path(key), lambda f: np.savez(
+            f, x=np.asarray(x, dtype=np.float64), capacity_price=np.asarray(capacity_price, dtype=np.float64),
+            potential=np.asarray(potential, dtype=np.float64), objective=np.float64(objective),
+            capacity=np.asarray(capacity, dtype=np.float64), amounts=np.asarray(amounts, dtype=np.float64)))
+        self._atomic_write(self._path(structure_key, '.latest'), lambda f: f.write(key.encode('ascii')))
+        self.evict()
+
+    # 超過上限就從最久沒用的開始刪；別的行程同時在刪也沒關係（FileNotFoundError 直接略過）
+    # 回傳刪掉的解的筆數
+    def evict(self):
+        entries, pointers, stale = [], [], []
+        now = time.time()
+        for name in os.listdir(self.directory):
+            try:
+                st = os.stat(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                continue
+            if name.endswith('.npz'):
+                entries.append((st.st_mtime, st.st_size, name))
+            elif name.endswith('.latest'):
+                pointers.append(name)
+            elif name.endswith('.tmp') and now - st.st_mtime > STALE_TMP:
+                stale.append(name)
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            self._unlink(name)
+            removed += 1
+            total -= size
+        # 有解被淘汰時才檢查 .latest（每次 put 都會呼叫 evict，大部分時候什麼都沒刪）
+        for name in pointers if removed else ():
+            try:
+                with open(os.path.join(self.directory, name), encoding='ascii') as f:
+                    key = f.read().strip()
+            except (OSError, ValueError):
+                continue
+            if not os.path.exists(self._path(key)):
+                self._unlink(name)
+        for name in stale:
+            self._unlink(name)
+        return removed
+
+    def _unlink(self, name):
+        try:
+            os.unlink(os.path.join(self.directory, name))
+        except FileNotFoundError:
+            pass
+
+    def size(self):
+        total = 0
+        for name in os.listdir(self.directory):
+            try:
+                total += os.path.getsize(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+        return total
+
+
+if __name__ == '__main__':
+    import shutil
+    import lp_sparse
+    import network_generator
+
+    directory = tempfile.mkdtemp(prefix='solution_cache_')
+    cache = SolutionCache(directory)
+    graph, demands = network_generator.generate('grid', n_nodes=900, n_shelters=30, seed=0)
+    source = network_generator.SOURCE
+
+    for label in ('第一次（未命中）', '第二次（命中）'):
+        t0 = time.perf_counter()
+        result = lp_sparse.solve_sparse(graph, demands, source=source, cache=cache)
+        print(f"{label}：{result['cache']}，{(time.perf_counter() - t0)*1000:.1f} ms，目標值 {result['objective']:.1f}")
+
+    # 把一條沒滿載的邊容量調高一點：需求沒變，用對偶價格驗證舊解仍是最佳解
+    edge_index = {edge: i for i, edge in enumerate(graph.edge_list())}
+    loads = np.zeros(graph.n_edges)
+    for (k, u, v), f in result['flows'].items():
+        loads[edge_index[(u, v)]] += f
+    capacity = graph.capacity.copy()
+    e = int(np.argmax(capacity - loads))
+    capacity[e] += 5
+    nearby = type(graph)(graph.names, graph.offsets, graph.targets, capacity, graph.cost)
+    t0 = time.perf_counter()
+    reused = lp_sparse.solve_sparse(nearby, demands, source=source, cache=cache)
+    print(f"容量微調：{reused['cache']}，{(time.perf_counter() - t0)*1000:.1f} ms，目標值 {reused['objective']:.1f}")
+    print(f"快取大小 {cache.size() / 1024:.0f} KiB")
+    shutil.rmtree(directory)